@@ -6,8 +6,10 @@ import subprocess
 import sys
 from pathlib import Path
 import numpy as np
-import pretty_midi
 import soundfile as sf
+from src.config import Config
+from src.notes import load_notes
+from src.reverb import apply_reverb_file
 
 def run_command(cmd, cwd=None):
     """Выполняет команду"""
@@ -23,35 +25,27 @@ def create_realistic_piano_audio(midi_path, output_path, sample_rate=44100):
     
     print("🎹 Создание реалистичного звука пианино...")
     
-    # Загружаем MIDI файл
-    midi = pretty_midi.PrettyMIDI(str(midi_path))
-    
-    # Получаем длительность
-    duration = midi.get_end_time()
+    # Загружаем ноты всех инструментов (из файла-спутника, если он есть) и длительность
+    notes, midi_meta = load_notes(midi_path, include_drums=True)
+    duration = midi_meta['end_time']
     total_samples = int(duration * sample_rate)
     
     # Создаем аудио массив
     audio = np.zeros(total_samples, dtype=np.float32)
     
-    # Обрабатываем каждую ноту
-    for instrument in midi.instruments:
-        for note in instrument.notes:
-            # Конвертируем MIDI ноту в частоту
-            frequency = 440.0 * (2 ** ((note.pitch - 69) / 12.0))
-            
-            # Вычисляем длительность ноты
-            note_duration = note.end - note.start
-            
-            # Создаем реалистичный тон пианино
-            tone = create_realistic_piano_tone(frequency, note_duration, sample_rate)
-            
-            # Вычисляем позицию в аудио массиве
-            start_sample = int(note.start * sample_rate)
-            end_sample = start_sample + len(tone)
-            
-            # Добавляем тон к аудио
-            if end_sample <= len(audio):
-                audio[start_sample:end_sample] += tone * (note.velocity / 127.0)
+    # Обрабатываем каждую ноту (все инструменты)
+    # Конвертируем MIDI ноты в частоты, вычисляем длительности и позиции в аудио массиве
+    frequencies = 440.0 * (2 ** ((notes.pitch - 69) / 12.0))
+    start_samples = (notes.start * sample_rate).astype(np.int64)
+    for frequency, note_duration, start_sample, velocity in zip(
+            frequencies.tolist(), notes.duration.tolist(), start_samples.tolist(), notes.velocity.tolist()):
+        # Создаем реалистичный тон пианино
+        tone = create_realistic_piano_tone(frequency, note_duration, sample_rate)
+        end_sample = start_sample + len(tone)
+        
+        # Добавляем тон к аудио
+        if end_sample <= len(audio):
+            audio[start_sample:end_sample] += tone * (velocity / 127.0)
     
     # Нормализуем аудио
     if np.max(np.abs(audio)) > 0:
@@ -230,14 +224,22 @@ def process_realistic_piano():
     
     # Шаг 2: Улучшение аудио с максимально реалистичными фильтрами
     print("🎵 Улучшение аудио...")
+    piano_reverb_path = "work/006_Dad_Donut/piano_realistic_reverb.wav"
     piano_enhanced_path = "work/006_Dad_Donut/piano_enhanced.wav"
     piano_final_path = "work/006_Dad_Donut/piano.wav"
     
+    # Сверточная реверберация камерного зала (вместо каскада aecho)
+    config = Config("configs/settings.yaml")
+    if not apply_reverb_file(piano_raw_path, piano_reverb_path, room="chamber", wet=0.3,
+                             cache_dir=config.get_path('cache_dir')):
+        print("❌ Ошибка реверберации")
+        return False
+    
     # Максимально реалистичная цепочка фильтров (без overdrive)
     cmd = [
         "./ffmpeg", "-y",
-        "-i", piano_raw_path,
-        "-af", "loudnorm=I=-18:LRA=12:TP=-2,acompressor=threshold=0.15:ratio=1.8:attack=5:release=50:makeup=2,equalizer=f=60:width_type=h:width=40:g=4,equalizer=f=120:width_type=h:width=80:g=3,equalizer=f=250:width_type=h:width=120:g=2.5,equalizer=f=500:width_type=h:width=200:g=2,equalizer=f=1000:width_type=h:width=400:g=1.5,equalizer=f=2000:width_type=h:width=600:g=1,equalizer=f=4000:width_type=h:width=800:g=0.8,equalizer=f=8000:width_type=h:width=1200:g=0.5,aecho=0.8:0.9:300:0.3,aecho=0.6:0.7:600:0.2,aecho=0.4:0.5:900:0.1,chorus=0.4:0.6:60:0.4:0.3:1.2,tremolo=f=5.5:d=0.08,loudnorm=I=-16:LRA=8:TP=-1.5",
+        "-i", piano_reverb_path,
+        "-af", "loudnorm=I=-18:LRA=12:TP=-2,acompressor=threshold=0.15:ratio=1.8:attack=5:release=50:makeup=2,equalizer=f=60:width_type=h:width=40:g=4,equalizer=f=120:width_type=h:width=80:g=3,equalizer=f=250:width_type=h:width=120:g=2.5,equalizer=f=500:width_type=h:width=200:g=2,equalizer=f=1000:width_type=h:width=400:g=1.5,equalizer=f=2000:width_type=h:width=600:g=1,equalizer=f=4000:width_type=h:width=800:g=0.8,equalizer=f=8000:width_type=h:width=1200:g=0.5,chorus=0.4:0.6:60:0.4:0.3:1.2,tremolo=f=5.5:d=0.08,loudnorm=I=-16:LRA=8:TP=-1.5",
         "-ar", "44100",
         "-ac", "2",
         "-b:a", "512k",
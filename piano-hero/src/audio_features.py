@@ -0,0 +1,399 @@
+"""
+Общий STFT-фронтенд для анализа аудио
+
+beat_track, onset_detect, piptrack и chroma_stft из librosa по отдельности
+считают каждый свой STFT (или огибающую onset'ов) по всему сигналу. Здесь
+спектрограмма амплитуд и мел-спектрограмма для огибающих onset'ов считаются
+один раз и передаются во все анализы; параметры совпадают с умолчаниями
+librosa, поэтому результаты те же, что и при отдельных вызовах.
+
+С включенным HPSS высота тона и хромаграмма считаются по гармонической
+части того же STFT (медианная фильтрация по времени против медианной
+фильтрации по частоте), onset'ы нот - по спектру без явно ударных бинов,
+а доли - по исходной смеси, где ударные помогают.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+import numpy as np
+import librosa
+
+
+def median_filter(x: np.ndarray, kernel_size: int, axis: int, block_size: int = 256) -> np.ndarray:
+    """
+    Скользящая медиана вдоль оси (края - зеркальное отражение, как в scipy.ndimage.median_filter)
+    
+    Медиана - np.partition по скользящим окнам; окна разворачиваются блоками
+    по block_size строк, чтобы не держать в памяти kernel_size копий массива.
+    
+    Args:
+        x: Двумерный массив
+        kernel_size: Длина окна (нечетная)
+        axis: Ось фильтрации
+        block_size: Строк (вдоль другой оси) в одном блоке
+    
+    Returns:
+        np.ndarray: Массив той же формы
+    """
+    rows = np.ascontiguousarray(np.moveaxis(x, axis, -1))
+    half = kernel_size // 2
+    padded = np.pad(rows, ((0, 0), (half, half)), mode='symmetric')
+    result = np.empty_like(rows)
+    for start in range(0, len(rows), block_size):
+        windows = np.lib.stride_tricks.sliding_window_view(padded[start:start + block_size], kernel_size, axis=1)
+        result[start:start + block_size] = np.partition(windows, half, axis=-1)[..., half]
+    return np.moveaxis(result, -1, axis)
+
+
+class AudioFeatures:
+    """Спектральные признаки одного сигнала с замером времени каждого этапа"""
+    
+    # Во сколько раз ударная медиана должна превышать гармоническую, чтобы бин не участвовал в onset'ах нот
+    HPSS_ONSET_MARGIN = 2.0
+    
+    def __init__(self, y: np.ndarray, sr: int, n_fft: int = 2048, hop_length: int = 512,
+                 hpss_kernel_size: int = 0, hpss_max_frequency: float = 5000.0,
+                 tuning: Optional[float] = None, logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            y: Моно аудио сигнал
+            sr: Частота дискретизации
+            n_fft: Размер окна STFT
+            hop_length: Шаг STFT
+            hpss_kernel_size: Длина медианных фильтров HPSS в кадрах и бинах (0 - без HPSS)
+            hpss_max_frequency: Верхняя граница разделения в Hz (выше - исходный спектр)
+            tuning: Отклонение строя для хромы в долях полутона (None - оценить по сигналу)
+            logger: Логгер для вывода информации
+        """
+        self.y = y
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        # Нечетная длина: центральный элемент окна - медиана
+        self.hpss_kernel_size = hpss_kernel_size | 1 if hpss_kernel_size > 0 else 0
+        self.hpss_max_frequency = hpss_max_frequency
+        self.logger = logger or logging.getLogger(__name__)
+        
+        # Время каждого этапа в секундах (в порядке выполнения)
+        self.timings: Dict[str, float] = {}
+        
+        self._magnitude = None
+        self._power = None
+        self._mel_db = None
+        self._hpss_medians = None
+        self._tonal_mel_db = None
+        self._harmonic_magnitude = None
+        self._harmonic_power = None
+        self._onset_envelopes: Dict[tuple, np.ndarray] = {}
+        self._pitch_tracks: Dict[float, Tuple[np.ndarray, np.ndarray]] = {}
+        self._cqts: Dict[tuple, np.ndarray] = {}
+        self._tuning = tuning
+    
+    @contextmanager
+    def timed(self, stage: str):
+        """Засекает время этапа и добавляет его в timings"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+    
+    @property
+    def magnitude(self) -> np.ndarray:
+        """Спектрограмма амплитуд |STFT| (1 + n_fft/2, кадры)"""
+        if self._magnitude is None:
+            with self.timed('stft'):
+                self._magnitude = np.abs(librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length))
+        return self._magnitude
+    
+    @property
+    def power(self) -> np.ndarray:
+        """Спектрограмма мощности |STFT|^2"""
+        if self._power is None:
+            magnitude = self.magnitude
+            with self.timed('stft'):
+                self._power = magnitude ** 2
+        return self._power
+    
+    @property
+    def mel_db(self) -> np.ndarray:
+        """Мел-спектрограмма в дБ (основа огибающих onset'ов)"""
+        if self._mel_db is None:
+            power = self.power
+            with self.timed('onset_strength'):
+                self._mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=self.sr))
+        return self._mel_db
+    
+    @property
+    def hpss_enabled(self) -> bool:
+        return self.hpss_kernel_size > 0
+    
+    @property
+    def hpss_bins(self) -> int:
+        """Количество нижних бинов STFT, которые разделяются HPSS"""
+        return min(int(self.hpss_max_frequency * self.n_fft / self.sr) + 1, 1 + self.n_fft // 2)
+    
+    def hpss_medians(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Медианно отфильтрованный |STFT| в полосе до hpss_max_frequency
+        
+        Медиана по времени сохраняет тянущиеся тоны и подавляет удары,
+        медиана по частоте - наоборот. Маски HPSS строятся из этих двух
+        спектров и применяются к тому же STFT.
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (гармоническая, ударная медианы), каждая (hpss_bins, кадры)
+        """
+        if self._hpss_medians is None:
+            band = self.magnitude[:self.hpss_bins]
+            with self.timed('hpss'):
+                self._hpss_medians = (median_filter(band, self.hpss_kernel_size, axis=1),
+                                      median_filter(band, self.hpss_kernel_size, axis=0))
+        return self._hpss_medians
+    
+    def set_hpss_medians(self, harmonic: np.ndarray, percussive: np.ndarray):
+        """Задает готовые медианы HPSS (например, из кэша)"""
+        expected = (self.hpss_bins, self.magnitude.shape[1])
+        if harmonic.shape != expected or percussive.shape != expected:
+            raise ValueError(f"Медианы HPSS {harmonic.shape} не совпадают со спектром {expected}")
+        self._hpss_medians = (harmonic, percussive)
+    
+    def harmonic_band(self) -> np.ndarray:
+        """Гармоническая часть |STFT| в полосе HPSS: мягкая маска H^2 / (H^2 + P^2) (как librosa, margin=1)"""
+        harmonic, percussive = self.hpss_medians()
+        with self.timed('hpss'):
+            return self.magnitude[:self.hpss_bins] * librosa.util.softmask(harmonic, percussive, power=2)
+    
+    @property
+    def harmonic_magnitude(self) -> np.ndarray:
+        """|STFT| для высоты тона и хромы: гармоническая часть в полосе HPSS, выше - исходный спектр"""
+        if not self.hpss_enabled:
+            return self.magnitude
+        if self._harmonic_magnitude is None:
+            band = self.harmonic_band()
+            self._harmonic_magnitude = self.magnitude.copy()
+            self._harmonic_magnitude[:len(band)] = band
+        return self._harmonic_magnitude
+    
+    @property
+    def harmonic_power(self) -> np.ndarray:
+        """Мощность гармонической части (без HPSS - исходная)"""
+        if not self.hpss_enabled:
+            return self.power
+        if self._harmonic_power is None:
+            magnitude = self.harmonic_magnitude
+            with self.timed('hpss'):
+                self._harmonic_power = magnitude ** 2
+        return self._harmonic_power
+    
+    @property
+    def tonal_mel_db(self) -> np.ndarray:
+        """
+        Мел-спектрограмма в дБ без ударов - для onset'ов нот (без HPSS - исходная)
+        
+        Убираются только явно ударные бины (P > HPSS_ONSET_MARGIN * H): атаки
+        нот тоже частично ударные, и мягкая маска с margin=1 сглаживает их.
+        Выше полосы HPSS (тарелки, хай-хэт) спектр не учитывается.
+        """
+        if not self.hpss_enabled:
+            return self.mel_db
+        if self._tonal_mel_db is None:
+            harmonic, percussive = self.hpss_medians()
+            with self.timed('onset_strength'):
+                power = np.zeros_like(self.magnitude)
+                band = self.magnitude[:self.hpss_bins]
+                percussive_mask = librosa.util.softmask(percussive, self.HPSS_ONSET_MARGIN * harmonic, power=2)
+                power[:self.hpss_bins] = (band * (1 - percussive_mask)) ** 2
+                self._tonal_mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=self.sr))
+        return self._tonal_mel_db
+    
+    def onset_envelope(self, aggregate=np.mean, tonal: bool = False) -> np.ndarray:
+        """
+        Огибающая силы onset'ов (spectral flux по мел-спектрограмме в дБ)
+        
+        Args:
+            aggregate: Агрегация по мел-полосам (librosa: np.mean для onset'ов, np.median для долей)
+            tonal: Без ударов (для onset'ов нот при HPSS); доли считаются по исходной смеси
+        
+        Returns:
+            np.ndarray: Огибающая по кадрам STFT
+        """
+        tonal = tonal and self.hpss_enabled
+        key = (aggregate.__name__, tonal)
+        envelope = self._onset_envelopes.get(key)
+        if envelope is None:
+            mel_db = self.tonal_mel_db if tonal else self.mel_db
+            with self.timed('onset_strength'):
+                envelope = librosa.onset.onset_strength(S=mel_db, sr=self.sr, hop_length=self.hop_length,
+                                                        aggregate=aggregate)
+            self._onset_envelopes[key] = envelope
+        return envelope
+    
+    def frames_to_time(self, frames: np.ndarray) -> np.ndarray:
+        """Переводит номера кадров STFT во время в секундах"""
+        return librosa.frames_to_time(frames, sr=self.sr, hop_length=self.hop_length)
+    
+    def beat_track(self, start_bpm: float = 120.0) -> Tuple[float, np.ndarray]:
+        """
+        Определяет темп и доли
+        
+        Args:
+            start_bpm: Начальное приближение темпа (например, темп предыдущего фрагмента)
+        
+        Returns:
+            Tuple[float, np.ndarray]: (темп в BPM, кадры долей)
+        """
+        onset_envelope = self.onset_envelope(np.median)
+        with self.timed('beat_track'):
+            tempo, beats = librosa.beat.beat_track(onset_envelope=onset_envelope, sr=self.sr,
+                                                   hop_length=self.hop_length, start_bpm=start_bpm)
+        return tempo, beats
+    
+    def onset_detect(self, peak: Optional[float] = None, onset_envelope: Optional[np.ndarray] = None,
+                     **kwargs) -> np.ndarray:
+        """
+        Находит onset'ы по общей огибающей
+        
+        Args:
+            peak: Нормировка огибающей (None - по ее максимуму, как в librosa); при анализе
+                по частям - общий максимум, чтобы порог delta был одинаковым во всех частях
+            onset_envelope: Готовая огибающая (например, из кэша признаков; None - посчитать)
+            **kwargs: Параметры пикинга librosa.onset.onset_detect (pre_max, delta, wait, ...)
+        
+        Returns:
+            np.ndarray: Кадры onset'ов
+        """
+        if onset_envelope is None:
+            onset_envelope = self.onset_envelope(tonal=True)
+        with self.timed('onset_detect'):
+            if peak is not None:
+                onset_envelope = (onset_envelope - onset_envelope.min()) / (peak + np.finfo(np.float32).tiny)
+                kwargs['normalize'] = False
+            return librosa.onset.onset_detect(onset_envelope=onset_envelope, sr=self.sr,
+                                              hop_length=self.hop_length, units='frames', **kwargs)
+    
+    def piptrack(self, threshold: float = 0.1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Оценивает высоты тонов по спектрограмме амплитуд (гармонической части при HPSS)
+        
+        Args:
+            threshold: Порог относительно максимума кадра
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (частоты, амплитуды) размера (бины, кадры), общие для всех вызывающих
+        """
+        track = self._pitch_tracks.get(threshold)
+        if track is None:
+            magnitude = self.harmonic_magnitude
+            with self.timed('piptrack'):
+                track = librosa.piptrack(S=magnitude, sr=self.sr, n_fft=self.n_fft,
+                                         hop_length=self.hop_length, threshold=threshold)
+            self._pitch_tracks[threshold] = track
+        return track
+    
+    def log_frequency(self, fmin: float, n_bins: int, bins_per_octave: int) -> np.ndarray:
+        """
+        Спектрограмма амплитуд на логарифмической сетке частот (как у CQT) по общему STFT
+        (гармонической части при HPSS)
+        
+        Каждый бин - линейная интерполяция |STFT| между двумя соседними бинами
+        на частоте fmin * 2^(k / bins_per_octave). Разрешение на низких частотах
+        ограничено окном STFT, зато пересчет - одно матричное умножение
+        в нужной полосе частот без нового преобразования сигнала.
+        
+        Args:
+            fmin: Частота нижнего бина в Hz
+            n_bins: Количество бинов
+            bins_per_octave: Бинов на октаву
+        
+        Returns:
+            np.ndarray: (бины, кадры STFT), общая для всех вызывающих с теми же параметрами
+        """
+        key = ('stft', fmin, n_bins, bins_per_octave)
+        spectrum = self._cqts.get(key)
+        if spectrum is None:
+            magnitude = self.harmonic_magnitude
+            with self.timed('log_frequency'):
+                positions = fmin * 2.0 ** (np.arange(n_bins) / bins_per_octave) * self.n_fft / self.sr
+                lower = np.floor(positions).astype(int)
+                fraction = (positions - lower).astype(magnitude.dtype)
+                band = min(int(lower.max()) + 2, magnitude.shape[0])
+                upper = np.minimum(lower + 1, band - 1)
+                
+                weights = np.zeros((n_bins, band), dtype=magnitude.dtype)
+                weights[np.arange(n_bins), lower] = 1 - fraction
+                weights[np.arange(n_bins), upper] += fraction
+                spectrum = weights @ magnitude[:band]
+            self._cqts[key] = spectrum
+        return spectrum
+    
+    def cqt(self, fmin: float, n_bins: int, bins_per_octave: int, hop_length: Optional[int] = None) -> np.ndarray:
+        """
+        Спектрограмма амплитуд constant-Q в заданной полосе (по сигналу, HPSS не применяется)
+        
+        Args:
+            fmin: Частота нижнего бина в Hz
+            n_bins: Количество бинов
+            bins_per_octave: Бинов на октаву
+            hop_length: Шаг по времени (None - шаг STFT)
+        
+        Returns:
+            np.ndarray: |CQT| (бины, кадры), общая для всех вызывающих с теми же параметрами
+        """
+        hop_length = hop_length or self.hop_length
+        key = (fmin, n_bins, bins_per_octave, hop_length)
+        spectrum = self._cqts.get(key)
+        if spectrum is None:
+            with self.timed('cqt'):
+                spectrum = np.abs(librosa.cqt(self.y, sr=self.sr, hop_length=hop_length, fmin=fmin,
+                                              n_bins=n_bins, bins_per_octave=bins_per_octave))
+            self._cqts[key] = spectrum
+        return spectrum
+    
+    def tuning(self) -> float:
+        """
+        Отклонение строя от A440 в долях полутона
+        
+        Если строй не задан в конструкторе, считается так же, как в chroma_stft
+        без tuning: librosa.estimate_tuning по спектрограмме мощности (отдельный
+        проход piptrack по всему спектру с порогом по медиане амплитуд).
+        
+        Returns:
+            float: Отклонение в диапазоне [-0.5, 0.5)
+        """
+        if self._tuning is None:
+            power = self.harmonic_power
+            with self.timed('tuning'):
+                self._tuning = float(librosa.estimate_tuning(S=power, sr=self.sr, n_fft=self.n_fft))
+        return self._tuning
+    
+    def chroma(self) -> np.ndarray:
+        """Хроматические признаки (12, кадры) по спектрограмме мощности (гармонической части при HPSS)"""
+        power = self.harmonic_power
+        tuning = self.tuning()
+        with self.timed('chroma'):
+            return librosa.feature.chroma_stft(S=power, sr=self.sr, n_fft=self.n_fft,
+                                               hop_length=self.hop_length, tuning=tuning)
+    
+    def bass_chroma(self, max_frequency: float = 262.0) -> np.ndarray:
+        """
+        Хромаграмма нижнего регистра (для определения баса аккорда)
+        
+        Args:
+            max_frequency: Верхняя граница регистра в Hz (по умолчанию до C4)
+        
+        Returns:
+            np.ndarray: (12, кадры), нормированная по максимуму в кадре
+        """
+        power = self.harmonic_power
+        tuning = self.tuning()
+        with self.timed('chroma'):
+            num_bins = int(max_frequency * self.n_fft / self.sr) + 1
+            filters = librosa.filters.chroma(sr=self.sr, n_fft=self.n_fft, tuning=tuning)[:, :num_bins]
+            return librosa.util.normalize(filters @ power[:num_bins], norm=np.inf, axis=0)
+    
+    def timing_report(self) -> str:
+        """Строка со временем этапов для лога"""
+        stages = ', '.join(f"{stage} {seconds:.2f}с" for stage, seconds in self.timings.items())
+        return f"Время анализа признаков: {stages} (всего {sum(self.timings.values()):.2f}с)"
@@ -6,9 +6,12 @@ import logging
 from pathlib import Path
 from typing import Optional, List
 import numpy as np
+import librosa
 import basic_pitch
-from basic_pitch import ICASSP_2022_MODEL_PATH
-from basic_pitch.inference import predict_and_save
+from basic_pitch.constants import AUDIO_SAMPLE_RATE
+from .basic_pitch_worker import BasicPitchWorker
+from .notes import NoteArray, write_note_sidecar
+from .utils import decode_audio
 
 
 class AudioToMidiConverter:
@@ -17,6 +20,18 @@ class AudioToMidiConverter:
     def __init__(self, config, logger: Optional[logging.Logger] = None):
         self.config = config
         self.logger = logger or logging.getLogger(__name__)
+        # Модель загружается один раз при первом задании и остается в памяти до close()
+        self.worker = BasicPitchWorker(
+            backend=config.basic_pitch_backend,
+            intra_op_threads=config.basic_pitch_intra_op_threads,
+            inter_op_threads=config.basic_pitch_inter_op_threads,
+            batch_windows=config.basic_pitch_batch_windows,
+            logger=self.logger
+        )
+    
+    def close(self):
+        """Останавливает воркер Basic Pitch"""
+        self.worker.stop()
     
     def extract_audio_from_video(self, video_path: Path, output_path: Path) -> bool:
         """
@@ -58,42 +73,61 @@ class AudioToMidiConverter:
             audio_path: Путь к аудио файлу
             output_dir: Директория для сохранения MIDI
         
+        Returns:
+            Optional[Path]: Путь к созданному MIDI файлу или None
+        """
+        return self.convert_audio_files_to_midi([audio_path], output_dir)[0]
+    
+    def convert_audio_files_to_midi(self, audio_paths: List[Path], output_dir: Path) -> List[Optional[Path]]:
+        """
+        Конвертирует несколько аудио файлов в MIDI (окна всех файлов идут в модель общими батчами)
+        
+        Args:
+            audio_paths: Пути к аудио файлам
+            output_dir: Директория для сохранения MIDI
+        
+        Returns:
+            List[Optional[Path]]: Пути к созданным MIDI файлам (None - ошибка) в порядке audio_paths
+        """
+        futures = []
+        for audio_path in audio_paths:
+            try:
+                self.logger.info(f"Начинается конвертация аудио в MIDI: {audio_path}")
+                audio, _ = librosa.load(str(audio_path), sr=AUDIO_SAMPLE_RATE, mono=True)
+                futures.append(self.worker.submit(audio, str(audio_path)))
+            except Exception as e:
+                self.logger.error(f"Ошибка загрузки аудио {audio_path}: {e}")
+                futures.append(None)
+        
+        return [
+            self.save_transcription(future, output_dir / f"{Path(audio_path).stem}_basic_pitch.mid")
+            if future is not None else None
+            for audio_path, future in zip(audio_paths, futures)
+        ]
+    
+    def save_transcription(self, future, midi_path: Path) -> Optional[Path]:
+        """
+        Дожидается результата воркера и сохраняет MIDI (и ноты рядом с ним)
+        
+        Args:
+            future: Future задания BasicPitchWorker
+            midi_path: Путь для сохранения MIDI
+        
         Returns:
             Optional[Path]: Путь к созданному MIDI файлу или None
         """
         try:
-            self.logger.info(f"Начинается конвертация аудио в MIDI: {audio_path}")
-            
-            # Создаем директорию если не существует
-            output_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Конвертируем аудио в MIDI
-            predict_and_save(
-                [str(audio_path)],
-                output_dir,
-                save_midi=True,
-                sonify_midi=False,
-                save_model_outputs=False,
-                save_notes=False,
-                model_path=ICASSP_2022_MODEL_PATH
-            )
-            
-            # Ищем созданные MIDI файлы
-            midi_files = list(output_dir.glob("*.mid"))
-            
-            if not midi_files:
-                self.logger.error("MIDI файлы не созданы")
+            notes, midi_data = future.result()
+            if not len(notes):
+                self.logger.error("MIDI файл не создан: ноты не найдены")
                 return None
             
-            # Выбираем melody.mid если доступен, иначе первый найденный
-            melody_midi = output_dir / "melody.mid"
-            if melody_midi.exists():
-                selected_midi = melody_midi
-            else:
-                selected_midi = midi_files[0]
+            midi_path.parent.mkdir(parents=True, exist_ok=True)
+            midi_data.write(str(midi_path))
+            write_note_sidecar(midi_path, self.logger)
             
-            self.logger.info(f"MIDI файл создан: {selected_midi}")
-            return selected_midi
+            self.logger.info(f"MIDI файл создан: {midi_path} ({len(notes)} нот)")
+            return midi_path
             
         except Exception as e:
             self.logger.error(f"Ошибка конвертации аудио в MIDI: {e}")
@@ -110,16 +144,14 @@ class AudioToMidiConverter:
         Returns:
             Optional[Path]: Путь к созданному MIDI файлу или None
         """
-        # Создаем пути для временных файлов
-        audio_path = work_dir / "audio.mp3"
-        midi_dir = work_dir / "midi"
-        
-        # Шаг 1: Извлекаем аудио
-        if not self.extract_audio_from_video(video_path, audio_path):
+        # Шаг 1: Декодируем звук сразу с частотой модели (без mp3 и повторного ресемплинга)
+        audio = decode_audio(video_path, AUDIO_SAMPLE_RATE, self.config.get('ffmpeg_bin', './ffmpeg'), self.logger)
+        if audio is None:
             return None
         
-        # Шаг 2: Конвертируем аудио в MIDI
-        midi_path = self.convert_audio_to_midi(audio_path, midi_dir)
+        # Шаг 2: Конвертируем аудио в MIDI в уже запущенном воркере
+        midi_path = self.save_transcription(self.worker.submit(audio, str(video_path)),
+                                            work_dir / "midi" / f"{video_path.stem}_basic_pitch.mid")
         
         if midi_path:
             self.logger.info(f"Успешно создан MIDI файл: {midi_path}")
@@ -130,7 +162,7 @@ class AudioToMidiConverter:
     
     def optimize_midi(self, midi_path: Path, output_path: Path) -> bool:
         """
-        Оптимизирует MIDI файл (удаляет короткие ноты, объединяет соседние)
+        Оптимизирует MIDI файл (объединяет ноты одной высоты, удаляет короткие и перекрытия)
         
         Args:
             midi_path: Путь к исходному MIDI
@@ -145,40 +177,23 @@ class AudioToMidiConverter:
             # Загружаем MIDI
             midi_data = pretty_midi.PrettyMIDI(str(midi_path))
             
-            # Минимальная длительность ноты (в секундах)
-            min_note_duration = 0.1
-            
             # Обрабатываем каждый инструмент
             for instrument in midi_data.instruments:
                 if instrument.is_drum:
                     continue
                 
-                # Фильтруем короткие ноты
-                filtered_notes = []
-                for note in instrument.notes:
-                    if note.end - note.start >= min_note_duration:
-                        filtered_notes.append(note)
-                
-                # Объединяем соседние ноты с одинаковой высотой
-                if filtered_notes:
-                    merged_notes = []
-                    current_note = filtered_notes[0]
-                    
-                    for next_note in filtered_notes[1:]:
-                        # Если ноты имеют одинаковую высоту и близки по времени
-                        if (next_note.pitch == current_note.pitch and 
-                            next_note.start - current_note.end <= 0.1):
-                            # Объединяем ноты
-                            current_note.end = next_note.end
-                        else:
-                            merged_notes.append(current_note)
-                            current_note = next_note
-                    
-                    merged_notes.append(current_note)
-                    instrument.notes = merged_notes
+                # Ноты одной высоты сливаются независимо от порядка в файле, затем
+                # удаляются короткие и лишние по полифонии
+                notes = NoteArray.from_notes(instrument.notes, instrument.program).clean(
+                    min_duration=self.config.midi_min_note_duration,
+                    max_gap=self.config.midi_merge_gap,
+                    max_polyphony=self.config.midi_max_polyphony
+                )
+                instrument.notes = notes.to_notes()
             
             # Сохраняем оптимизированный MIDI
             midi_data.write(str(output_path))
+            write_note_sidecar(output_path, self.logger)
             self.logger.info(f"MIDI оптимизирован: {output_path}")
             return True
             
@@ -0,0 +1,392 @@
+"""
+Полифоническая транскрипция разложением спектра по шаблонам нот (NMF)
+
+Амплитудный CQT сигнала раскладывается по словарю из 88 спектральных
+шаблонов клавиш пианино: V ~ W H, где W (бины, 88) - шаблоны, H (88, кадры) -
+активации нот. Шаблоны один раз рендерятся синтезатором проекта и хранятся
+в кэше, поэтому в разложении обновляются только активации (мультипликативные
+обновления для расхождения Кульбака-Лейблера). Кадры независимы при
+фиксированном W, поэтому сигнал делится на части, которые считаются
+параллельно в процессах. Ноты - пики прироста активаций. TensorFlow не
+нужен, а несколько нот в кадре распознаются в отличие от простого режима.
+"""
+import argparse
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Tuple
+import numpy as np
+import librosa
+from .audio_features import AudioFeatures
+from .audio_to_midi_simple import SimpleAudioToMidiConverter, TranscriptionState
+from .notes import NoteArray
+from .utils import overlapping_windows
+
+
+# Параметры анализа (шаблоны собираются с ними же)
+NMF_SAMPLE_RATE = 22050
+HOP_LENGTH = 512
+LOWEST_KEY = 21       # A0
+KEY_COUNT = 88
+BINS_PER_SEMITONE = 3
+BINS_PER_OCTAVE = 12 * BINS_PER_SEMITONE
+# Нижний бин сдвинут так, чтобы центральный бин каждой клавиши стоял на ее частоте
+FMIN = float(librosa.midi_to_hz(LOWEST_KEY - (BINS_PER_SEMITONE // 2) / BINS_PER_SEMITONE))
+# 88 клавиш и еще октава сверху для обертонов верхних нот (ниже частоты Найквиста)
+N_BINS = KEY_COUNT * BINS_PER_SEMITONE + BINS_PER_OCTAVE
+# Запас части с каждой стороны: половина длины нижнего фильтра CQT
+CQT_MARGIN_SECONDS = 1.0
+
+
+def note_spectrum(y: np.ndarray) -> np.ndarray:
+    """
+    Амплитудный CQT для разложения
+    
+    Args:
+        y: Моно сигнал с частотой NMF_SAMPLE_RATE
+    
+    Returns:
+        np.ndarray: |CQT| (N_BINS, кадры), float32
+    """
+    features = AudioFeatures(y, NMF_SAMPLE_RATE, hop_length=HOP_LENGTH)
+    return np.ascontiguousarray(features.cqt(FMIN, N_BINS, BINS_PER_OCTAVE), dtype=np.float32)
+
+
+def nmf_activations(spectrum: np.ndarray, templates: np.ndarray, iterations: int = 30) -> np.ndarray:
+    """
+    Активации нот при фиксированных шаблонах (мультипликативные обновления KL-NMF)
+    
+    Args:
+        spectrum: |CQT| (N_BINS, кадры)
+        templates: Шаблоны (N_BINS, 88), сумма каждого столбца равна 1
+        iterations: Количество обновлений
+    
+    Returns:
+        np.ndarray: Активации (88, кадры), float32
+    """
+    eps = np.float32(1e-9)
+    # Начальное приближение - проекция спектра на шаблоны (неотрицательна)
+    activations = templates.T @ spectrum + eps
+    ratio = np.empty_like(spectrum)
+    for _ in range(iterations):
+        # При нормированных столбцах W знаменатель обновления W^T 1 равен 1
+        np.dot(templates, activations, out=ratio)
+        ratio += eps
+        np.divide(spectrum, ratio, out=ratio)
+        activations *= templates.T @ ratio
+    return activations
+
+
+def transcribe_window(window: np.ndarray, window_start: int, own_start: int, own_end: int,
+                      templates: np.ndarray, iterations: int) -> Tuple[int, np.ndarray]:
+    """
+    Активации собственного участка части сигнала (выполняется в процессе пула)
+    
+    Args:
+        window: Окно сигнала (участок с запасом с обеих сторон)
+        window_start: Начало окна в отсчетах (кратно HOP_LENGTH)
+        own_start: Начало собственного участка в отсчетах (кратно HOP_LENGTH)
+        own_end: Конец собственного участка в отсчетах
+        templates: Шаблоны нот (N_BINS, 88)
+        iterations: Количество обновлений NMF
+    
+    Returns:
+        Tuple[int, np.ndarray]: (номер первого кадра участка в сигнале, активации (88, кадры участка))
+    """
+    first_frame = own_start // HOP_LENGTH
+    last_frame = -(-own_end // HOP_LENGTH)
+    window_frame = window_start // HOP_LENGTH
+    
+    activations = nmf_activations(note_spectrum(window), templates, iterations)
+    return first_frame, activations[:, first_frame - window_frame:last_frame - window_frame]
+
+
+def activations_to_notes(activations: np.ndarray, onset_threshold: float = 0.1, frame_threshold: float = 0.05,
+                         min_note_frames: int = 3) -> NoteArray:
+    """
+    Выделяет ноты из активаций
+    
+    Начало ноты - локальный максимум прироста активации клавиши за два кадра
+    (не меньше onset_threshold). Нота звучит, пока активация не опустится ниже
+    frame_threshold или не начнется следующая нота той же клавиши. Пороги -
+    доли максимума активаций.
+    
+    Args:
+        activations: Активации (88, кадры)
+        onset_threshold: Порог прироста активации в начале ноты
+        frame_threshold: Порог активации звучащей ноты
+        min_note_frames: Минимальная длительность ноты в кадрах
+    
+    Returns:
+        NoteArray: Ноты, отсортированные по началу
+    """
+    num_frames = activations.shape[1]
+    peak = float(activations.max()) if activations.size else 0.0
+    if peak <= 0:
+        return NoteArray()
+    
+    level = activations / peak
+    # Прирост за два кадра: атака нижних нот в CQT растянута на несколько кадров
+    rise = level - np.pad(level, ((0, 0), (2, 0)))[:, :num_frames]
+    padded = np.pad(rise, ((0, 0), (1, 1)), constant_values=-np.inf)
+    is_onset = ((rise >= onset_threshold) & (rise >= padded[:, :-2]) & (rise > padded[:, 2:]))
+    keys, onset_frames = np.nonzero(is_onset)
+    if not len(keys):
+        return NoteArray()
+    
+    # Первый кадр после t, где активация ниже порога (для каждой клавиши и кадра)
+    silent = np.where(level < frame_threshold, np.arange(num_frames), num_frames)
+    next_silent = np.minimum.accumulate(silent[:, ::-1], axis=1)[:, ::-1]
+    next_silent = np.concatenate([next_silent[:, 1:], np.full((len(level), 1), num_frames)], axis=1)
+    end_frames = next_silent[keys, onset_frames]
+    
+    # Следующая нота той же клавиши обрывает текущую (nonzero отдает ноты по клавишам, затем по времени)
+    same_key = np.append(keys[1:] == keys[:-1], False)
+    next_onsets = np.append(onset_frames[1:], num_frames)
+    end_frames = np.where(same_key, np.minimum(end_frames, next_onsets), end_frames)
+    
+    # Громкость - максимум активации в начале ноты
+    attack = level[keys[:, np.newaxis], np.minimum(onset_frames[:, np.newaxis] + np.arange(3), num_frames - 1)]
+    velocity = np.clip(np.round(127 * np.sqrt(attack.max(axis=1))), 1, 127)
+    
+    keep = end_frames - onset_frames >= min_note_frames
+    frame_time = HOP_LENGTH / NMF_SAMPLE_RATE
+    return NoteArray.from_fields(
+        onset_frames[keep] * frame_time, end_frames[keep] * frame_time, LOWEST_KEY + keys[keep], velocity[keep]
+    ).sort()
+
+
+class NoteTemplates:
+    """Спектральные шаблоны 88 клавиш, отрендеренные синтезатором проекта"""
+    
+    # Длительность рендера клавиши и участок от начала, по которому усредняется спектр
+    RENDER_DURATION = 1.0
+    TEMPLATE_SECONDS = 0.5
+    RENDER_SAMPLE_RATE = 44100
+    
+    def __init__(self, path: Path, logger: Optional[logging.Logger] = None):
+        self.path = Path(path)
+        self.logger = logger or logging.getLogger(__name__)
+        self.templates: Optional[np.ndarray] = None
+    
+    @classmethod
+    def from_config(cls, config, logger: Optional[logging.Logger] = None) -> "NoteTemplates":
+        """Создает набор по настройкам (файл лежит в cache_dir)"""
+        cache_dir = Path(config.get('cache_dir', './cache'))
+        return cls(cache_dir / f"nmf_templates_{N_BINS}x{BINS_PER_OCTAVE}.npy", logger)
+    
+    def build(self, render_tone: Callable[..., np.ndarray]) -> bool:
+        """
+        Рендерит все клавиши и записывает шаблоны на диск
+        
+        Args:
+            render_tone: Функция (frequency, duration, sample_rate) -> np.ndarray
+        
+        Returns:
+            bool: True если успешно
+        """
+        self.logger.info(f"Сборка шаблонов NMF: {KEY_COUNT} клавиш -> {self.path}")
+        template_frames = int(self.TEMPLATE_SECONDS * NMF_SAMPLE_RATE / HOP_LENGTH)
+        templates = np.zeros((N_BINS, KEY_COUNT), dtype=np.float32)
+        
+        # Шум в тонах берется из глобального генератора - делаем шаблоны воспроизводимыми
+        rng_state = np.random.get_state()
+        try:
+            for key_idx in range(KEY_COUNT):
+                pitch = LOWEST_KEY + key_idx
+                np.random.seed(pitch)
+                frequency = 440.0 * (2 ** ((pitch - 69) / 12.0))
+                # Рендер с полной частотой: обертоны верхних клавиш не заворачиваются
+                tone = render_tone(frequency, self.RENDER_DURATION, self.RENDER_SAMPLE_RATE)
+                tone = librosa.resample(np.asarray(tone, dtype=np.float32), orig_sr=self.RENDER_SAMPLE_RATE,
+                                        target_sr=NMF_SAMPLE_RATE)
+                templates[:, key_idx] = note_spectrum(tone)[:, :template_frames].mean(axis=1)
+            
+            templates /= np.maximum(templates.sum(axis=0, keepdims=True), 1e-9)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp.npy')
+            np.save(tmp_path, templates)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.logger.error(f"Ошибка сборки шаблонов NMF: {e}")
+            return False
+        finally:
+            np.random.set_state(rng_state)
+        
+        self.templates = templates
+        self.logger.info(f"Шаблоны NMF собраны: {self.path}")
+        return True
+    
+    def load(self) -> bool:
+        """Читает шаблоны с диска"""
+        if not self.path.exists():
+            return False
+        
+        try:
+            templates = np.load(self.path)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Не удалось прочитать шаблоны NMF {self.path}: {e}")
+            return False
+        
+        if templates.shape != (N_BINS, KEY_COUNT):
+            self.logger.warning(f"Шаблоны NMF имеют неожиданный формат {templates.shape}, требуется пересборка")
+            return False
+        
+        self.templates = templates.astype(np.float32)
+        return True
+
+
+class NMFAudioToMidiConverter(SimpleAudioToMidiConverter):
+    """Полифоническая транскрипция по шаблонам нот без нейросети"""
+    
+    def __init__(self, config, logger: Optional[logging.Logger] = None):
+        super().__init__(config, logger)
+        self.templates = NoteTemplates.from_config(config, self.logger)
+    
+    @property
+    def analysis_sample_rate(self) -> int:
+        return NMF_SAMPLE_RATE
+    
+    def ensure_templates(self, force: bool = False) -> bool:
+        """
+        Загружает шаблоны нот, при необходимости собирая их синтезатором проекта
+        
+        Args:
+            force: Пересобрать шаблоны, даже если они уже есть на диске
+        
+        Returns:
+            bool: True если шаблоны готовы
+        """
+        if not force and (self.templates.templates is not None or self.templates.load()):
+            return True
+        
+        from .midi_to_audio_simple import SimpleMidiToAudioConverter
+        
+        synth = SimpleMidiToAudioConverter(self.config, self.logger)
+        return self.templates.build(synth.create_tone_audio)
+    
+    def transcribe_blocks(self, blocks: Iterable[np.ndarray]) -> NoteArray:
+        """
+        Транскрибирует сигнал по частям (части считаются параллельно в config.workers процессах)
+        
+        Args:
+            blocks: Блоки сигнала подряд с частотой NMF_SAMPLE_RATE
+        
+        Returns:
+            NoteArray: Ноты, отсортированные по началу
+        """
+        if not self.ensure_templates():
+            raise RuntimeError("Шаблоны NMF недоступны")
+        templates = self.templates.templates
+        
+        # Границы частей кратны шагу кадров, чтобы кадры частей совпадали с кадрами сигнала
+        chunk_samples = max(1, round(self.config.nmf_chunk_seconds * NMF_SAMPLE_RATE / HOP_LENGTH)) * HOP_LENGTH
+        margin_samples = round(CQT_MARGIN_SECONDS * NMF_SAMPLE_RATE / HOP_LENGTH) * HOP_LENGTH
+        windows = overlapping_windows(blocks, chunk_samples, margin_samples)
+        iterations = self.config.nmf_iterations
+        workers = self.config.workers
+        
+        parts = []
+        if workers > 1:
+            # В работе не больше двух частей на процесс: память не зависит от длины записи
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for window, window_start, own_start, own_end in windows:
+                    pending.append(pool.submit(transcribe_window, window, window_start, own_start, own_end,
+                                               templates, iterations))
+                    if len(pending) >= 2 * workers:
+                        parts.append(pending.popleft().result())
+                parts.extend(future.result() for future in pending)
+        else:
+            parts = [transcribe_window(window, window_start, own_start, own_end, templates, iterations)
+                     for window, window_start, own_start, own_end in windows]
+        
+        if not parts:
+            return NoteArray()
+        activations = np.concatenate([part for _, part in parts], axis=1)
+        
+        min_note_frames = max(1, round(self.config.nmf_min_note_duration * NMF_SAMPLE_RATE / HOP_LENGTH))
+        notes = activations_to_notes(activations, self.config.nmf_onset_threshold,
+                                     self.config.nmf_frame_threshold, min_note_frames)
+        self.logger.info(f"NMF: {len(parts)} частей, {activations.shape[1]} кадров, найдено {len(notes)} нот")
+        return notes
+    
+    def analyze_signal_to_notes(self, y: np.ndarray, sr: int, state: Optional[TranscriptionState] = None,
+                                offset: float = 0.0, region: Optional[Tuple[float, float]] = None) -> NoteArray:
+        """
+        Транскрибирует сигнал разложением по шаблонам
+        
+        Args:
+            y: Моно сигнал
+            sr: Частота дискретизации (другая частота пересэмплируется в NMF_SAMPLE_RATE)
+            state: Не используется (нормировка - по всему сигналу)
+            offset: Время начала сигнала в записи (сек)
+            region: Оставить только ноты, начинающиеся в этом интервале записи (сек)
+        
+        Returns:
+            NoteArray: Ноты, отсортированные по началу
+        """
+        self.chords = []
+        try:
+            if sr != NMF_SAMPLE_RATE:
+                y = librosa.resample(y, orig_sr=sr, target_sr=NMF_SAMPLE_RATE)
+            notes = self.transcribe_blocks([np.asarray(y, dtype=np.float32)])
+        except Exception as e:
+            self.logger.error(f"Ошибка NMF транскрипции: {e}")
+            return NoteArray()
+        
+        notes.data['start'] += offset
+        notes.data['end'] += offset
+        if region is not None:
+            notes = notes.filter((notes.start >= region[0]) & (notes.start < region[1]))
+        return notes
+    
+    def analyze_stream_to_notes(self, blocks: Iterable[np.ndarray], sr: int) -> NoteArray:
+        """
+        Транскрибирует поток блоков (части нарезаются из потока, как и для целого сигнала)
+        
+        Args:
+            blocks: Блоки сигнала подряд с частотой NMF_SAMPLE_RATE (например, из stream_audio)
+            sr: Частота дискретизации (должна быть NMF_SAMPLE_RATE)
+        
+        Returns:
+            NoteArray: Ноты, отсортированные по началу
+        """
+        self.chords = []
+        if sr != NMF_SAMPLE_RATE:
+            self.logger.error(f"NMF транскрипция требует {NMF_SAMPLE_RATE} Hz, получено {sr} Hz")
+            return NoteArray()
+        
+        try:
+            return self.transcribe_blocks(blocks)
+        except Exception as e:
+            self.logger.error(f"Ошибка потоковой NMF транскрипции: {e}")
+            return NoteArray()
+
+
+def main():
+    """Собирает шаблоны NMF по настройкам проекта"""
+    from .config import Config
+    from .utils import setup_logging
+    
+    parser = argparse.ArgumentParser(description="Сборка шаблонов нот для NMF транскрипции")
+    parser.add_argument('--config', '-c', default='configs/settings.yaml', help='Путь к конфигурационному файлу')
+    parser.add_argument('--force', action='store_true', help='Пересобрать шаблоны, даже если они уже существуют')
+    args = parser.parse_args()
+    
+    config = Config(args.config)
+    logger = setup_logging(config.get('log_level', 'INFO'))
+    converter = NMFAudioToMidiConverter(config, logger)
+    
+    if converter.templates.path.exists() and not args.force:
+        logger.info(f"Шаблоны NMF уже существуют: {converter.templates.path} (используйте --force для пересборки)")
+        return
+    
+    if not converter.ensure_templates(force=True):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,25 @@
 import logging
 import numpy as np
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterable, Optional, Tuple
 import librosa
-import pretty_midi
-from .utils import run_command
+from .audio_features import AudioFeatures
+from .chords import NOTE_NAMES, ChordRecognizer
+from .feature_cache import FeatureCache
+from .melody import MelodyTracker
+from .notes import FLAG_BASS, FLAG_ON_BEAT, NoteArray, write_note_sidecar
+from .utils import decode_audio, overlapping_windows, run_command, stream_audio
+
+
+class TranscriptionState:
+    """Состояние анализа, переносимое между частями сигнала при потоковой транскрипции"""
+    
+    def __init__(self):
+        self.tempo = 120.0                   # Темп (начальное приближение для следующей части)
+        self.onset_peak = 0.0                # Максимум огибающей onset'ов по всем частям
+        self.melody_peak = 0.0               # Максимум выраженности мелодии по всем частям
+        self.key_profile = np.zeros(12)      # Сумма хромаграммы по всем частям (тональность)
+        self.beat_phase = 0                  # Долей после последней басовой ноты
 
 
 class SimpleAudioToMidiConverter:
@@ -17,6 +32,18 @@ class SimpleAudioToMidiConverter:
     def __init__(self, config, logger: Optional[logging.Logger] = None):
         self.config = config
         self.logger = logger or logging.getLogger(__name__)
+        # Сегменты аккордов последнего анализа (если включен chord_analysis)
+        self.chords = []
+        self.feature_cache = FeatureCache(Path(config.get('cache_dir', './cache')) / 'features',
+                                          int(config.feature_cache_mb * 1024 * 1024), self.logger)
+    
+    def close(self):
+        """Освобождает ресурсы транскрибера (у простого транскрибера их нет)"""
+    
+    @property
+    def analysis_sample_rate(self) -> int:
+        """Частота дискретизации, с которой декодируется звук для анализа"""
+        return self.config.sample_rate
     
     def extract_audio_from_video(self, video_path: Path, output_path: Path) -> bool:
         """
@@ -48,275 +75,429 @@ class SimpleAudioToMidiConverter:
         
         return success
     
-    def analyze_audio_to_notes(self, audio_path: Path) -> list:
+    def analyze_audio_to_notes(self, audio_path: Path) -> NoteArray:
         """
-        Анализирует аудио и извлекает ноты с сохранением структуры мелодии
+        Анализирует аудио файл и извлекает ноты с сохранением структуры мелодии
         
         Args:
             audio_path: Путь к аудио файлу
         
         Returns:
-            list: Список нот (start_time, end_time, pitch, velocity)
+            NoteArray: Ноты, отсортированные по началу
         """
+        if self.config.stream_chunk_seconds:
+            # Длинные записи: декодируем и анализируем по частям
+            sample_rate = self.analysis_sample_rate
+            blocks = stream_audio(audio_path, sample_rate, sample_rate, self.config.get('ffmpeg_bin', './ffmpeg'),
+                                  self.logger)
+            return self.analyze_stream_to_notes(blocks, sample_rate)
+        
         try:
             # Загружаем аудио
-            y, sr = librosa.load(str(audio_path), sr=self.config.sample_rate)
+            y, sr = librosa.load(str(audio_path), sr=self.analysis_sample_rate)
+        except Exception as e:
+            self.logger.error(f"Ошибка загрузки аудио: {e}")
+            return NoteArray()
+        
+        return self.analyze_signal_to_notes(y, sr)
+    
+    def analyze_signal_to_notes(self, y: np.ndarray, sr: int, state: Optional[TranscriptionState] = None,
+                                offset: float = 0.0, region: Optional[Tuple[float, float]] = None) -> NoteArray:
+        """
+        Анализирует сигнал и извлекает ноты с сохранением структуры мелодии
+        
+        Args:
+            y: Моно аудио сигнал
+            sr: Частота дискретизации
+            state: Состояние предыдущих частей сигнала (None - сигнал целиком)
+            offset: Время начала y в исходной записи (сек)
+            region: Собственный участок части (начало, конец) в секундах записи: ноты, доли
+                и аккорды вне него принадлежат соседним частям (None - весь сигнал)
+        
+        Returns:
+            NoteArray: Ноты, отсортированные по началу (время - от начала записи)
+        """
+        state = state or TranscriptionState()
+        try:
+            # Один STFT и одна мел-спектрограмма на все анализы ниже (или готовые признаки из кэша)
+            features = AudioFeatures(y, sr, hpss_kernel_size=self.config.hpss_kernel_size if self.config.hpss else 0,
+                                     hpss_max_frequency=self.config.hpss_max_frequency,
+                                     tuning=self.config.chroma_tuning, logger=self.logger)
+            tracker = self.create_melody_tracker()
+            analysis = self.extract_features(features, tracker, state.tempo)
             
             # 1. АНАЛИЗ РИТМА И СТРУКТУРЫ
-            # Находим темп
-            tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-            beat_times = librosa.frames_to_time(beats, sr=sr)
+            # Находим темп (начиная с темпа предыдущей части)
+            beat_times = features.frames_to_time(analysis['beats']) + offset
+            state.tempo = float(analysis['tempo'][0]) or state.tempo
             
-            # Находим сильные доли (downbeats)
-            onset_frames = librosa.onset.onset_detect(y=y, sr=sr, units='frames', 
-                                                    pre_max=3, post_max=3, pre_avg=3, post_avg=5, delta=0.2, wait=10)
-            onset_times = librosa.frames_to_time(onset_frames, sr=sr)
+            # Находим сильные доли (downbeats); огибающая нормируется общим максимумом всех частей
+            onset_envelope = analysis['onset_envelope']
+            state.onset_peak = max(state.onset_peak, float(np.ptp(onset_envelope)))
+            onset_frames = features.onset_detect(peak=state.onset_peak, onset_envelope=onset_envelope,
+                                                 pre_max=3, post_max=3, pre_avg=3, post_avg=5, delta=0.2, wait=10)
+            onset_times = features.frames_to_time(onset_frames) + offset
             
             # 2. АНАЛИЗ МЕЛОДИИ
-            # Извлекаем основные частоты с адаптивным порогом
-            pitches, magnitudes = librosa.piptrack(y=y, sr=sr, threshold=0.1)
+            # Основные частоты: трекер только в диапазоне мелодии или piptrack по всему спектру
+            pitches, magnitudes = analysis['pitches'], analysis['magnitudes']
+            if tracker is not None:
+                # Выраженность нормируется общим максимумом всех частей
+                if magnitudes.size:
+                    state.melody_peak = max(state.melody_peak, float(magnitudes.max()))
+                if state.melody_peak > 0:
+                    magnitudes = magnitudes / state.melody_peak
+                pitch_frames = tracker.frames(features, onset_times - offset, pitches.shape[1])
+            else:
+                pitch_frames = onset_frames
             
             # Анализируем гармонический контент для понимания тональности
-            chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-            chroma_times = librosa.frames_to_time(np.arange(chroma.shape[1]), sr=sr)
+            chroma = analysis['chroma']
+            chroma_times = features.frames_to_time(np.arange(chroma.shape[1])) + offset
+            
+            # Собственный участок части (в перекрытиях решают соседние части)
+            region_start, region_end = region or (-np.inf, np.inf)
+            in_region = (chroma_times >= region_start) & (chroma_times < region_end)
             
             # Находим основную тональность
-            key_profile = np.mean(chroma, axis=1)
-            main_key = np.argmax(key_profile)
+            state.key_profile += chroma[:, in_region].sum(axis=1)
+            main_key = np.argmax(state.key_profile)
             
-            notes = []
+            # Аккорды (сегменты) - по той же хромаграмме
+            if self.config.chord_analysis:
+                chords = self.detect_chords(chroma, chroma_times, analysis['bass_chroma'])
+                self.chords = [chord for chord in chords if region_start <= chord['start'] < region_end]
+                self.logger.info(f"Найдено {len(self.chords)} аккордовых сегментов")
             
             # 3. ИЗВЛЕЧЕНИЕ МЕЛОДИЧЕСКОЙ ЛИНИИ
-            # Анализируем каждый onset с учетом ритмической структуры
-            for i, onset_time in enumerate(onset_times):
-                onset_frame = onset_frames[i]
-                
-                # Определяем силу этого onset'а относительно ритма
-                beat_distance = min([abs(onset_time - beat) for beat in beat_times])
-                is_on_beat = beat_distance < 0.1  # В пределах 100ms от доли
-                
-                # Получаем питч для этого кадра
-                pitch_values = pitches[:, onset_frame]
-                magnitude_values = magnitudes[:, onset_frame]
-                
-                # Находим доминирующую частоту
-                max_magnitude_idx = np.argmax(magnitude_values)
-                pitch_hz = pitch_values[max_magnitude_idx]
-                magnitude = magnitude_values[max_magnitude_idx]
-                
-                # Адаптивный порог в зависимости от ритма
-                threshold = 0.2 if is_on_beat else 0.4
-                
-                if pitch_hz > 0 and magnitude > threshold:
-                    # Конвертируем Hz в MIDI note
-                    midi_note = int(12 * np.log2(pitch_hz / 440.0) + 69)
-                    
-                    # Ограничиваем диапазон пианино
-                    if 48 <= midi_note <= 84:  # С3 до C6
-                        # Вычисляем длительность ноты с учетом ритма
-                        if i < len(onset_times) - 1:
-                            next_onset = onset_times[i + 1]
-                            duration = next_onset - onset_time
-                            
-                            # Корректируем длительность для ритмической точности
-                            if is_on_beat:
-                                # Ноты на долях могут быть длиннее
-                                duration = min(duration * 1.2, 1.5)
-                            else:
-                                # Ноты между долями короче
-                                duration = min(duration * 0.8, 0.8)
-                        else:
-                            duration = 0.5
-                        
-                        # Ограничиваем длительность
-                        duration = max(0.1, min(duration, 2.0))
-                        
-                        # Вычисляем velocity с учетом ритма
-                        base_velocity = int(magnitude * 127)
-                        if is_on_beat:
-                            # Ноты на долях громче
-                            velocity = min(base_velocity * 1.2, 127)
-                        else:
-                            velocity = max(base_velocity * 0.8, 20)
-                        
-                        velocity = max(min(velocity, 127), 20)
-                        
-                        notes.append({
-                            'start': onset_time,
-                            'end': onset_time + duration,
-                            'pitch': midi_note,
-                            'velocity': velocity,
-                            'is_on_beat': is_on_beat
-                        })
+            notes = self.extract_melody_notes(pitch_frames, onset_times, beat_times, pitches, magnitudes)
+            notes = notes.filter((notes.start >= region_start) & (notes.start < region_end))
             
             # 4. ДОБАВЛЯЕМ БАСОВУЮ ЛИНИЮ (только на сильные доли)
-            bass_notes = self.add_bass_line_rhythmic(chroma, chroma_times, beat_times)
-            notes.extend(bass_notes)
+            # Счет сильных долей продолжается с предыдущей части
+            beat_stride = self.config.bass_beat_stride
+            own_beats = beat_times[(beat_times >= region_start) & (beat_times < region_end)]
+            bass_beats = own_beats[(-state.beat_phase) % beat_stride::beat_stride]
+            state.beat_phase = (state.beat_phase + len(own_beats)) % beat_stride
+            bass_notes = self.add_bass_line_rhythmic(chroma, chroma_times, bass_beats, beat_stride=1)
+            notes = NoteArray.concatenate([notes, bass_notes])
             
             # 5. СОРТИРУЕМ И ФИЛЬТРУЕМ НОТЫ
-            notes.sort(key=lambda x: x['start'])
-            
             # Удаляем слишком близкие ноты (дубликаты)
-            filtered_notes = []
-            for note in notes:
-                if not filtered_notes or note['start'] - filtered_notes[-1]['start'] > 0.05:
-                    filtered_notes.append(note)
+            filtered_notes = notes.sort().thin(0.05)
             
             self.logger.info(f"Найдено {len(filtered_notes)} нот с сохранением ритмической структуры")
             return filtered_notes
             
         except Exception as e:
             self.logger.error(f"Ошибка анализа аудио: {e}")
-            return []
+            return NoteArray()
     
-    def detect_chords(self, chroma: np.ndarray, chroma_times: np.ndarray) -> list:
+    def create_melody_tracker(self) -> Optional[MelodyTracker]:
+        """Трекер мелодии из настроек (None - piptrack по всему спектру)"""
+        if self.config.melody_tracker not in ('stft', 'cqt'):
+            return None
+        return MelodyTracker(self.config.melody_note_range, self.config.melody_bins_per_semitone,
+                             self.config.melody_tracker, self.config.melody_hop_length, logger=self.logger)
+    
+    def extract_features(self, features: AudioFeatures, tracker: Optional[MelodyTracker],
+                         start_bpm: float) -> Dict[str, np.ndarray]:
         """
-        Определяет аккорды на основе хроматического анализа
+        Считает признаки сигнала, не зависящие от порогов выбора нот (через дисковый кэш)
         
         Args:
-            chroma: Хроматические признаки
-            chroma_times: Временные метки
+            features: Спектральный фронтенд сигнала
+            tracker: Трекер мелодии (None - piptrack)
+            start_bpm: Начальное приближение темпа
         
         Returns:
-            list: Список аккордов
+            Dict[str, np.ndarray]: tempo, beats (кадры), onset_envelope, pitches/magnitudes
+                (доминирующий пик каждого кадра, (1, кадры); у трекера - ненормированные),
+                chroma, bass_chroma
         """
-        chords = []
+        key = None
+        if self.feature_cache.enabled:
+            key = self.feature_cache.make_key(
+                features.y, features.sr, n_fft=features.n_fft, hop_length=features.hop_length,
+                start_bpm=start_bpm, melody_tracker=self.config.melody_tracker,
+                melody_note_range=self.config.melody_note_range,
+                melody_bins_per_semitone=self.config.melody_bins_per_semitone,
+                melody_hop_length=self.config.melody_hop_length,
+                hpss_kernel_size=features.hpss_kernel_size, hpss_max_frequency=features.hpss_max_frequency,
+                chroma_tuning=self.config.chroma_tuning
+            )
+            cached = self.feature_cache.get(key)
+            if cached is not None:
+                self.logger.info(f"Признаки взяты из кэша: {self.feature_cache.path(key)}")
+                return cached
         
-        # Простые мажорные и минорные аккорды
-        major_chords = {
-            'C': [0, 4, 7],   # C-E-G
-            'D': [2, 6, 9],   # D-F#-A
-            'E': [4, 8, 11],  # E-G#-B
-            'F': [5, 9, 0],   # F-A-C
-            'G': [7, 11, 2],  # G-B-D
-            'A': [9, 1, 4],   # A-C#-E
-            'B': [11, 3, 6]   # B-D#-F#
-        }
+        if features.hpss_enabled:
+            self.load_hpss_medians(features)
+        
+        # Доли - по смеси, onset'ы нот - без ударов (при HPSS)
+        tempo, beats = features.beat_track(start_bpm=start_bpm)
+        onset_envelope = features.onset_envelope(tonal=True)
+        if tracker is not None:
+            pitches, magnitudes = tracker.track(features)
+        else:
+            # Из piptrack нужен только самый сильный пик кадра - он и сохраняется
+            pitches, magnitudes = features.piptrack(threshold=0.1)
+            peak_bins = np.argmax(magnitudes, axis=0)[np.newaxis]
+            pitches = np.take_along_axis(pitches, peak_bins, axis=0)
+            magnitudes = np.take_along_axis(magnitudes, peak_bins, axis=0)
         
-        minor_chords = {
-            'Cm': [0, 3, 7],  # C-Eb-G
-            'Dm': [2, 5, 9],  # D-F-A
-            'Em': [4, 7, 11], # E-G-B
-            'Fm': [5, 8, 0],  # F-Ab-C
-            'Gm': [7, 10, 2], # G-Bb-D
-            'Am': [9, 0, 4],  # A-C-E
-            'Bm': [11, 2, 6]  # B-D-F#
+        analysis = {
+            'tempo': np.atleast_1d(tempo)[:1],
+            'beats': beats,
+            'onset_envelope': onset_envelope,
+            'pitches': pitches,
+            'magnitudes': magnitudes,
+            'chroma': features.chroma(),
+            'bass_chroma': features.bass_chroma(),
         }
+        self.logger.info(features.timing_report())
         
-        # Анализируем каждый временной кадр
-        for i in range(chroma.shape[1]):
-            chroma_vector = chroma[:, i]
-            
-            # Находим наиболее активные ноты
-            active_notes = np.where(chroma_vector > 0.3)[0]
-            
-            if len(active_notes) >= 3:
-                # Проверяем соответствие аккордам
-                for chord_name, chord_notes in {**major_chords, **minor_chords}.items():
-                    if all(note in active_notes for note in chord_notes):
-                        chords.append({
-                            'time': chroma_times[i],
-                            'chord': chord_name,
-                            'notes': chord_notes
-                        })
-                        break
-        
-        return chords
+        if key is not None:
+            self.feature_cache.put(key, analysis)
+        return analysis
+    
+    def load_hpss_medians(self, features: AudioFeatures):
+        """
+        Берет медианы HPSS (гармоническую и ударную) из кэша по хэшу сигнала или считает и сохраняет их
+        
+        Признаки целиком кэшируются с параметрами трекера и темпа, а медианы
+        зависят только от сигнала и HPSS, поэтому переживают смену настроек анализа.
+        
+        Args:
+            features: Спектральный фронтенд сигнала с включенным HPSS
+        """
+        if not self.feature_cache.enabled:
+            return
+        
+        key = self.feature_cache.make_key(
+            features.y, features.sr, stem='hpss', n_fft=features.n_fft, hop_length=features.hop_length,
+            hpss_kernel_size=features.hpss_kernel_size, hpss_max_frequency=features.hpss_max_frequency
+        )
+        cached = self.feature_cache.get(key)
+        if cached is not None:
+            features.set_hpss_medians(cached['harmonic'], cached['percussive'])
+            self.logger.info(f"Медианы HPSS взяты из кэша: {self.feature_cache.path(key)}")
+        else:
+            harmonic, percussive = features.hpss_medians()
+            self.feature_cache.put(key, {'harmonic': harmonic, 'percussive': percussive})
+    
+    def analyze_stream_to_notes(self, blocks: Iterable[np.ndarray], sr: int) -> NoteArray:
+        """
+        Анализирует сигнал по перекрывающимся частям (память не зависит от длины записи)
+        
+        Каждая часть анализируется с запасом stream_overlap_seconds с обеих
+        сторон, а ноты, доли и аккорды берутся только из ее собственного
+        участка. Темп, нормировка onset'ов и мелодии, тональность и счет
+        сильных долей переносятся из части в часть; дубликаты на стыках
+        удаляются общим прореживанием.
+        
+        Args:
+            blocks: Блоки сигнала подряд (например, из stream_audio)
+            sr: Частота дискретизации
+        
+        Returns:
+            NoteArray: Ноты, отсортированные по началу
+        """
+        chunk_samples = int(self.config.stream_chunk_seconds * sr)
+        overlap_samples = int(self.config.stream_overlap_seconds * sr)
+        state = TranscriptionState()
+        parts = []
+        chords = []
+        
+        try:
+            for window, window_start, own_start, own_end in overlapping_windows(blocks, chunk_samples, overlap_samples):
+                self.logger.info(f"Анализ части {own_start / sr:.1f}-{own_end / sr:.1f}с")
+                parts.append(self.analyze_signal_to_notes(window, sr, state, window_start / sr,
+                                                          (own_start / sr, own_end / sr)))
+                chords.extend(self.chords)
+        except Exception as e:
+            self.logger.error(f"Ошибка потокового анализа аудио: {e}")
+            return NoteArray()
+        
+        self.chords = chords
+        notes = NoteArray.concatenate(parts).sort().thin(0.05)
+        self.logger.info(f"Основная тональность: {NOTE_NAMES[int(np.argmax(state.key_profile))]}")
+        self.logger.info(f"Найдено {len(notes)} нот в {len(parts)} частях")
+        return notes
+    
+    def extract_melody_notes(self, onset_frames: np.ndarray, onset_times: np.ndarray, beat_times: np.ndarray,
+                             pitches: np.ndarray, magnitudes: np.ndarray,
+                             note_range: Optional[tuple] = None) -> NoteArray:
+        """
+        Извлекает мелодические ноты на onset'ах с учетом ритмической структуры
+        
+        Все onset'ы обрабатываются сразу операциями над массивами: расстояние
+        до ближайшей доли - через searchsorted, доминирующая частота кадра -
+        через argmax и индексацию.
+        
+        Args:
+            onset_frames: Кадры onset'ов (в кадрах pitches)
+            onset_times: Времена onset'ов (по возрастанию)
+            beat_times: Времена долей (по возрастанию)
+            pitches: Частоты кандидатов (кандидаты, кадры) - piptrack или MelodyTracker
+            magnitudes: Амплитуды кандидатов (кандидаты, кадры)
+            note_range: Диапазон MIDI нот мелодии (нижняя, верхняя) (None - из настроек)
+        
+        Returns:
+            NoteArray: Ноты (ноты на долях - с флагом FLAG_ON_BEAT)
+        """
+        lowest_note, highest_note = note_range or self.config.melody_note_range
+        onset_frames = np.asarray(onset_frames, dtype=int)
+        onset_times = np.asarray(onset_times, dtype=float)
+        beat_times = np.asarray(beat_times, dtype=float)
+        if not len(onset_frames):
+            return NoteArray()
+        
+        # Определяем силу каждого onset'а относительно ритма: ближайшая доля слева или справа
+        if len(beat_times):
+            right = np.clip(np.searchsorted(beat_times, onset_times), 0, len(beat_times) - 1)
+            left = np.clip(right - 1, 0, len(beat_times) - 1)
+            beat_distance = np.minimum(np.abs(onset_times - beat_times[left]), np.abs(onset_times - beat_times[right]))
+        else:
+            beat_distance = np.full(len(onset_times), np.inf)
+        is_on_beat = beat_distance < 0.1  # В пределах 100ms от доли
+        
+        # Находим доминирующую частоту каждого кадра onset'а
+        max_magnitude_idx = np.argmax(magnitudes[:, onset_frames], axis=0)
+        pitch_hz = pitches[max_magnitude_idx, onset_frames]
+        magnitude = magnitudes[max_magnitude_idx, onset_frames]
+        
+        # Адаптивный порог в зависимости от ритма
+        threshold = np.where(is_on_beat, 0.2, 0.4)
+        voiced = (pitch_hz > 0) & (magnitude > threshold)
+        
+        # Конвертируем Hz в MIDI note и ограничиваем диапазон мелодии (по умолчанию С3 до C6)
+        midi_note = np.zeros(len(onset_frames), dtype=int)
+        midi_note[voiced] = (12 * np.log2(pitch_hz[voiced] / 440.0) + 69).astype(int)
+        keep = voiced & (midi_note >= lowest_note) & (midi_note <= highest_note)
+        
+        # Вычисляем длительность ноты с учетом ритма: ноты на долях могут быть длиннее,
+        # ноты между долями короче; у последнего onset'а длительность фиксирована
+        duration = np.diff(onset_times, append=onset_times[-1])
+        duration = np.where(is_on_beat, np.minimum(duration * 1.2, 1.5), np.minimum(duration * 0.8, 0.8))
+        duration[-1] = 0.5
+        duration = np.clip(duration, 0.1, 2.0)
+        
+        # Вычисляем velocity с учетом ритма (ноты на долях громче); MIDI требует целые
+        base_velocity = (magnitude * 127).astype(int)
+        velocity = np.where(is_on_beat, np.minimum(base_velocity * 1.2, 127), np.maximum(base_velocity * 0.8, 20))
+        velocity = np.clip(velocity, 20, 127).astype(int)
+        
+        starts = onset_times[keep]
+        return NoteArray.from_fields(
+            starts, starts + duration[keep], midi_note[keep], velocity[keep],
+            flags=np.where(is_on_beat[keep], FLAG_ON_BEAT, 0)
+        )
     
-    def add_bass_line_rhythmic(self, chroma: np.ndarray, chroma_times: np.ndarray, beat_times: np.ndarray) -> list:
+    def detect_chords(self, chroma: np.ndarray, chroma_times: np.ndarray,
+                      bass_chroma: Optional[np.ndarray] = None) -> list:
+        """
+        Определяет аккорды на основе хроматического анализа
+        
+        Args:
+            chroma: Хроматические признаки
+            chroma_times: Временные метки
+            bass_chroma: Хромаграмма нижнего регистра (для обращений)
+        
+        Returns:
+            list: Сегменты аккордов {'start', 'end', 'chord', 'notes', 'bass'}
+        """
+        recognizer = ChordRecognizer(smoothing=self.config.chord_smoothing, logger=self.logger)
+        return recognizer.recognize(chroma, chroma_times, bass_chroma)
+    
+    def add_bass_line_rhythmic(self, chroma: np.ndarray, chroma_times: np.ndarray, beat_times: np.ndarray,
+                               beat_stride: Optional[int] = None, note_range: Optional[tuple] = None) -> NoteArray:
         """
         Добавляет ритмическую басовую линию на основе сильных долей
         
+        Все доли обрабатываются сразу: кадры хромаграммы находятся через
+        searchsorted, доминирующие ноты - одним argmax по собранным столбцам.
+        
         Args:
             chroma: Хроматические признаки
-            chroma_times: Временные метки для хроматических признаков
+            chroma_times: Временные метки для хроматических признаков (по возрастанию)
             beat_times: Времена сильных долей
+            beat_stride: Бас на каждой beat_stride-й доле (None - из настроек)
+            note_range: Басовый диапазон MIDI нот (нижняя, верхняя) (None - из настроек)
         
         Returns:
-            list: Список басовых нот
+            NoteArray: Басовые ноты (с флагом FLAG_BASS)
         """
-        bass_notes = []
+        beat_stride = beat_stride or self.config.bass_beat_stride
+        lowest_note, highest_note = note_range or self.config.bass_note_range
         
-        # Добавляем басовые ноты только на сильные доли (каждую 2-ю или 4-ю)
-        for i in range(0, len(beat_times), 2):  # Каждая 2-я доля
-            beat_time = beat_times[i]
-            
-            # Находим ближайший хроматический кадр
-            chroma_idx = np.argmin(np.abs(chroma_times - beat_time))
-            chroma_vector = chroma[:, chroma_idx]
-            
-            # Находим доминирующую ноту в басовом диапазоне
-            bass_strengths = []
-            for note_class in range(12):  # Все ноты октавы
-                strength = chroma_vector[note_class]
-                bass_strengths.append((note_class, strength))
-            
-            # Сортируем по силе
-            bass_strengths.sort(key=lambda x: x[1], reverse=True)
-            
-            # Берем самую сильную ноту, если она достаточно сильная
-            if bass_strengths[0][1] > 0.3:
-                note_class = bass_strengths[0][0]
-                # Конвертируем в MIDI ноту в басовом диапазоне
-                midi_note = note_class + 36  # C2 = 36
-                
-                # Ограничиваем басовый диапазон
-                if 36 <= midi_note <= 60:  # C2 до C4
-                    duration = 0.8  # Басовые ноты длиннее
-                    velocity = 50   # Тише основной мелодии
-                    
-                    bass_notes.append({
-                        'start': beat_time,
-                        'end': beat_time + duration,
-                        'pitch': midi_note,
-                        'velocity': velocity
-                    })
-        
-        return bass_notes
+        # Добавляем басовые ноты только на сильные доли (каждую beat_stride-ю)
+        beat_times = np.asarray(beat_times, dtype=float)[::beat_stride]
+        if not len(beat_times) or not chroma.shape[1]:
+            return NoteArray()
+        
+        # Находим ближайший хроматический кадр (при равенстве - более ранний)
+        right = np.clip(np.searchsorted(chroma_times, beat_times), 0, len(chroma_times) - 1)
+        left = np.clip(right - 1, 0, len(chroma_times) - 1)
+        nearer_left = np.abs(chroma_times[left] - beat_times) <= np.abs(chroma_times[right] - beat_times)
+        chroma_idx = np.where(nearer_left, left, right)
+        
+        # Находим доминирующую ноту каждой доли
+        beat_chroma = chroma[:, chroma_idx]
+        note_class = np.argmax(beat_chroma, axis=0)
+        strength = beat_chroma[note_class, np.arange(len(chroma_idx))]
+        
+        # Конвертируем в самую низкую MIDI ноту этого класса в басовом диапазоне
+        midi_note = lowest_note + (note_class - lowest_note) % 12
+        keep = (strength > 0.3) & (midi_note <= highest_note)
+        
+        duration = 0.8  # Басовые ноты длиннее
+        velocity = 50   # Тише основной мелодии
+        return NoteArray.from_fields(beat_times[keep], beat_times[keep] + duration, midi_note[keep], velocity,
+                                     flags=FLAG_BASS)
     
-    def create_midi_from_notes(self, notes: list, output_path: Path) -> bool:
+    def create_midi_from_notes(self, notes: NoteArray, output_path: Path) -> bool:
         """
-        Создает MIDI файл из списка нот с разделением на треки
+        Создает MIDI файл из нот (трек на каждую программу)
         
         Args:
-            notes: Список нот
+            notes: Ноты
             output_path: Путь для сохранения MIDI
         
         Returns:
             bool: True если успешно
         """
         try:
-            # Создаем MIDI объект
-            midi = pretty_midi.PrettyMIDI()
-            
-            # Создаем один инструмент для всех нот (как в оригинальном Piano Hero)
-            piano_track = pretty_midi.Instrument(program=0)  # Acoustic Grand Piano
-            
-            # Добавляем все ноты в один трек
-            for note_data in notes:
-                note = pretty_midi.Note(
-                    velocity=note_data['velocity'],
-                    pitch=note_data['pitch'],
-                    start=note_data['start'],
-                    end=note_data['end']
-                )
-                piano_track.notes.append(note)
-            
-            # Добавляем инструмент в MIDI
-            if piano_track.notes:
-                midi.instruments.append(piano_track)
-            
-            # Сохраняем MIDI файл
-            midi.write(str(output_path))
+            # Один инструмент для всех нот (как в оригинальном Piano Hero): у всех нот программа 0 -
+            # Acoustic Grand Piano
+            notes.write_midi(output_path)
+            write_note_sidecar(output_path, self.logger)
             
             self.logger.info(f"MIDI файл создан: {output_path}")
-            self.logger.info(f"  Всего нот: {len(piano_track.notes)}")
+            self.logger.info(f"  Всего нот: {len(notes)}")
             return True
             
         except Exception as e:
             self.logger.error(f"Ошибка создания MIDI: {e}")
             return False
     
+    def convert_notes_to_midi(self, notes: NoteArray, output_path: Path) -> bool:
+        """
+        Создает MIDI из найденных нот (пустой набор - ошибка)
+        
+        Args:
+            notes: Ноты
+            output_path: Путь для сохранения MIDI
+        
+        Returns:
+            bool: True если успешно
+        """
+        if not len(notes):
+            self.logger.error("Не удалось извлечь ноты из аудио")
+            return False
+        
+        return self.create_midi_from_notes(notes, output_path)
+    
     def convert_audio_to_midi(self, audio_path: Path, output_path: Path) -> bool:
         """
         Конвертирует аудио в MIDI
@@ -331,12 +512,8 @@ class SimpleAudioToMidiConverter:
         # Анализируем аудио
         notes = self.analyze_audio_to_notes(audio_path)
         
-        if not notes:
-            self.logger.error("Не удалось извлечь ноты из аудио")
-            return False
-        
         # Создаем MIDI файл
-        return self.create_midi_from_notes(notes, output_path)
+        return self.convert_notes_to_midi(notes, output_path)
     
     def process_video_to_midi(self, video_path: Path, work_dir: Path) -> Optional[Path]:
         """
@@ -349,16 +526,20 @@ class SimpleAudioToMidiConverter:
         Returns:
             Optional[Path]: Путь к созданному MIDI файлу или None
         """
-        # Создаем пути для временных файлов
-        audio_path = work_dir / "audio.mp3"
         midi_path = work_dir / "melody.mid"
         
-        # Шаг 1: Извлекаем аудио
-        if not self.extract_audio_from_video(video_path, audio_path):
-            return None
+        # Шаги 1-2: Декодируем звук видео (без mp3 и временного файла) и конвертируем в MIDI
+        if self.config.stream_chunk_seconds:
+            # Длинные записи - по частям прямо из pipe ffmpeg
+            notes = self.analyze_audio_to_notes(video_path)
+        else:
+            sample_rate = self.analysis_sample_rate
+            y = decode_audio(video_path, sample_rate, self.config.get('ffmpeg_bin', './ffmpeg'), self.logger)
+            if y is None:
+                return None
+            notes = self.analyze_signal_to_notes(y, sample_rate)
         
-        # Шаг 2: Конвертируем аудио в MIDI
-        if not self.convert_audio_to_midi(audio_path, midi_path):
+        if not self.convert_notes_to_midi(notes, midi_path):
             return None
         
         self.logger.info(f"Успешно создан MIDI файл: {midi_path}")
@@ -0,0 +1,164 @@
+"""
+Бэкенды инференса модели Basic Pitch на CPU
+
+Одна и та же модель ICASSP 2022 поставляется в basic_pitch в нескольких
+форматах. Бэкенд загружает нужный формат своим рантаймом (TensorFlow,
+TFLite или ONNX Runtime) с заданным числом потоков и отдает выходы в
+формате basic_pitch.inference.Model.predict. Рантайм импортируется только
+при создании бэкенда, поэтому для TFLite и ONNX TensorFlow не нужен.
+"""
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Optional, Union
+import numpy as np
+
+
+BACKENDS = ('auto', 'tf', 'tflite', 'onnx')
+
+
+class InferenceBackend(ABC):
+    """Загруженная модель Basic Pitch"""
+    
+    name = 'auto'
+    # Принимает ли модель батч окон (иначе окна подаются по одному)
+    batched = True
+    
+    @abstractmethod
+    def predict(self, x: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Прогоняет окна через модель
+        
+        Args:
+            x: Окна (батч, AUDIO_N_SAMPLES, 1), float32
+        
+        Returns:
+            Dict[str, np.ndarray]: note, onset, contour - (батч, кадры, бины)
+        """
+
+
+class DefaultBackend(InferenceBackend):
+    """Модель, выбранная самим basic_pitch (первый установленный рантайм)"""
+    
+    name = 'auto'
+    
+    def __init__(self, model_path: Union[str, Path]):
+        from basic_pitch.inference import Model
+        
+        self.model = Model(model_path)
+        self.batched = self.model.model_type.name in ('TENSORFLOW', 'ONNX')
+    
+    def predict(self, x: np.ndarray) -> Dict[str, np.ndarray]:
+        return self.model.predict(x)
+
+
+class TensorFlowBackend(InferenceBackend):
+    """TensorFlow SavedModel"""
+    
+    name = 'tf'
+    
+    def __init__(self, model_path: Union[str, Path], intra_op_threads: int = 0, inter_op_threads: int = 0,
+                 logger: Optional[logging.Logger] = None):
+        import tensorflow as tf
+        
+        logger = logger or logging.getLogger(__name__)
+        threading = tf.config.threading
+        current = (threading.get_intra_op_parallelism_threads(), threading.get_inter_op_parallelism_threads())
+        if current != (intra_op_threads, inter_op_threads):
+            # Число потоков задается только до первой операции TensorFlow в процессе
+            try:
+                threading.set_intra_op_parallelism_threads(intra_op_threads)
+                threading.set_inter_op_parallelism_threads(inter_op_threads)
+            except RuntimeError as e:
+                logger.warning(f"TensorFlow уже инициализирован, потоки {intra_op_threads}/{inter_op_threads} "
+                               f"не применены (действуют {current[0]}/{current[1]}): {e}")
+        self.model = tf.saved_model.load(str(model_path))
+    
+    def predict(self, x: np.ndarray) -> Dict[str, np.ndarray]:
+        return {name: value.numpy() for name, value in self.model(x).items()}
+
+
+class TFLiteBackend(InferenceBackend):
+    """TFLite (tflite_runtime или tensorflow.lite); вход модели - одно окно"""
+    
+    name = 'tflite'
+    batched = False
+    
+    def __init__(self, model_path: Union[str, Path], intra_op_threads: int = 0, inter_op_threads: int = 0):
+        try:
+            import tflite_runtime.interpreter as tflite
+        except ImportError:
+            import tensorflow.lite as tflite
+        
+        # У интерпретатора TFLite один пул потоков (inter_op не используется)
+        self.interpreter = tflite.Interpreter(str(model_path), num_threads=intra_op_threads or None)
+        self.model = self.interpreter.get_signature_runner()
+    
+    def predict(self, x: np.ndarray) -> Dict[str, np.ndarray]:
+        return self.model(input_2=x)
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime на CPU"""
+    
+    name = 'onnx'
+    
+    def __init__(self, model_path: Union[str, Path], intra_op_threads: int = 0, inter_op_threads: int = 0):
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        if inter_op_threads > 1:
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        self.session = ort.InferenceSession(str(model_path), sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+    
+    def predict(self, x: np.ndarray) -> Dict[str, np.ndarray]:
+        # Имена выходов - как в basic_pitch.inference.Model
+        note, onset, contour = self.session.run(
+            ['StatefulPartitionedCall:1', 'StatefulPartitionedCall:2', 'StatefulPartitionedCall:0'],
+            {'serving_default_input_2:0': x}
+        )
+        return {'note': note, 'onset': onset, 'contour': contour}
+
+
+def default_model_path(backend: str) -> Path:
+    """Путь к модели ICASSP 2022 в формате бэкенда (auto - формат, выбранный basic_pitch)"""
+    from basic_pitch import ICASSP_2022_MODEL_PATH, FilenameSuffix, build_icassp_2022_model_path
+    
+    if backend == 'auto':
+        return Path(ICASSP_2022_MODEL_PATH)
+    return build_icassp_2022_model_path(FilenameSuffix[backend])
+
+
+def create_backend(backend: str = 'auto', model_path: Optional[Union[str, Path]] = None,
+                   intra_op_threads: int = 0, inter_op_threads: int = 0,
+                   logger: Optional[logging.Logger] = None) -> InferenceBackend:
+    """
+    Загружает модель Basic Pitch выбранным рантаймом
+    
+    Args:
+        backend: 'auto', 'tf', 'tflite' или 'onnx'
+        model_path: Путь к модели (None - модель ICASSP 2022 из basic_pitch в формате бэкенда)
+        intra_op_threads: Потоков внутри операции (0 - по умолчанию рантайма)
+        inter_op_threads: Потоков между операциями (0 - по умолчанию рантайма)
+        logger: Логгер для вывода информации
+    
+    Returns:
+        InferenceBackend: Загруженная модель
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд Basic Pitch: {backend} (доступны: {', '.join(BACKENDS)})")
+    
+    logger = logger or logging.getLogger(__name__)
+    model_path = model_path or default_model_path(backend)
+    logger.info(f"Загрузка модели Basic Pitch ({backend}, потоки {intra_op_threads}/{inter_op_threads}): {model_path}")
+    
+    if backend == 'tf':
+        return TensorFlowBackend(model_path, intra_op_threads, inter_op_threads, logger)
+    if backend == 'tflite':
+        return TFLiteBackend(model_path, intra_op_threads, inter_op_threads)
+    if backend == 'onnx':
+        return OnnxBackend(model_path, intra_op_threads, inter_op_threads)
+    return DefaultBackend(model_path)
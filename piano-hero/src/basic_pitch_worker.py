@@ -0,0 +1,226 @@
+"""
+Долгоживущий воркер инференса Basic Pitch
+
+predict_and_save загружает модель (и TensorFlow) при каждом вызове и
+обрабатывает один файл. Воркер загружает модель один раз в своем потоке
+и принимает задания (сигналы) через очередь: окна всех заданий, ждущих
+в очереди, собираются в общие батчи для одного прогона модели, а ноты
+возвращаются в памяти через Future, без записи и поиска файлов.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from itertools import chain, islice
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+import numpy as np
+import pretty_midi
+from basic_pitch.constants import AUDIO_N_SAMPLES, AUDIO_SAMPLE_RATE, FFT_HOP
+from basic_pitch.inference import unwrap_output
+import basic_pitch.note_creation as infer
+from .basic_pitch_backends import InferenceBackend, create_backend
+from .notes import NoteArray
+
+
+# Перекрытие окон модели в кадрах (как в basic_pitch.inference.run_inference)
+N_OVERLAPPING_FRAMES = 30
+OVERLAP_LEN = N_OVERLAPPING_FRAMES * FFT_HOP
+HOP_SIZE = AUDIO_N_SAMPLES - OVERLAP_LEN
+
+
+def window_audio(audio: np.ndarray) -> np.ndarray:
+    """
+    Нарезает сигнал на окна модели так же, как basic_pitch.inference.get_audio_input
+    
+    Args:
+        audio: Моно сигнал с частотой AUDIO_SAMPLE_RATE
+    
+    Returns:
+        np.ndarray: Окна (окна, AUDIO_N_SAMPLES, 1)
+    """
+    # Половина перекрытия тишины в начале, хвост последнего окна дополняется нулями
+    num_windows = max(1, -(-(len(audio) + OVERLAP_LEN // 2) // HOP_SIZE))
+    padded = np.zeros((num_windows - 1) * HOP_SIZE + AUDIO_N_SAMPLES, dtype=np.float32)
+    padded[OVERLAP_LEN // 2:OVERLAP_LEN // 2 + len(audio)] = audio
+    windows = np.lib.stride_tricks.sliding_window_view(padded, AUDIO_N_SAMPLES)[::HOP_SIZE]
+    return windows[:, :, np.newaxis]
+
+
+class BasicPitchJob:
+    """Задание воркеру: сигнал и Future с результатом"""
+    
+    def __init__(self, audio: np.ndarray, name: str = ''):
+        self.audio = np.asarray(audio, dtype=np.float32)
+        self.name = name
+        self.future: Future = Future()
+
+
+class BasicPitchWorker:
+    """Поток с загруженной моделью Basic Pitch, обрабатывающий задания из очереди батчами"""
+    
+    def __init__(self, model_path: Optional[Union[str, Path]] = None, backend: str = 'auto',
+                 intra_op_threads: int = 0, inter_op_threads: int = 0, batch_windows: int = 16,
+                 onset_threshold: float = 0.5, frame_threshold: float = 0.3,
+                 minimum_note_length: float = 127.70, logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            model_path: Путь к модели Basic Pitch (None - модель ICASSP 2022 в формате бэкенда)
+            backend: Рантайм инференса: 'auto', 'tf', 'tflite' или 'onnx'
+            intra_op_threads: Потоков внутри операции (0 - по умолчанию рантайма)
+            inter_op_threads: Потоков между операциями (0 - по умолчанию рантайма)
+            batch_windows: Максимум окон (~2 с звука каждое) в одном прогоне модели
+            onset_threshold: Порог вероятности начала ноты
+            frame_threshold: Порог вероятности звучания ноты в кадре
+            minimum_note_length: Минимальная длительность ноты в миллисекундах
+            logger: Логгер для вывода информации
+        """
+        self.model_path = model_path
+        self.backend = backend
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.batch_windows = max(1, int(batch_windows))
+        self.onset_threshold = onset_threshold
+        self.frame_threshold = frame_threshold
+        self.minimum_note_length = minimum_note_length
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self.jobs: "queue.Queue[Optional[BasicPitchJob]]" = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """Запускает поток воркера (модель загружается в нем один раз)"""
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name='basic-pitch-worker', daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        """Завершает поток после обработки уже поставленных заданий"""
+        if self.thread is not None and self.thread.is_alive():
+            self.jobs.put(None)
+            self.thread.join()
+        self.thread = None
+    
+    def submit(self, audio: np.ndarray, name: str = '') -> Future:
+        """
+        Ставит сигнал в очередь на транскрипцию
+        
+        Args:
+            audio: Моно сигнал с частотой AUDIO_SAMPLE_RATE (22050 Hz)
+            name: Имя для лога
+        
+        Returns:
+            Future: Результат - (NoteArray, pretty_midi.PrettyMIDI)
+        """
+        self.start()
+        job = BasicPitchJob(audio, name)
+        self.jobs.put(job)
+        return job.future
+    
+    def transcribe(self, audio: np.ndarray, name: str = '') -> Tuple[NoteArray, pretty_midi.PrettyMIDI]:
+        """Транскрибирует сигнал и ждет результата"""
+        return self.submit(audio, name).result()
+    
+    def run(self):
+        """Цикл потока: загрузка модели и обработка заданий до стоп-сигнала"""
+        start = time.perf_counter()
+        model = None
+        load_error = None
+        try:
+            model = create_backend(self.backend, self.model_path, self.intra_op_threads,
+                                   self.inter_op_threads, self.logger)
+            self.logger.info(f"Модель Basic Pitch ({self.backend}) загружена за {time.perf_counter() - start:.1f}с")
+        except Exception as e:
+            # Поток продолжает принимать задания и завершает их этой ошибкой до stop()
+            self.logger.error(f"Ошибка загрузки модели Basic Pitch: {e}")
+            load_error = e
+        
+        running = True
+        while running:
+            job = self.jobs.get()
+            if job is None:
+                break
+            
+            # Забираем все уже ждущие задания, чтобы прогнать их окна общими батчами
+            batch = [job]
+            while True:
+                try:
+                    job = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    running = False
+                    break
+                batch.append(job)
+            
+            if load_error is not None:
+                for job in batch:
+                    job.future.set_exception(load_error)
+            else:
+                self.process(model, batch)
+    
+    def predict_windows(self, model: InferenceBackend, job_windows: List[np.ndarray]) -> dict:
+        """
+        Прогоняет окна всех заданий через модель батчами (батч может захватывать несколько заданий)
+        
+        Args:
+            model: Загруженная модель
+            job_windows: Окна каждого задания (окна, AUDIO_N_SAMPLES, 1)
+        
+        Returns:
+            dict: note, onset, contour - выходы модели (окна всех заданий подряд, кадры, бины)
+        """
+        # TFLite и CoreML принимают по одному окну
+        batch_size = self.batch_windows if model.batched else 1
+        # Окна копируются в память только батчами
+        windows = chain.from_iterable(job_windows)
+        outputs = {'note': [], 'onset': [], 'contour': []}
+        while True:
+            batch = list(islice(windows, batch_size))
+            if not batch:
+                break
+            for name, value in model.predict(np.stack(batch)).items():
+                outputs[name].append(value)
+        return {name: np.concatenate(values) for name, values in outputs.items()}
+    
+    def process(self, model: InferenceBackend, jobs: List[BasicPitchJob]):
+        """Транскрибирует группу заданий с общими батчами окон"""
+        start = time.perf_counter()
+        try:
+            job_windows = [window_audio(job.audio) for job in jobs]
+            outputs = self.predict_windows(model, job_windows)
+        except Exception as e:
+            self.logger.error(f"Ошибка инференса Basic Pitch: {e}")
+            for job in jobs:
+                job.future.set_exception(e)
+            return
+        
+        min_note_len = int(np.round(self.minimum_note_length / 1000 * (AUDIO_SAMPLE_RATE / FFT_HOP)))
+        window_start = 0
+        for job, windows in zip(jobs, job_windows):
+            window_end = window_start + len(windows)
+            try:
+                model_output = {
+                    name: unwrap_output(value[window_start:window_end], len(job.audio), N_OVERLAPPING_FRAMES)
+                    for name, value in outputs.items()
+                }
+                midi_data, note_events = infer.model_output_to_notes(
+                    model_output,
+                    onset_thresh=self.onset_threshold,
+                    frame_thresh=self.frame_threshold,
+                    min_note_len=min_note_len
+                )
+                notes = NoteArray.from_fields(
+                    [event[0] for event in note_events],
+                    [event[1] for event in note_events],
+                    [event[2] for event in note_events],
+                    np.clip(np.round(127 * np.array([event[3] for event in note_events], dtype=float)), 0, 127)
+                )
+                job.future.set_result((notes, midi_data))
+            except Exception as e:
+                self.logger.error(f"Ошибка обработки выхода Basic Pitch {job.name}: {e}")
+                job.future.set_exception(e)
+            window_start = window_end
+        
+        self.logger.info(f"Basic Pitch: {len(jobs)} файлов, {window_start} окон за {time.perf_counter() - start:.1f}с")
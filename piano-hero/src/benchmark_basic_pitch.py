@@ -0,0 +1,156 @@
+"""
+Бенчмарк бэкендов Basic Pitch на CPU
+
+Прогоняет один и тот же клип через модель каждым выбранным рантаймом и
+выводит время загрузки модели, время инференса и коэффициент реального
+времени (RTF = время инференса / длительность клипа, меньше 1 - быстрее
+реального времени). Без --audio используется фиксированный синтетический
+клип, чтобы результаты разных машин и настроек потоков были сравнимы.
+"""
+import argparse
+import sys
+import time
+from typing import List, Optional
+import numpy as np
+
+from .config import Config
+from .utils import setup_logging
+
+
+def synthetic_clip(seconds: float, sr: int, seed: int = 0) -> np.ndarray:
+    """
+    Фиксированный клип: случайные аккорды из затухающих тонов с обертонами
+    
+    Args:
+        seconds: Длительность в секундах
+        sr: Частота дискретизации
+        seed: Зерно генератора (один и тот же клип при одном зерне)
+    
+    Returns:
+        np.ndarray: Моно сигнал float32
+    """
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(seconds * sr), dtype=np.float32)
+    note_samples = int(0.5 * sr)
+    t = np.arange(note_samples) / sr
+    envelope = np.exp(-3.0 * t)
+    for start in range(0, len(audio) - note_samples, note_samples // 2):
+        for pitch in rng.integers(36, 96, size=3):
+            freq = 440.0 * 2 ** ((pitch - 69) / 12)
+            tone = sum(np.sin(2 * np.pi * freq * k * t) / k for k in range(1, 5))
+            audio[start:start + note_samples] += (0.1 * envelope * tone).astype(np.float32)
+    return audio
+
+
+def main(argv: Optional[List[str]] = None):
+    """Основная функция CLI бенчмарка"""
+    parser = argparse.ArgumentParser(
+        description="Сравнение скорости бэкендов Basic Pitch (RTF на фиксированном клипе)",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Примеры использования:
+  python -m src.benchmark_basic_pitch
+  python -m src.benchmark_basic_pitch --backends tflite onnx --intra-op-threads 4
+  python -m src.benchmark_basic_pitch --audio input/song.wav --seconds 60
+        """
+    )
+    
+    parser.add_argument(
+        '--backends', '-b',
+        nargs='+',
+        default=['tf', 'tflite', 'onnx'],
+        help='Бэкенды для сравнения: auto, tf, tflite, onnx'
+    )
+    
+    parser.add_argument(
+        '--audio', '-a',
+        help='Аудио файл клипа (по умолчанию - синтетический клип)'
+    )
+    
+    parser.add_argument(
+        '--seconds', '-s',
+        type=float,
+        default=30.0,
+        help='Длительность клипа в секундах'
+    )
+    
+    parser.add_argument(
+        '--repeats', '-r',
+        type=int,
+        default=3,
+        help='Повторов инференса (берется лучшее время)'
+    )
+    
+    parser.add_argument(
+        '--intra-op-threads',
+        type=int,
+        help='Потоков внутри операции (по умолчанию - из конфигурации)'
+    )
+    
+    parser.add_argument(
+        '--inter-op-threads',
+        type=int,
+        help='Потоков между операциями (по умолчанию - из конфигурации)'
+    )
+    
+    parser.add_argument(
+        '--config', '-c',
+        default='configs/settings.yaml',
+        help='Путь к конфигурационному файлу'
+    )
+    
+    args = parser.parse_args(argv)
+    
+    config = Config(args.config)
+    logger = setup_logging(config.get('log_level', 'INFO'))
+    
+    # Модули Basic Pitch импортируются после разбора аргументов (--help без зависимостей)
+    from basic_pitch.constants import AUDIO_SAMPLE_RATE
+    from .basic_pitch_backends import create_backend
+    from .basic_pitch_worker import BasicPitchWorker, window_audio
+    
+    if args.audio:
+        import librosa
+        audio, _ = librosa.load(args.audio, sr=AUDIO_SAMPLE_RATE, mono=True, duration=args.seconds)
+    else:
+        audio = synthetic_clip(args.seconds, AUDIO_SAMPLE_RATE)
+    duration = len(audio) / AUDIO_SAMPLE_RATE
+    windows = window_audio(audio)
+    
+    intra_op_threads = config.basic_pitch_intra_op_threads if args.intra_op_threads is None else args.intra_op_threads
+    inter_op_threads = config.basic_pitch_inter_op_threads if args.inter_op_threads is None else args.inter_op_threads
+    worker = BasicPitchWorker(batch_windows=config.basic_pitch_batch_windows, logger=logger)
+    
+    print(f"Клип: {duration:.1f}с, {len(windows)} окон, потоки {intra_op_threads}/{inter_op_threads}, "
+          f"батч {worker.batch_windows}")
+    print(f"{'бэкенд':<8} {'загрузка, с':>12} {'инференс, с':>12} {'RTF':>8}")
+    
+    failed = False
+    for name in args.backends:
+        try:
+            start = time.perf_counter()
+            backend = create_backend(name, intra_op_threads=intra_op_threads,
+                                     inter_op_threads=inter_op_threads, logger=logger)
+            load_time = time.perf_counter() - start
+            
+            # Первый прогон (прогрев рантайма) не учитывается
+            worker.predict_windows(backend, [windows])
+            times = []
+            for _ in range(max(1, args.repeats)):
+                start = time.perf_counter()
+                worker.predict_windows(backend, [windows])
+                times.append(time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"Бэкенд {name} недоступен: {e}")
+            print(f"{name:<8} {'-':>12} {'-':>12} {'-':>8}")
+            failed = True
+            continue
+        
+        best = min(times)
+        print(f"{name:<8} {load_time:>12.2f} {best:>12.2f} {best / duration:>8.3f}")
+    
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Распознавание аккордов по хроматическим признакам
+
+Все кадры хромаграммы сравниваются со всеми шаблонами аккордов одним
+матричным умножением (косинусная близость), после чего последовательность
+сглаживается по времени (Витерби или медианный фильтр) и сворачивается
+в сегменты. Обращения аккордов определяются по басовой хромаграмме:
+для каждого сегмента басом считается самый сильный звук аккорда внизу.
+"""
+import logging
+from typing import List, Optional, Tuple
+import numpy as np
+import librosa
+from scipy.ndimage import median_filter
+
+
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# Типы аккордов: суффикс названия и интервалы от основного тона
+CHORD_QUALITIES = [
+    ('', (0, 4, 7)),         # Мажор
+    ('m', (0, 3, 7)),        # Минор
+    ('7', (0, 4, 7, 10)),    # Доминантсептаккорд
+    ('maj7', (0, 4, 7, 11)), # Большой мажорный септаккорд
+    ('m7', (0, 3, 7, 10)),   # Малый минорный септаккорд
+]
+
+
+def build_chord_templates() -> Tuple[List[str], List[Tuple[int, ...]], np.ndarray]:
+    """
+    Строит шаблоны аккордов на всех 12 тонах
+    
+    Returns:
+        Tuple: (названия, звуки аккорда - классы высоты начиная с основного тона,
+                матрица шаблонов (аккорды, 12) из 0/1)
+    """
+    names = []
+    notes = []
+    for suffix, intervals in CHORD_QUALITIES:
+        for root in range(12):
+            names.append(NOTE_NAMES[root] + suffix)
+            notes.append(tuple((root + interval) % 12 for interval in intervals))
+    
+    templates = np.zeros((len(names), 12), dtype=np.float32)
+    for chord_idx, chord_notes in enumerate(notes):
+        templates[chord_idx, list(chord_notes)] = 1.0
+    return names, notes, templates
+
+
+class ChordRecognizer:
+    """Распознаватель аккордов по шаблонам со сглаживанием во времени"""
+    
+    def __init__(self, min_score: float = 0.6, smoothing: Optional[str] = 'viterbi',
+                 self_transition: float = 0.99, median_frames: int = 15,
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            min_score: Минимальная косинусная близость к шаблону (ниже - "нет аккорда")
+            smoothing: Сглаживание: 'viterbi', 'median' или None
+            self_transition: Вероятность остаться в том же аккорде на следующем кадре (Витерби)
+            median_frames: Ширина медианного фильтра в кадрах
+            logger: Логгер для вывода информации
+        """
+        if smoothing not in ('viterbi', 'median', None):
+            raise ValueError(f"Неизвестное сглаживание аккордов: {smoothing}")
+        
+        self.min_score = min_score
+        self.smoothing = smoothing
+        self.self_transition = self_transition
+        self.median_frames = median_frames
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self.names, self.notes, templates = build_chord_templates()
+        # Нормированные шаблоны: произведение с нормированной хромой - косинусная близость
+        self.templates = templates / np.linalg.norm(templates, axis=1, keepdims=True)
+    
+    def score(self, chroma: np.ndarray) -> np.ndarray:
+        """
+        Оценки всех аккордов во всех кадрах
+        
+        Args:
+            chroma: Хроматические признаки (12, кадры)
+        
+        Returns:
+            np.ndarray: (аккорды + 1, кадры); последняя строка - "нет аккорда" (min_score)
+        """
+        norms = np.linalg.norm(chroma, axis=0, keepdims=True)
+        normalized = chroma / np.maximum(norms, 1e-8)
+        scores = np.empty((len(self.names) + 1, chroma.shape[1]), dtype=np.float32)
+        np.dot(self.templates, normalized, out=scores[:-1])
+        scores[-1] = self.min_score
+        return scores
+    
+    def decode(self, scores: np.ndarray) -> np.ndarray:
+        """
+        Выбирает аккорд в каждом кадре с учетом сглаживания
+        
+        Args:
+            scores: Оценки (аккорды + 1, кадры)
+        
+        Returns:
+            np.ndarray: Индексы аккордов по кадрам (len(names) - "нет аккорда")
+        """
+        if self.smoothing == 'median':
+            scores = median_filter(scores, size=(1, self.median_frames), mode='nearest')
+        elif self.smoothing == 'viterbi':
+            # Оценки -> вероятности состояний (softmax с крутизной, разделяющей близкие шаблоны)
+            logits = (scores - scores.max(axis=0, keepdims=True)) * 20.0
+            prob = np.exp(logits)
+            prob /= prob.sum(axis=0, keepdims=True)
+            transition = librosa.sequence.transition_loop(len(scores), self.self_transition)
+            return librosa.sequence.viterbi_discriminative(prob, transition)
+        
+        return np.argmax(scores, axis=0)
+    
+    def recognize(self, chroma: np.ndarray, chroma_times: np.ndarray,
+                  bass_chroma: Optional[np.ndarray] = None) -> list:
+        """
+        Находит сегменты аккордов
+        
+        Args:
+            chroma: Хроматические признаки (12, кадры)
+            chroma_times: Временные метки кадров
+            bass_chroma: Хромаграмма нижнего регистра для обращений (None - основной вид)
+        
+        Returns:
+            list: Сегменты {'start', 'end', 'chord', 'notes', 'bass'}; паузы без аккорда пропускаются
+        """
+        num_frames = chroma.shape[1]
+        if not num_frames:
+            return []
+        
+        labels = self.decode(self.score(chroma))
+        
+        # Границы сегментов - кадры, где меняется метка
+        boundaries = np.flatnonzero(np.diff(labels)) + 1
+        starts = np.concatenate([[0], boundaries])
+        ends = np.concatenate([boundaries, [num_frames]])
+        frame_duration = chroma_times[1] - chroma_times[0] if num_frames > 1 else 0.0
+        end_times = np.append(chroma_times[1:], chroma_times[-1] + frame_duration)
+        
+        segments = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            chord_idx = labels[start]
+            if chord_idx == len(self.names):
+                continue
+            
+            chord_notes = self.notes[chord_idx]
+            name = self.names[chord_idx]
+            bass = chord_notes[0]
+            if bass_chroma is not None:
+                # Обращение: самый сильный звук аккорда в басу за сегмент
+                bass_energy = bass_chroma[list(chord_notes), start:end].sum(axis=1)
+                bass = chord_notes[int(np.argmax(bass_energy))]
+                if bass != chord_notes[0]:
+                    name = f"{name}/{NOTE_NAMES[bass]}"
+            
+            segments.append({
+                'start': float(chroma_times[start]),
+                'end': float(end_times[end - 1]),
+                'chord': name,
+                'notes': list(chord_notes),
+                'bass': bass
+            })
+        
+        return segments
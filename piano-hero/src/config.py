@@ -4,7 +4,7 @@
 import yaml
 import os
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 
 class Config:
@@ -41,6 +41,7 @@ class Config:
             self.get('work_dir', './work'),
             self.get('input_dir', './input'),
             self.get('output_dir', './output'),
+            self.get('cache_dir', './cache'),
             self.get_path('soundfont_path').parent if self.get_path('soundfont_path') else None
         ]
         
@@ -107,3 +108,155 @@ class Config:
     @property
     def base_render_height(self) -> int:
         return self.get('base_render_height', 1080)
+    
+    @property
+    def tone_cache_mb(self) -> float:
+        return self.get('tone_cache_mb', 128)
+    
+    @property
+    def tone_cache_duration_step(self) -> float:
+        return self.get('tone_cache_duration_step', 0.01)
+    
+    @property
+    def sample_bank_enabled(self) -> bool:
+        return self.get('sample_bank_enabled', False)
+    
+    @property
+    def sample_bank_max_duration(self) -> float:
+        return self.get('sample_bank_max_duration', 4.0)
+    
+    @property
+    def synth_block_size(self) -> int:
+        return self.get('synth_block_size', 4096)
+    
+    @property
+    def workers(self) -> int:
+        return self.get('workers', 1)
+    
+    @property
+    def synth_seed(self) -> Optional[int]:
+        return self.get('synth_seed')
+    
+    @property
+    def mastering_engine(self) -> str:
+        return self.get('mastering_engine', 'numpy')
+    
+    @property
+    def reverb_room(self) -> Optional[str]:
+        return self.get('reverb_room', 'chamber')
+    
+    @property
+    def reverb_wet(self) -> float:
+        return self.get('reverb_wet', 0.3)
+    
+    @property
+    def chord_analysis(self) -> bool:
+        return self.get('chord_analysis', False)
+    
+    @property
+    def chord_smoothing(self) -> Optional[str]:
+        return self.get('chord_smoothing', 'viterbi')
+    
+    @property
+    def bass_beat_stride(self) -> int:
+        return self.get('bass_beat_stride', 2)
+    
+    @property
+    def bass_note_range(self) -> tuple:
+        return tuple(self.get('bass_note_range', [36, 60]))
+    
+    @property
+    def melody_tracker(self) -> str:
+        return self.get('melody_tracker', 'stft')
+    
+    @property
+    def chroma_tuning(self) -> Optional[float]:
+        return self.get('chroma_tuning', 0.0)
+    
+    @property
+    def melody_note_range(self) -> tuple:
+        return tuple(self.get('melody_note_range', [48, 84]))
+    
+    @property
+    def melody_bins_per_semitone(self) -> int:
+        return self.get('melody_bins_per_semitone', 3)
+    
+    @property
+    def melody_hop_length(self) -> int:
+        return self.get('melody_hop_length', 512)
+    
+    @property
+    def stream_chunk_seconds(self) -> float:
+        return self.get('stream_chunk_seconds', 0)
+    
+    @property
+    def stream_overlap_seconds(self) -> float:
+        return self.get('stream_overlap_seconds', 5.0)
+    
+    @property
+    def feature_cache_mb(self) -> float:
+        return self.get('feature_cache_mb', 256)
+    
+    @property
+    def basic_pitch_batch_windows(self) -> int:
+        return self.get('basic_pitch_batch_windows', 16)
+    
+    @property
+    def basic_pitch_backend(self) -> str:
+        return self.get('basic_pitch_backend', 'auto')
+    
+    @property
+    def basic_pitch_intra_op_threads(self) -> int:
+        return self.get('basic_pitch_intra_op_threads', 0)
+    
+    @property
+    def basic_pitch_inter_op_threads(self) -> int:
+        return self.get('basic_pitch_inter_op_threads', 0)
+    
+    @property
+    def midi_min_note_duration(self) -> float:
+        return self.get('midi_min_note_duration', 0.1)
+    
+    @property
+    def midi_merge_gap(self) -> Optional[float]:
+        return self.get('midi_merge_gap', 0.1)
+    
+    @property
+    def midi_max_polyphony(self) -> int:
+        return self.get('midi_max_polyphony', 0)
+    
+    @property
+    def transcriber(self) -> str:
+        return self.get('transcriber', 'simple')
+    
+    @property
+    def nmf_chunk_seconds(self) -> float:
+        return self.get('nmf_chunk_seconds', 10.0)
+    
+    @property
+    def nmf_iterations(self) -> int:
+        return self.get('nmf_iterations', 30)
+    
+    @property
+    def nmf_onset_threshold(self) -> float:
+        return self.get('nmf_onset_threshold', 0.1)
+    
+    @property
+    def nmf_frame_threshold(self) -> float:
+        return self.get('nmf_frame_threshold', 0.05)
+    
+    @property
+    def nmf_min_note_duration(self) -> float:
+        return self.get('nmf_min_note_duration', 0.05)
+    
+    @property
+    def hpss(self) -> bool:
+        return self.get('hpss', False)
+    
+    @property
+    def hpss_kernel_size(self) -> int:
+        return self.get('hpss_kernel_size', 17)
+    
+    @property
+    def hpss_max_frequency(self) -> float:
+        return self.get('hpss_max_frequency', 5000.0)
@@ -0,0 +1,126 @@
+"""
+Дисковый кэш признаков транскрипции
+
+Признаки сигнала (огибающая onset'ов, доли, пики высоты тона, хромаграмма)
+зависят только от декодированного звука и параметров анализа, но не от
+порогов выбора нот. Они сохраняются в сжатых .npz, ключ - хэш сигнала
+и параметров, поэтому повторная транскрипция того же звука с другими
+порогами не пересчитывает спектры. Размер каталога ограничен: при
+превышении удаляются давно не использованные файлы.
+"""
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional
+import numpy as np
+
+
+class FeatureCache:
+    """Кэш признаков в каталоге .npz файлов с вытеснением давно неиспользуемых"""
+    
+    def __init__(self, cache_dir: Path, max_bytes: int, logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            cache_dir: Каталог кэша
+            max_bytes: Максимальный суммарный размер файлов в байтах (0 - кэш выключен)
+            logger: Логгер для вывода информации
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max(0, int(max_bytes))
+        self.logger = logger or logging.getLogger(__name__)
+        self.reset_stats()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+    
+    def reset_stats(self):
+        """Сбрасывает счетчики попаданий и промахов"""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def make_key(self, y: np.ndarray, sr: int, **params) -> str:
+        """
+        Строит ключ по содержимому сигнала и параметрам анализа
+        
+        Args:
+            y: Сигнал
+            sr: Частота дискретизации
+            **params: Параметры, от которых зависят признаки (n_fft, hop_length, ...)
+        
+        Returns:
+            str: Хэш (hex)
+        """
+        key = hashlib.sha1(np.ascontiguousarray(y, dtype=np.float32).tobytes())
+        key.update(json.dumps({'sr': sr, **params}, sort_keys=True, default=str).encode('utf-8'))
+        return key.hexdigest()
+    
+    def path(self, key: str) -> Path:
+        return self.cache_dir / f"features_{key}.npz"
+    
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """Возвращает признаки из кэша или None"""
+        if not self.enabled:
+            return None
+        
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                features = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Не удалось прочитать кэш признаков {path}: {e}")
+            self.misses += 1
+            return None
+        
+        # Время изменения - время последнего использования (порядок вытеснения)
+        os.utime(path)
+        self.hits += 1
+        return features
+    
+    def put(self, key: str, features: Dict[str, np.ndarray]):
+        """Сохраняет признаки и вытесняет старые файлы при превышении лимита"""
+        if not self.enabled:
+            return
+        
+        path = self.path(key)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Временный файл не попадает под маску features_*.npz и не вытесняется
+            tmp_path = path.with_suffix('.npz.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, **features)
+            tmp_path.replace(path)
+        except OSError as e:
+            self.logger.warning(f"Не удалось сохранить кэш признаков {path}: {e}")
+            return
+        
+        self.evict()
+    
+    def evict(self):
+        """Удаляет давно не использованные файлы, пока размер каталога больше лимита"""
+        entries = []
+        for path in self.cache_dir.glob('features_*.npz'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        
+        size_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if size_bytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            size_bytes -= size
+            self.evictions += 1
+    
+    def stats_message(self) -> str:
+        """Строка со статистикой для лога"""
+        return (f"Кэш признаков: попаданий {self.hits}, промахов {self.misses}, "
+                f"вытеснено {self.evictions}")
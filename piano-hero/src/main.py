@@ -15,6 +15,30 @@ from .visualize_midi import MidiVisualizer
 from .postprocess import VideoPostProcessor
 
 
+def create_audio_to_midi_converter(config, logger: logging.Logger):
+    """
+    Создает транскрибер по настройке transcriber
+    
+    Args:
+        config: Объект конфигурации
+        logger: Логгер для вывода информации
+    
+    Returns:
+        Конвертер с методом process_video_to_midi
+    """
+    transcriber = config.transcriber
+    if transcriber == 'nmf':
+        from .audio_to_midi_nmf import NMFAudioToMidiConverter
+        return NMFAudioToMidiConverter(config, logger)
+    if transcriber == 'basic_pitch':
+        # Basic Pitch (и его рантайм) импортируется, только если выбран
+        from .audio_to_midi import AudioToMidiConverter as BasicPitchConverter
+        return BasicPitchConverter(config, logger)
+    if transcriber != 'simple':
+        raise ValueError(f"Неизвестный транскрибер: {transcriber} (доступны: simple, nmf, basic_pitch)")
+    return AudioToMidiConverter(config, logger)
+
+
 class PianoHeroCover:
     """Основной класс для генерации Piano Hero Cover видео"""
     
@@ -23,11 +47,21 @@ class PianoHeroCover:
         self.logger = setup_logging(self.config.get('log_level', 'INFO'))
         
         # Инициализируем компоненты
-        self.audio_to_midi = AudioToMidiConverter(self.config, self.logger)
+        self.audio_to_midi = create_audio_to_midi_converter(self.config, self.logger)
         self.midi_to_audio = MidiToAudioConverter(self.config, self.logger)
         self.visualizer = MidiVisualizer(self.config, self.logger)
         self.postprocessor = VideoPostProcessor(self.config, self.logger)
     
+    def close(self):
+        """Останавливает транскрибер (поток модели Basic Pitch и его очередь)"""
+        self.audio_to_midi.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
     def get_video_duration(self, video_path: Path) -> Optional[float]:
         """
         Получает длительность видео файла
@@ -278,56 +312,58 @@ def main():
         print(f"Ошибка загрузки конфигурации: {e}")
         sys.exit(1)
     
-    # Настраиваем уровень логирования
-    if args.verbose:
-        generator.logger.setLevel(logging.DEBUG)
+    # Транскрибер останавливается при выходе из блока, в том числе по sys.exit
+    with generator:
+        # Настраиваем уровень логирования
+        if args.verbose:
+            generator.logger.setLevel(logging.DEBUG)
     
-    # Переопределяем настройки из аргументов
-    if args.fps:
-        generator.config._config['fps'] = args.fps
+        # Переопределяем настройки из аргументов
+        if args.fps:
+            generator.config._config['fps'] = args.fps
     
-    # Проверяем требования
-    if not generator.check_requirements():
-        sys.exit(1)
+        # Проверяем требования
+        if not generator.check_requirements():
+            sys.exit(1)
     
-    # Определяем входной путь
-    input_path = Path(args.input)
-    if not input_path.exists():
-        print(f"Ошибка: Путь не существует: {input_path}")
-        sys.exit(1)
+        # Определяем входной путь
+        input_path = Path(args.input)
+        if not input_path.exists():
+            print(f"Ошибка: Путь не существует: {input_path}")
+            sys.exit(1)
     
-    # Определяем выходную директорию
-    output_dir = args.output or generator.config.get('output_dir', './output')
-    output_path = Path(output_dir)
-    output_path.mkdir(parents=True, exist_ok=True)
+        # Определяем выходную директорию
+        output_dir = args.output or generator.config.get('output_dir', './output')
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
     
-    # Обрабатываем в зависимости от типа входа
-    if input_path.is_file():
-        # Один файл
-        output_file = get_output_filename(input_path, output_dir)
-        success = generator.process_single_video(input_path, output_file, args.keep_workdir)
+        # Обрабатываем в зависимости от типа входа
+        if input_path.is_file():
+            # Один файл
+            output_file = get_output_filename(input_path, output_dir)
+            success = generator.process_single_video(input_path, output_file, args.keep_workdir)
         
-        if success:
-            print(f"✅ Видео успешно создано: {output_file}")
-            sys.exit(0)
-        else:
-            print("❌ Ошибка создания видео")
-            sys.exit(1)
+            if success:
+                print(f"✅ Видео успешно создано: {output_file}")
+                sys.exit(0)
+            else:
+                print("❌ Ошибка создания видео")
+                sys.exit(1)
     
-    elif input_path.is_dir():
-        # Директория
-        stats = generator.process_batch(str(input_path), output_dir, args.keep_workdir)
+        elif input_path.is_dir():
+            # Директория
+            stats = generator.process_batch(str(input_path), output_dir, args.keep_workdir)
         
-        if stats["failed"] == 0:
-            print(f"✅ Все видео успешно обработаны ({stats['success']}/{stats['total']})")
-            sys.exit(0)
+            if stats["failed"] == 0:
+                print(f"✅ Все видео успешно обработаны ({stats['success']}/{stats['total']})")
+                sys.exit(0)
+            else:
+                print(f"⚠️  Обработано {stats['success']}/{stats['total']} видео")
+                sys.exit(1)
+    
         else:
-            print(f"⚠️  Обработано {stats['success']}/{stats['total']} видео")
+            print(f"Ошибка: Неизвестный тип пути: {input_path}")
             sys.exit(1)
-    
-    else:
-        print(f"Ошибка: Неизвестный тип пути: {input_path}")
-        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,537 @@
+"""
+Цепочка мастеринга пианино на NumPy/SciPy
+
+Повторяет цепочку фильтров FFmpeg из enhance_audio (loudnorm, acompressor,
+equalizer, chorus, tremolo, overdrive, loudnorm) со сверточной реверберацией
+вместо aecho, но работает в памяти
+и поблочно: каждый этап хранит состояние фильтров между блоками, поэтому
+результат не зависит от размера блока, а память - от длины трека.
+"""
+import logging
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+import numpy as np
+from scipy.signal import lfilter, sosfilt
+from .reverb import ConvolutionReverb
+
+
+def peaking_eq_sos(frequency: float, width: float, gain_db: float, sample_rate: int) -> np.ndarray:
+    """
+    Коэффициенты колокольного эквалайзера (RBJ), как у equalizer=width_type=h в FFmpeg
+    
+    Args:
+        frequency: Центральная частота (Гц)
+        width: Ширина полосы (Гц)
+        gain_db: Усиление (дБ)
+        sample_rate: Частота дискретизации
+    
+    Returns:
+        np.ndarray: Секция биквада [b0, b1, b2, 1, a1, a2]
+    """
+    amplitude = 10 ** (gain_db / 40)
+    omega = 2 * np.pi * frequency / sample_rate
+    alpha = np.sin(omega) / (2 * frequency / width)
+    
+    b = [1 + alpha * amplitude, -2 * np.cos(omega), 1 - alpha * amplitude]
+    a = [1 + alpha / amplitude, -2 * np.cos(omega), 1 - alpha / amplitude]
+    return np.array(b + a) / a[0]
+
+
+def k_weighting_sos(sample_rate: int) -> np.ndarray:
+    """Фильтр K-взвешивания ITU-R BS.1770 (полка + фильтр верхних частот)"""
+    # Полка +4 дБ (модель головы)
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = np.tan(np.pi * f0 / sample_rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    
+    # Фильтр верхних частот RLB
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * f0 / sample_rate)
+    a0 = 1 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    
+    return np.array([shelf, highpass])
+
+
+class LoudnessMeter:
+    """Потоковый измеритель интегральной громкости (LUFS) и пика по BS.1770"""
+    
+    STEP_TIME = 0.1     # Шаг измерения (100 мс, перекрытие блоков 75%)
+    BLOCK_STEPS = 4     # Блок стробирования 400 мс
+    ABSOLUTE_GATE = -70.0
+    RELATIVE_GATE = -10.0
+    
+    def __init__(self, sample_rate: int, channels: int):
+        self.sos = k_weighting_sos(sample_rate)
+        self.step_samples = int(round(self.STEP_TIME * sample_rate))
+        self._zi = np.zeros((self.sos.shape[0], 2, channels))
+        self._pending = np.zeros((0, channels))
+        self._step_energy = []
+        self.peak = 0.0
+    
+    def update(self, block: np.ndarray):
+        """Добавляет блок (frames, channels)"""
+        if not len(block):
+            return
+        
+        self.peak = max(self.peak, float(np.max(np.abs(block))))
+        weighted, self._zi = sosfilt(self.sos, block, axis=0, zi=self._zi)
+        weighted = np.concatenate([self._pending, weighted])
+        
+        # Энергия полных 100-мс шагов (сумма по каналам с весом 1.0 для L/R)
+        num_steps = len(weighted) // self.step_samples
+        if not num_steps:
+            # Меньше одного шага - копим до следующего блока
+            self._pending = weighted
+            return
+        full = weighted[:num_steps * self.step_samples]
+        energy = (full ** 2).reshape(num_steps, self.step_samples, -1).mean(axis=1).sum(axis=1)
+        self._step_energy.extend(energy.tolist())
+        self._pending = weighted[num_steps * self.step_samples:]
+    
+    def integrated(self) -> float:
+        """Интегральная громкость в LUFS (-inf для тишины)"""
+        steps = np.asarray(self._step_energy)
+        if len(steps) < self.BLOCK_STEPS:
+            steps = np.append(steps, (self._pending ** 2).mean(axis=0).sum() if len(self._pending) else 0.0)
+            blocks = np.array([steps.mean()])
+        else:
+            blocks = np.convolve(steps, np.full(self.BLOCK_STEPS, 1.0 / self.BLOCK_STEPS), mode='valid')
+        
+        with np.errstate(divide='ignore'):
+            block_loudness = -0.691 + 10 * np.log10(blocks)
+        
+        gated = blocks[block_loudness > self.ABSOLUTE_GATE]
+        if not len(gated):
+            return float('-inf')
+        
+        relative_gate = -0.691 + 10 * np.log10(gated.mean()) + self.RELATIVE_GATE
+        gated = blocks[block_loudness > max(relative_gate, self.ABSOLUTE_GATE)]
+        return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def loudness_gain(loudness: float, peak: float, target_lufs: float, true_peak_db: float) -> float:
+    """
+    Линейное усиление до целевой громкости с ограничением пика (аналог loudnorm linear)
+    
+    Args:
+        loudness: Измеренная громкость (LUFS)
+        peak: Пиковая амплитуда
+        target_lufs: Целевая громкость (LUFS)
+        true_peak_db: Максимальный пик (dBFS)
+    
+    Returns:
+        float: Коэффициент усиления
+    """
+    if not np.isfinite(loudness) or peak <= 0:
+        return 1.0
+    
+    gain = 10 ** ((target_lufs - loudness) / 20)
+    return min(gain, 10 ** (true_peak_db / 20) / peak)
+
+
+class Equalizer:
+    """Каскад колокольных эквалайзеров через sosfilt"""
+    
+    def __init__(self, bands: Iterable[Tuple[float, float, float]], sample_rate: int, channels: int):
+        """
+        Args:
+            bands: Полосы (частота, ширина в Гц, усиление в дБ)
+            sample_rate: Частота дискретизации
+            channels: Количество каналов
+        """
+        self.sos = np.array([peaking_eq_sos(f, w, g, sample_rate) for f, w, g in bands])
+        self._zi = np.zeros((len(self.sos), 2, channels))
+    
+    def process(self, block: np.ndarray) -> np.ndarray:
+        filtered, self._zi = sosfilt(self.sos, block, axis=0, zi=self._zi)
+        return filtered
+
+
+class Compressor:
+    """
+    Компрессор с RMS-детектором и мягким коленом (аналог acompressor)
+    
+    Огибающая атаки/релиза считается на управляющей частоте (раз в HOP сэмплов),
+    а кусочно-постоянное усиление сглаживается однополюсным фильтром.
+    """
+    
+    HOP = 64
+    DETECTOR_TIME = 0.002   # Постоянная времени RMS-детектора (с)
+    GAIN_SMOOTHING = 0.001  # Сглаживание ступенек усиления (с)
+    KNEE = 2.82843          # Ширина колена (линейно, как в FFmpeg)
+    
+    def __init__(self, sample_rate: int, threshold: float, ratio: float,
+                 attack: float, release: float, makeup: float = 1.0):
+        """
+        Args:
+            sample_rate: Частота дискретизации
+            threshold: Порог (линейно)
+            ratio: Степень сжатия
+            attack: Время атаки (мс)
+            release: Время релиза (мс)
+            makeup: Компенсирующее усиление (линейно)
+        """
+        self.threshold_db = 20 * np.log10(threshold)
+        self.ratio = ratio
+        self.knee_db = 20 * np.log10(self.KNEE)
+        self.makeup = makeup
+        self.attack_coef = np.exp(-self.HOP / (attack / 1000 * sample_rate))
+        self.release_coef = np.exp(-self.HOP / (release / 1000 * sample_rate))
+        
+        detector = np.exp(-1.0 / (self.DETECTOR_TIME * sample_rate))
+        self._detector_ba = ([1 - detector], [1, -detector])
+        smoothing = np.exp(-1.0 / (self.GAIN_SMOOTHING * sample_rate))
+        self._smoothing_ba = ([1 - smoothing], [1, -smoothing])
+        
+        self._detector_zi = np.zeros(1)
+        self._smoothing_zi = np.array([smoothing])  # Стартуем с усиления 1.0
+        self._envelope_db = -120.0
+        self._frame_gain = 1.0
+        self._position = 0
+    
+    def gain_reduction_db(self, level_db: np.ndarray) -> np.ndarray:
+        """Статическая характеристика с мягким коленом (дБ, <= 0)"""
+        overshoot = level_db - self.threshold_db
+        slope = 1.0 / self.ratio - 1.0
+        half_knee = self.knee_db / 2
+        knee_gain = slope * (overshoot + half_knee) ** 2 / (2 * self.knee_db)
+        return np.where(overshoot <= -half_knee, 0.0,
+                        np.where(overshoot >= half_knee, slope * overshoot, knee_gain))
+    
+    def process(self, block: np.ndarray) -> np.ndarray:
+        num_frames = len(block)
+        if not num_frames:
+            return block
+        
+        # Средний квадрат по каналам (link=average)
+        power = np.mean(block ** 2, axis=1)
+        power, self._detector_zi = lfilter(*self._detector_ba, power, zi=self._detector_zi)
+        
+        # Управляющие точки - сэмплы с глобальным индексом, кратным HOP
+        first = (-self._position) % self.HOP
+        control_idx = np.arange(first, num_frames, self.HOP)
+        level_db = 10 * np.log10(np.maximum(power[control_idx], 1e-12))
+        
+        envelope = np.empty(len(control_idx))
+        envelope_db = self._envelope_db
+        for i, level in enumerate(level_db):
+            coef = self.attack_coef if level > envelope_db else self.release_coef
+            envelope_db = level + coef * (envelope_db - level)
+            envelope[i] = envelope_db
+        self._envelope_db = envelope_db
+        
+        frame_gains = 10 ** (self.gain_reduction_db(envelope) / 20)
+        
+        # Кусочно-постоянное усиление: до первой управляющей точки действует предыдущее
+        segment_gains = np.concatenate([[self._frame_gain], frame_gains])
+        segment_lengths = np.diff(np.concatenate([[0], control_idx, [num_frames]]))
+        gain = np.repeat(segment_gains, segment_lengths)
+        gain, self._smoothing_zi = lfilter(*self._smoothing_ba, gain, zi=self._smoothing_zi)
+        
+        if len(frame_gains):
+            self._frame_gain = frame_gains[-1]
+        self._position += num_frames
+        
+        return block * (gain * self.makeup).astype(np.float32)[:, None]
+
+
+class Chorus:
+    """Хорус с синусной модуляцией задержки (аналог chorus в FFmpeg, один голос)"""
+    
+    def __init__(self, sample_rate: int, in_gain: float, out_gain: float,
+                 delay: float, decay: float, speed: float, depth: float, channels: int):
+        """
+        Args:
+            sample_rate: Частота дискретизации
+            in_gain: Усиление сухого сигнала
+            out_gain: Выходное усиление
+            delay: Задержка (мс)
+            decay: Уровень задержанного голоса
+            speed: Частота модуляции (Гц)
+            depth: Глубина модуляции (мс)
+            channels: Количество каналов
+        """
+        self.in_gain = in_gain
+        self.out_gain = out_gain
+        self.decay = decay
+        self.delay_samples = delay / 1000 * sample_rate
+        self.depth_samples = depth / 1000 * sample_rate
+        self.phase_step = 2 * np.pi * speed / sample_rate
+        self.max_delay = int(np.ceil(self.delay_samples + self.depth_samples)) + 1
+        self._history = np.zeros((self.max_delay, channels), dtype=np.float32)
+        self._position = 0
+    
+    def process(self, block: np.ndarray) -> np.ndarray:
+        num_frames = len(block)
+        buffer = np.concatenate([self._history, block])
+        
+        positions = np.arange(self._position, self._position + num_frames)
+        delay = self.delay_samples + self.depth_samples * (1 + np.sin(self.phase_step * positions)) / 2
+        read = np.arange(num_frames) + self.max_delay - delay
+        index = np.floor(read).astype(np.int64)
+        fraction = (read - index)[:, None].astype(np.float32)
+        delayed = buffer[index] * (1 - fraction) + buffer[index + 1] * fraction
+        
+        self._history = buffer[len(buffer) - self.max_delay:]
+        self._position += num_frames
+        return (block * self.in_gain + delayed * self.decay) * self.out_gain
+
+
+class Tremolo:
+    """Амплитудная модуляция (аналог tremolo в FFmpeg)"""
+    
+    def __init__(self, sample_rate: int, frequency: float, depth: float):
+        self.phase_step = frequency / sample_rate
+        self.offset = 1 - depth / 2
+        self._position = 0
+    
+    def process(self, block: np.ndarray) -> np.ndarray:
+        positions = np.arange(self._position, self._position + len(block))
+        self._position += len(block)
+        phase = np.mod(positions * self.phase_step + 0.25, 1.0).astype(np.float32)
+        gain = np.sin(np.float32(2 * np.pi) * phase) * np.float32(1 - abs(self.offset)) + np.float32(self.offset)
+        return block * gain[:, None]
+
+
+class Overdrive:
+    """Мягкий кубический овердрайв с блокировкой постоянной составляющей (как overdrive в SoX)"""
+    
+    DC_BLOCKER_B = np.array([1.0, -1.0], dtype=np.float32)
+    DC_BLOCKER_A = np.array([1.0, -0.995], dtype=np.float32)
+    
+    def __init__(self, gain_db: float, colour: float, channels: int):
+        """
+        Args:
+            gain_db: Входное усиление (дБ)
+            colour: Доля четных гармоник (0-100)
+            channels: Количество каналов
+        """
+        self.gain = 10 ** (gain_db / 20)
+        self.colour = colour / 200
+        self._zi = np.zeros((1, channels), dtype=np.float32)
+    
+    def process(self, block: np.ndarray) -> np.ndarray:
+        # x - x^3/3 на [-1, 1], за пределами - насыщение на ±2/3
+        clipped = np.clip(block * np.float32(self.gain) + np.float32(self.colour), -1.0, 1.0)
+        clipped -= clipped * clipped * clipped * np.float32(1 / 3)
+        output, self._zi = lfilter(self.DC_BLOCKER_B, self.DC_BLOCKER_A, clipped, axis=0, zi=self._zi)
+        return output
+
+
+class MasteringChain:
+    """Поблочная цепочка эффектов пианино (все этапы между двумя loudnorm)"""
+    
+    def __init__(self, sample_rate: int, channels: int = 1, input_gain: float = 1.0,
+                 reverb: Optional[ConvolutionReverb] = None):
+        """
+        Args:
+            sample_rate: Частота дискретизации
+            channels: Количество каналов
+            input_gain: Усиление первой нормализации громкости
+            reverb: Реверберация (None - без реверберации)
+        """
+        self.input_gain = input_gain
+        stages = [
+            # Мягкая компрессия для пианино (более естественная)
+            Compressor(sample_rate, threshold=0.15, ratio=1.8, attack=5, release=50, makeup=2),
+            # Эквалайзер для реалистичной частотной характеристики пианино
+            Equalizer([
+                (60, 40, 4),        # Глубокие басы
+                (120, 80, 3),       # Низкие средние
+                (250, 120, 2.5),    # Средние басы
+                (500, 200, 2),      # Средние частоты
+                (1000, 400, 1.5),   # Высокие средние
+                (2000, 600, 1),     # Присутствие
+                (4000, 800, 0.8),   # Яркость
+                (8000, 1200, 0.5),  # Воздух
+            ], sample_rate, channels),
+            # Сверточная реверберация комнаты (вместо каскада aecho)
+            reverb,
+            # Легкий хорус для богатства звука
+            Chorus(sample_rate, 0.4, 0.6, delay=60, decay=0.4, speed=0.3, depth=1.2, channels=channels),
+            # Легкое тремоло для живости
+            Tremolo(sample_rate, frequency=5.5, depth=0.08),
+            # Легкий дисторшн для реализма
+            Overdrive(gain_db=8, colour=0.2, channels=channels),
+        ]
+        self.stages = [stage for stage in stages if stage is not None]
+    
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Обрабатывает очередной блок
+        
+        Args:
+            block: Аудио (frames, channels)
+        
+        Returns:
+            np.ndarray: Обработанный блок (float32)
+        """
+        output = np.asarray(block, dtype=np.float32) * np.float32(self.input_gain)
+        for stage in self.stages:
+            # Между этапами держим float32 (IIR фильтры внутри считают в float64)
+            output = stage.process(output).astype(np.float32, copy=False)
+        return output
+
+
+class PianoMastering:
+    """Мастеринг синтезированного пианино без FFmpeg"""
+    
+    BLOCK_SIZE = 65536
+    
+    # Нормализация громкости до и после цепочки эффектов (как loudnorm в enhance_audio)
+    INPUT_LUFS, INPUT_TRUE_PEAK = -18.0, -2.0
+    OUTPUT_LUFS, OUTPUT_TRUE_PEAK = -16.0, -1.5
+    OUTPUT_CHANNELS = 2
+    
+    def __init__(self, config, logger: Optional[logging.Logger] = None):
+        self.config = config
+        self.logger = logger or logging.getLogger(__name__)
+    
+    def _make_chain(self, sample_rate: int, channels: int, input_gain: float) -> MasteringChain:
+        reverb = None
+        if self.config.reverb_room:
+            reverb = ConvolutionReverb.for_room(
+                self.config.reverb_room, sample_rate, channels, wet=self.config.reverb_wet,
+                cache_dir=self.config.get_path('cache_dir'), logger=self.logger
+            )
+        return MasteringChain(sample_rate, channels, input_gain, reverb)
+    
+    def _measure(self, blocks: Iterable[np.ndarray], sample_rate: int, channels: int) -> Tuple[float, float]:
+        meter = LoudnessMeter(sample_rate, channels)
+        for block in blocks:
+            meter.update(block)
+        return meter.integrated(), meter.peak
+    
+    def _to_output(self, block: np.ndarray, gain: float) -> np.ndarray:
+        block = np.clip(block * np.float32(gain), -1.0, 1.0)
+        if block.shape[1] == 1:
+            block = np.repeat(block, self.OUTPUT_CHANNELS, axis=1)
+        return block
+    
+    def _read_blocks(self, path: Path, frames: int) -> Iterable[np.ndarray]:
+        import soundfile as sf
+        
+        return sf.blocks(str(path), blocksize=self.BLOCK_SIZE, frames=frames, dtype='float32', always_2d=True)
+    
+    def _master_measured(self, input_path: Path, output_path: Path, frames: int, sample_rate: int,
+                         channels: int, loudness: float, peak: float):
+        """
+        Проходы 2-3 по входу с измеренной громкостью
+        
+        Проход 2 применяет цепочку эффектов во временный float WAV с измерением
+        громкости, проход 3 нормализует результат и пишет стерео PCM_16.
+        """
+        import soundfile as sf
+        
+        output_path = Path(output_path)
+        processed_path = output_path.parent / f"{output_path.stem}.master.tmp.wav"
+        
+        try:
+            chain = self._make_chain(sample_rate, channels,
+                                     loudness_gain(loudness, peak, self.INPUT_LUFS, self.INPUT_TRUE_PEAK))
+            
+            meter = LoudnessMeter(sample_rate, channels)
+            with sf.SoundFile(str(processed_path), 'w', samplerate=sample_rate,
+                              channels=channels, subtype='FLOAT') as processed_file:
+                for block in self._read_blocks(input_path, frames):
+                    processed = chain.process(block)
+                    meter.update(processed)
+                    processed_file.write(processed)
+            
+            gain = loudness_gain(meter.integrated(), meter.peak, self.OUTPUT_LUFS, self.OUTPUT_TRUE_PEAK)
+            output_channels = self.OUTPUT_CHANNELS if channels == 1 else channels
+            with sf.SoundFile(str(output_path), 'w', samplerate=sample_rate,
+                              channels=output_channels, subtype='PCM_16') as output_file:
+                for block in self._read_blocks(processed_path, frames):
+                    output_file.write(self._to_output(block, gain))
+        finally:
+            if processed_path.exists():
+                processed_path.unlink()
+        
+        self.logger.info(f"Мастеринг выполнен: {output_path} "
+                         f"(громкость входа {loudness:.1f} LUFS, выходное усиление {20 * np.log10(gain):+.1f} дБ)")
+    
+    def master_file(self, input_path: Path, output_path: Path, max_duration: Optional[float] = None) -> bool:
+        """
+        Мастеринг WAV файла поблочно (память не зависит от длины трека)
+        
+        Проход 1 измеряет громкость входа, проходы 2-3 - как в _master_measured.
+        
+        Args:
+            input_path: Путь к исходному аудио
+            output_path: Путь для сохранения результата
+            max_duration: Обрезать результат до этой длительности (сек)
+        
+        Returns:
+            bool: True если успешно
+        """
+        import soundfile as sf
+        
+        try:
+            info = sf.info(str(input_path))
+            sample_rate, channels = info.samplerate, info.channels
+            frames = info.frames
+            if max_duration:
+                frames = min(frames, int(max_duration * sample_rate))
+            
+            loudness, peak = self._measure(self._read_blocks(input_path, frames), sample_rate, channels)
+            self._master_measured(input_path, output_path, frames, sample_rate, channels, loudness, peak)
+        except Exception as e:
+            self.logger.error(f"Ошибка мастеринга аудио: {e}")
+            return False
+        
+        return True
+    
+    def master_blocks(self, blocks: Iterable[np.ndarray], output_path: Path, sample_rate: int,
+                      channels: int = 1, max_duration: Optional[float] = None) -> bool:
+        """
+        Мастеринг потока блоков синтеза (память не зависит от длины трека)
+        
+        Вход нужен дважды (громкость известна только в конце), поэтому проход 1
+        измеряет громкость блоков и сбрасывает их во временный float WAV, по
+        которому идут проходы 2-3.
+        
+        Args:
+            blocks: Блоки аудио (float32, моно или frames x channels)
+            output_path: Путь для сохранения результата
+            sample_rate: Частота дискретизации
+            channels: Количество каналов блоков
+            max_duration: Обрезать результат до этой длительности (сек)
+        
+        Returns:
+            bool: True если успешно
+        """
+        import soundfile as sf
+        
+        output_path = Path(output_path)
+        input_path = output_path.parent / f"{output_path.stem}.input.tmp.wav"
+        frames_left = int(max_duration * sample_rate) if max_duration else None
+        
+        try:
+            meter = LoudnessMeter(sample_rate, channels)
+            frames = 0
+            with sf.SoundFile(str(input_path), 'w', samplerate=sample_rate,
+                              channels=channels, subtype='FLOAT') as input_file:
+                for block in blocks:
+                    block = np.asarray(block, dtype=np.float32).reshape(len(block), channels)
+                    if frames_left is not None:
+                        block = block[:frames_left - frames]
+                    meter.update(block)
+                    input_file.write(block)
+                    frames += len(block)
+            
+            self._master_measured(input_path, output_path, frames, sample_rate, channels,
+                                  meter.integrated(), meter.peak)
+        except Exception as e:
+            self.logger.error(f"Ошибка мастеринга аудио: {e}")
+            return False
+        finally:
+            if input_path.exists():
+                input_path.unlink()
+        
+        return True
@@ -0,0 +1,111 @@
+"""
+Трекер мелодии по гармонической сумме в диапазоне пианино
+
+piptrack ищет пики по всему STFT (до частоты Найквиста), хотя мелодия
+потом берется только из узкого диапазона нот. Здесь спектр на
+логарифмической сетке частот считается только для нужных нот и их первых
+гармоник, бины каждой ноты центрированы на ее частоте, а гармоническая
+сумма поднимает основной тон над обертонами. Спектр берется из общего STFT
+(пересэмплирование по частоте) или из отдельного constant-Q преобразования
+со своим шагом. Выход - одна доминирующая нота на кадр, в том же виде
+(частоты, амплитуды), что и у piptrack.
+"""
+import logging
+from typing import Optional, Tuple
+import numpy as np
+import librosa
+from .audio_features import AudioFeatures
+
+
+class MelodyTracker:
+    """Доминирующая нота каждого кадра по гармонической сумме"""
+    
+    def __init__(self, note_range: Tuple[int, int] = (48, 84), bins_per_semitone: int = 3,
+                 transform: str = 'stft', hop_length: Optional[int] = None, num_harmonics: int = 4,
+                 harmonic_decay: float = 0.8, logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            note_range: Диапазон MIDI нот мелодии (нижняя, верхняя) включительно
+            bins_per_semitone: Бинов на полутон (нечетное - центральный бин на частоте ноты)
+            transform: Спектр: 'stft' (общий STFT, его шаг) или 'cqt' (constant-Q, шаг hop_length)
+            hop_length: Шаг кадров CQT в отсчетах (None - шаг STFT)
+            num_harmonics: Количество гармоник в сумме (включая основной тон)
+            harmonic_decay: Вес каждой следующей гармоники относительно предыдущей
+            logger: Логгер для вывода информации
+        """
+        if transform not in ('stft', 'cqt'):
+            raise ValueError(f"Неизвестное преобразование трекера мелодии: {transform}")
+        if bins_per_semitone < 1:
+            raise ValueError(f"bins_per_semitone должно быть не меньше 1: {bins_per_semitone}")
+        
+        self.lowest_note, self.highest_note = note_range
+        self.bins_per_semitone = bins_per_semitone
+        self.transform = transform
+        self.hop_length = hop_length
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self.bins_per_octave = 12 * bins_per_semitone
+        self.num_notes = self.highest_note - self.lowest_note + 1
+        # Смещения гармоник в бинах CQT и их веса
+        harmonics = np.arange(1, num_harmonics + 1)
+        self.harmonic_offsets = np.round(self.bins_per_octave * np.log2(harmonics)).astype(int)
+        self.harmonic_weights = harmonic_decay ** (harmonics - 1)
+    
+    def salience(self, features: AudioFeatures) -> np.ndarray:
+        """
+        Гармоническая сумма спектра, сведенная к нотам
+        
+        Args:
+            features: Признаки сигнала (спектр кэшируется в них)
+        
+        Returns:
+            np.ndarray: Выраженность нот (ноты диапазона, кадры)
+        """
+        note_bins = self.num_notes * self.bins_per_semitone
+        # Нижний бин сдвинут так, чтобы бины ноты стояли симметрично вокруг ее частоты
+        fmin = librosa.midi_to_hz(self.lowest_note - (self.bins_per_semitone // 2) / self.bins_per_semitone)
+        
+        # Гармоники, которые выше частоты Найквиста, не учитываются
+        max_bins = int(np.floor(self.bins_per_octave * np.log2(features.sr / 2 / fmin)))
+        usable = note_bins + self.harmonic_offsets <= max_bins
+        offsets = self.harmonic_offsets[usable]
+        weights = self.harmonic_weights[usable]
+        
+        n_bins = note_bins + int(offsets[-1])
+        if self.transform == 'cqt':
+            spectrum = features.cqt(fmin, n_bins, self.bins_per_octave, self.hop_length)
+        else:
+            spectrum = features.log_frequency(fmin, n_bins, self.bins_per_octave)
+        with features.timed('melody'):
+            summed = np.zeros((note_bins, spectrum.shape[1]), dtype=spectrum.dtype)
+            for offset, weight in zip(offsets.tolist(), weights.tolist()):
+                summed += weight * spectrum[offset:offset + note_bins]
+            
+            # Выраженность ноты - максимум по ее бинам (допуск на расстройку до полутона)
+            return summed.reshape(self.num_notes, self.bins_per_semitone, -1).max(axis=1)
+    
+    def track(self, features: AudioFeatures) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Находит доминирующую ноту каждого кадра
+        
+        Args:
+            features: Признаки сигнала
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (частоты нот в Hz, выраженность - ненормированная
+                гармоническая сумма), обе размера (1, кадры)
+        """
+        salience = self.salience(features)
+        with features.timed('melody'):
+            note_idx = np.argmax(salience, axis=0)
+            strength = salience[note_idx, np.arange(salience.shape[1])]
+            
+            # Частота ноты; в тишине (нулевая выраженность) - 0, как у piptrack
+            pitches = np.where(strength > 0, librosa.midi_to_hz(self.lowest_note + note_idx), 0.0)
+        return pitches[np.newaxis], strength[np.newaxis]
+    
+    def frames(self, features: AudioFeatures, times: np.ndarray, num_frames: int) -> np.ndarray:
+        """Переводит времена в ближайшие кадры трекера (в пределах num_frames)"""
+        hop_length = self.hop_length if self.transform == 'cqt' and self.hop_length else features.hop_length
+        frames = np.round(np.asarray(times) * features.sr / hop_length).astype(int)
+        return np.clip(frames, 0, max(num_frames - 1, 0))
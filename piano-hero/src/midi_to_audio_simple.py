@@ -3,36 +3,97 @@
 Использует FFmpeg для создания простого тонального аудио
 """
 import logging
+import zlib
+from functools import partial
 import numpy as np
 from pathlib import Path
-from typing import Optional
-import pretty_midi
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+from scipy.signal import lfilter, lfiltic
+from .mastering import PianoMastering
+from .notes import NoteArray, load_notes
+from .parallel_render import render_voices_parallel
+from .reverb import apply_reverb_file
+from .sample_bank import SampleBank
+from .tone_cache import ToneCache
+from .tone_scratch import ToneScratch
+from .tone_tables import get_tone_tables
 from .utils import run_command
 
+T = TypeVar('T')
+
 
 class SimpleMidiToAudioConverter:
     """Упрощенный класс для синтеза аудио из MIDI"""
     
+    # Реалистичные гармоники пианино (на основе анализа настоящих пианино):
+    # (номер гармоники, амплитуда, расстройка)
+    HARMONICS = [
+        (2, 0.7, 0.0003),    # Октава с легким расстройом
+        (3, 0.5, 0.0005),    # Квинта
+        (4, 0.35, 0.0007),   # Двойная октава
+        (5, 0.25, 0.0009),   # Большая терция
+        (6, 0.18, 0.0011),   # Квинта + октава
+        (7, 0.12, 0.0013),   # Малая септима
+        (8, 0.08, 0.0015),   # Тройная октава
+        (9, 0.05, 0.0017),   # Девятая гармоника
+        (10, 0.03, 0.0019),  # Десятая гармоника
+    ]
+    
+    # Пианино имеет характерные расстроенные обертоны
+    INHARMONIC_FACTORS = [1.0002, 1.0004, 1.0006, 1.0008]
+    
+    # Дополнительные частоты от резонанса соседних струн и деки
+    RESONANCE_RATIOS = [
+        0.5,   # Субгармоника
+        1.5,   # Полтора тона
+        2.5,   # Два с половиной тона
+        3.5,   # Три с половиной тона
+    ]
+    
+    # Дека пианино добавляет свои резонансы
+    SOUNDBOARD_RATIOS = [0.25, 0.75, 1.25]
+    
+    # Длина блока при суммировании парциалов (в сэмплах)
+    PARTIAL_CHUNK_SIZE = 512
+    
     def __init__(self, config, logger: Optional[logging.Logger] = None):
         self.config = config
         self.logger = logger or logging.getLogger(__name__)
+        self.tone_cache = ToneCache(
+            max_bytes=int(config.tone_cache_mb * 1024 * 1024),
+            duration_step=config.tone_cache_duration_step
+        )
+        self.sample_bank = SampleBank.from_config(config, self.logger) if config.sample_bank_enabled else None
+        self.synth_seed = config.synth_seed
+        self.mastering = PianoMastering(config, self.logger)
+        self.partial_ratios, partial_amplitudes = self.build_partial_ratios()
+        # Амплитуды в форме базиса блока (для каждого смещения: cos- и sin-столбцы),
+        # чтобы умножение на них было поэлементным, без broadcasting
+        self.partial_amplitudes = np.tile(np.concatenate([partial_amplitudes, partial_amplitudes]),
+                                          (self.PARTIAL_CHUNK_SIZE, 1))
+        self.tone_scratch = ToneScratch(self.PARTIAL_CHUNK_SIZE, len(self.partial_ratios))
     
     def midi_note_to_frequency(self, midi_note: int) -> float:
         """Конвертирует MIDI ноту в частоту"""
         return 440.0 * (2 ** ((midi_note - 69) / 12.0))
     
-    def create_tone_audio(self, frequency: float, duration: float, sample_rate: int = 44100, note_type: str = "melody") -> np.ndarray:
+    def create_tone_audio(self, frequency: float, duration: float, sample_rate: int = 44100, note_type: str = "melody",
+                          out: Optional[np.ndarray] = None) -> np.ndarray:
         """
         Создает максимально реалистичный звук пианино с продвинутым физическим моделированием
         
+        Все промежуточные сигналы считаются в float32 на месте (out=) в буферах
+        self.tone_scratch, поэтому синтез ноты не выделяет память, кроме результата.
+        
         Args:
             frequency: Частота в Hz
             duration: Длительность в секундах
             sample_rate: Частота дискретизации
             note_type: Тип ноты (melody, chord, bass)
+            out: Буфер float32 для результата (не короче ноты); None - создать новый
         
         Returns:
-            np.ndarray: Аудио сигнал
+            np.ndarray: Аудио сигнал (срез out, если он передан)
         """
         if duration <= 0:
             return np.array([])
@@ -42,71 +103,47 @@ class SimpleMidiToAudioConverter:
         if num_samples <= 0:
             return np.array([])
         
+        scratch = self.tone_scratch
+        scratch.reserve(num_samples)
+        tone = np.empty(num_samples, dtype=np.float32) if out is None else out[:num_samples]
+        work = scratch.work[:num_samples]
+        
         # Временная ось
-        t = np.linspace(0, duration, num_samples, dtype=np.float32)
+        time_step = duration / (num_samples - 1) if num_samples > 1 else 0.0
+        t = np.multiply(scratch.ramp[:num_samples], np.float32(time_step), out=scratch.t[:num_samples])
         
-        # 1. МОДЕЛИРОВАНИЕ УДАРА МОЛОТКА (Hammer Attack)
-        # Более реалистичный удар молоточка с несколькими компонентами
-        hammer_attack_1 = np.exp(-t * 80) * np.sin(2 * np.pi * frequency * t * 3) * 0.4
-        hammer_attack_2 = np.exp(-t * 120) * np.sin(2 * np.pi * frequency * t * 5) * 0.2
-        hammer_attack = hammer_attack_1 + hammer_attack_2
+        # Кривые затухания и шум берутся срезами из общих таблиц
+        tables = get_tone_tables(sample_rate)
+        
+        # 3-5. ГАРМОНИКИ, НЕГАРМОНИЧЕСКИЕ ОБЕРТОНЫ, РЕЗОНАНС СТРУН И ДЕКИ
+        # Все синусоиды без собственной огибающей считаются одной таблицей парциалов
+        partial_omegas, partial_amplitudes = self.get_partial_table(frequency)
+        partials = self.sum_partials(num_samples, time_step, partial_omegas, partial_amplitudes)
         
         # 2. ОСНОВНОЙ ТОН С РЕАЛИСТИЧНЫМИ ГАРМОНИКАМИ
-        # Основной тон с легким вибрато
+        # Основной тон с легким вибрато: sin(2pi * f * t * (1 + 0.001 * sin(2pi * 0.5 * t)))
         fundamental_vibrato = 0.5  # Hz
-        fundamental = np.sin(2 * np.pi * frequency * t * (1 + 0.001 * np.sin(2 * np.pi * fundamental_vibrato * t)))
-        
-        # Реалистичные гармоники пианино (на основе анализа настоящих пианино)
-        harmonics = [
-            (2, 0.7, 0.0003),    # Октава с легким расстройом
-            (3, 0.5, 0.0005),    # Квинта
-            (4, 0.35, 0.0007),   # Двойная октава
-            (5, 0.25, 0.0009),   # Большая терция
-            (6, 0.18, 0.0011),   # Квинта + октава
-            (7, 0.12, 0.0013),   # Малая септима
-            (8, 0.08, 0.0015),   # Тройная октава
-            (9, 0.05, 0.0017),   # Девятая гармоника
-            (10, 0.03, 0.0019),  # Десятая гармоника
-        ]
-        
-        main_tone = fundamental
-        for harmonic_freq, amplitude, detune in harmonics:
-            # Добавляем небольшое расстройство для реализма
-            detuned_freq = frequency * harmonic_freq * (1 + detune)
-            harmonic = np.sin(2 * np.pi * detuned_freq * t) * amplitude
-            main_tone += harmonic
-        
-        # 3. НЕГАРМОНИЧЕСКИЕ ОБЕРТОНЫ (Inharmonicity)
-        # Пианино имеет характерные расстроенные обертоны
-        inharmonic_factors = [1.0002, 1.0004, 1.0006, 1.0008]
-        inharmonic_tone = np.zeros_like(t)
-        for i, factor in enumerate(inharmonic_factors):
-            inharmonic = np.sin(2 * np.pi * frequency * factor * t) * (0.08 - i * 0.02)
-            inharmonic_tone += inharmonic
-        
-        # 4. РЕЗОНАНС СТРУН И ДЕКИ (String and Soundboard Resonance)
-        # Дополнительные частоты от резонанса соседних струн и деки
-        resonance_freqs = [
-            frequency * 0.5,   # Субгармоника
-            frequency * 1.5,   # Полтора тона
-            frequency * 2.5,   # Два с половиной тона
-            frequency * 3.5,   # Три с половиной тона
-        ]
-        resonance_tone = np.zeros_like(t)
-        for i, res_freq in enumerate(resonance_freqs):
-            resonance = np.sin(2 * np.pi * res_freq * t) * (0.06 - i * 0.01)
-            resonance_tone += resonance
-        
-        # 5. МОДЕЛИРОВАНИЕ ДЕКИ (Soundboard Modeling)
-        # Дека пианино добавляет свои резонансы
-        soundboard_freqs = [frequency * 0.25, frequency * 0.75, frequency * 1.25]
-        soundboard_tone = np.zeros_like(t)
-        for sbf in soundboard_freqs:
-            soundboard = np.sin(2 * np.pi * sbf * t) * 0.04
-            soundboard_tone += soundboard
+        np.multiply(t, np.float32(2 * np.pi * fundamental_vibrato), out=work)
+        np.sin(work, out=work)
+        work *= np.float32(0.001)
+        work += np.float32(1.0)
+        work *= t
+        work *= np.float32(2 * np.pi * frequency)
+        np.sin(work, out=work)
         
         # 6. КОМБИНИРУЕМ ВСЕ КОМПОНЕНТЫ
-        tone = hammer_attack + main_tone + inharmonic_tone + resonance_tone + soundboard_tone
+        np.add(work, partials, out=tone)
+        
+        # 1. МОДЕЛИРОВАНИЕ УДАРА МОЛОТКА (Hammer Attack)
+        # Удар молоточка с несколькими компонентами считается только на участке, где он слышен
+        for rate, multiple, level in ((80, 3, 0.4), (120, 5, 0.2)):
+            hammer_decay = tables.decay(rate)
+            hammer_samples = min(num_samples, len(hammer_decay))
+            hammer = np.multiply(t[:hammer_samples], np.float32(2 * np.pi * frequency * multiple), out=work[:hammer_samples])
+            np.sin(hammer, out=hammer)
+            hammer *= hammer_decay[:hammer_samples]
+            hammer *= np.float32(level)
+            tone[:hammer_samples] += hammer
         
         # 7. РЕАЛИСТИЧНАЯ ADSR ОГИБАЮЩАЯ
         if duration < 0.1:
@@ -125,15 +162,17 @@ class SimpleMidiToAudioConverter:
             release_time = max(0.1, release_time)
         
         # Создаем огибающую
-        envelope = np.zeros_like(tone)
+        envelope = scratch.envelope[:num_samples]
+        envelope.fill(0.0)
         
         # Attack фаза (экспоненциальная с небольшим overshoot)
-        attack_samples = int(attack_time * sample_rate)
+        attack_samples = min(int(attack_time * sample_rate), len(envelope))
         if attack_samples > 0:
-            attack_curve = 1 - np.exp(-t[:attack_samples] * 300)
+            attack = envelope[:attack_samples]
+            np.subtract(np.float32(1.0), tables.decay(300)[:attack_samples], out=attack)
             # Добавляем небольшой overshoot для реализма
-            overshoot = 0.1 * np.exp(-t[:attack_samples] * 500)
-            envelope[:attack_samples] = attack_curve + overshoot
+            overshoot = np.multiply(tables.decay(500)[:attack_samples], np.float32(0.1), out=work[:attack_samples])
+            attack += overshoot
         
         # Decay фаза (экспоненциальная)
         decay_samples = int(decay_time * sample_rate)
@@ -141,8 +180,11 @@ class SimpleMidiToAudioConverter:
             decay_start = attack_samples
             decay_end = decay_start + decay_samples
             if decay_end <= len(envelope):
-                decay_t = t[decay_start:decay_end] - t[decay_start]
-                envelope[decay_start:decay_end] = sustain_level + (1.1 - sustain_level) * np.exp(-decay_t * 25)
+                decay_curve = tables.decay(25)[:decay_samples]
+                decay = envelope[decay_start:decay_start + len(decay_curve)]
+                envelope[decay_start:decay_end] = sustain_level
+                np.multiply(decay_curve, np.float32(1.1 - sustain_level), out=work[:len(decay_curve)])
+                decay += work[:len(decay_curve)]
         
         # Sustain фаза
         sustain_start = attack_samples + decay_samples
@@ -155,23 +197,23 @@ class SimpleMidiToAudioConverter:
         if release_samples > 0:
             release_start = len(envelope) - release_samples
             if release_start >= 0:
-                release_t = t[release_start:] - t[release_start]
-                envelope[release_start:] = sustain_level * np.exp(-release_t * 15)
+                # Дальше конца кривой огибающая остается нулевой
+                release_curve = tables.decay(15)[:release_samples]
+                envelope[release_start:] = 0.0
+                np.multiply(release_curve, np.float32(sustain_level),
+                            out=envelope[release_start:release_start + len(release_curve)])
         
         # 8. ПРИМЕНЯЕМ ОГИБАЮЩУЮ
-        tone = tone * envelope
+        tone *= envelope
         
-        # 9. ДОБАВЛЯЕМ РЕАЛИСТИЧНЫЙ ШУМ МОЛОТОЧКА
-        # Шум молоточка более выражен в начале
-        hammer_noise = np.random.normal(0, 0.02, len(tone))
-        noise_envelope = np.exp(-t * 100)  # Шум быстро затухает
-        tone += hammer_noise * noise_envelope
-        
-        # 10. ДОБАВЛЯЕМ ШУМ СТРУН
-        # Легкий шум от вибрации струн
-        string_noise = np.random.normal(0, 0.005, len(tone))
-        string_noise_envelope = np.exp(-t * 20)  # Шум струн затухает медленнее
-        tone += string_noise * string_noise_envelope
+        # 9-10. ДОБАВЛЯЕМ РЕАЛИСТИЧНЫЙ ШУМ МОЛОТОЧКА И СТРУН
+        # Шум молоточка быстро затухает, легкий шум от вибрации струн - медленнее
+        for rate, level in ((100, 0.02), (20, 0.005)):
+            noise_envelope = tables.decay(rate)
+            noise_samples = min(num_samples, len(noise_envelope))
+            noise = np.multiply(tables.noise(noise_samples), np.float32(level), out=work[:noise_samples])
+            noise *= noise_envelope[:noise_samples]
+            tone[:noise_samples] += noise
         
         # 11. ПРОСТАЯ РЕВЕРБЕРАЦИЯ (Echo)
         # Добавляем несколько задержанных копий для пространственности
@@ -179,23 +221,229 @@ class SimpleMidiToAudioConverter:
         for delay in delays:
             delay_samples = int(delay * sample_rate)
             if delay_samples < len(tone):
-                delayed = np.zeros_like(tone)
-                delayed[delay_samples:] = tone[:-delay_samples] * (0.3 / len(delays))
-                tone += delayed
+                # Задержанная копия читается из tone до его изменения
+                delayed = np.multiply(tone[:-delay_samples], np.float32(0.3 / len(delays)), out=work[delay_samples:])
+                tone[delay_samples:] += delayed
         
         # 12. ФИНАЛЬНАЯ ОБРАБОТКА
         # Легкое сжатие для реализма
-        tone = np.tanh(tone * 1.2) * 0.8
+        tone *= np.float32(1.2)
+        np.tanh(tone, out=tone)
+        tone *= np.float32(0.8)
         
         # Нормализуем
-        if np.max(np.abs(tone)) > 0:
-            tone = tone / np.max(np.abs(tone)) * 0.85
+        peak = np.abs(tone, out=work).max()
+        if peak > 0:
+            tone *= np.float32(0.85 / peak)
         
-        return tone.astype(np.float32)
+        return tone
+    
+    def prepare_sample_bank(self, sample_rate: int) -> bool:
+        """
+        Открывает банк сэмплов (собирает его при первом запуске)
+        
+        Args:
+            sample_rate: Частота дискретизации синтеза
+        
+        Returns:
+            bool: True если банк готов к использованию
+        """
+        if self.sample_bank is None:
+            return False
+        
+        if self.sample_bank.sample_rate != sample_rate:
+            self.logger.warning(f"Банк сэмплов собран для {self.sample_bank.sample_rate} Hz, синтез идет в {sample_rate} Hz - банк не используется")
+            return False
+        
+        if not self.sample_bank.ensure(self.create_tone_audio):
+            self.logger.warning("Банк сэмплов недоступен, ноты будут синтезироваться напрямую")
+            self.sample_bank = None
+            return False
+        
+        return True
+    
+    def get_partial_table(self, frequency: float) -> tuple:
+        """
+        Строит таблицу парциалов тона: угловые частоты и амплитуды
+        
+        Args:
+            frequency: Частота основного тона в Hz
+        
+        Returns:
+            tuple: (угловые частоты, амплитуды в форме базиса блока) - угловые частоты лежат в буфере self.tone_scratch
+        """
+        omegas = np.multiply(self.partial_ratios, 2 * np.pi * frequency, out=self.tone_scratch.omegas)
+        return omegas, self.partial_amplitudes
+    
+    @classmethod
+    def build_partial_ratios(cls) -> tuple:
+        """Отношения частот парциалов к основному тону и их амплитуды (float32)"""
+        harmonic_numbers, harmonic_amplitudes, harmonic_detunes = (np.array(column) for column in zip(*cls.HARMONICS))
+        inharmonic_factors = np.array(cls.INHARMONIC_FACTORS)
+        resonance_ratios = np.array(cls.RESONANCE_RATIOS)
+        soundboard_ratios = np.array(cls.SOUNDBOARD_RATIOS)
+        
+        ratios = np.concatenate([
+            harmonic_numbers * (1 + harmonic_detunes),
+            inharmonic_factors,
+            resonance_ratios,
+            soundboard_ratios,
+        ])
+        amplitudes = np.concatenate([
+            harmonic_amplitudes,
+            0.08 - np.arange(len(inharmonic_factors)) * 0.02,
+            0.06 - np.arange(len(resonance_ratios)) * 0.01,
+            np.full(len(soundboard_ratios), 0.04),
+        ])
+        return ratios, amplitudes.astype(np.float32)
+    
+    def sum_partials(self, num_samples: int, time_step: float, omegas: np.ndarray, amplitudes: np.ndarray) -> np.ndarray:
+        """
+        Суммирует синусоиды sum(amplitude * sin(omega * t)) на равномерной сетке t = i * time_step
+        
+        Сигнал режется на блоки длиной PARTIAL_CHUNK_SIZE. Для блока, начинающегося
+        в момент t0, sin(omega * (t0 + tau)) = sin(omega * t0) * cos(omega * tau) + cos(omega * t0) * sin(omega * tau),
+        поэтому синусы и косинусы считаются только для смещений внутри блока
+        и для начал блоков, а сама сумма по всем парциалам и блокам - одно
+        матричное умножение. Все массивы - буферы self.tone_scratch.
+        
+        Args:
+            num_samples: Количество сэмплов
+            time_step: Шаг временной сетки в секундах
+            omegas: Угловые частоты парциалов
+            amplitudes: Амплитуды парциалов в форме базиса блока (PARTIAL_CHUNK_SIZE, 2 * число парциалов), float32
+        
+        Returns:
+            np.ndarray: Сумма парциалов (float32, срез буфера - действует до следующего вызова)
+        """
+        scratch = self.tone_scratch
+        scratch.reserve(num_samples)
+        num_partials = len(omegas)
+        block_size = min(self.PARTIAL_CHUNK_SIZE, num_samples)
+        num_blocks = -(-num_samples // block_size)
+        
+        # Базис внутри блока: [a * cos(omega * tau), a * sin(omega * tau)]
+        # (внешнее произведение - через np.dot: broadcasting ufunc выделяет буферы)
+        block_phase = scratch.block_phase[:block_size]
+        np.dot(scratch.block_offsets[:block_size, None], omegas[None, :], out=block_phase)
+        block_phase *= time_step
+        basis = scratch.basis[:block_size]
+        block_trig = scratch.block_trig[:block_size]
+        np.copyto(basis[:, :num_partials], np.cos(block_phase, out=block_trig))
+        np.copyto(basis[:, num_partials:], np.sin(block_phase, out=block_trig))
+        basis *= amplitudes[:block_size]
+        
+        # Веса блоков: [sin(omega * t0), cos(omega * t0)]
+        start_phase = scratch.start_phase[:num_blocks]
+        np.dot(scratch.block_starts[:num_blocks, None], omegas[None, :], out=start_phase)
+        start_phase *= block_size * time_step
+        weights = scratch.weights[:num_blocks]
+        start_trig = scratch.start_trig[:num_blocks]
+        np.copyto(weights[:, :num_partials], np.sin(start_phase, out=start_trig))
+        np.copyto(weights[:, num_partials:], np.cos(start_phase, out=start_trig))
+        
+        partials = scratch.partials[:num_blocks * block_size].reshape(num_blocks, block_size)
+        np.dot(weights, basis.T, out=partials)
+        return partials.reshape(-1)[:num_samples]
+    
+    def get_note_tone(self, pitch: int, duration: float, sample_rate: int = 44100, note_type: str = "melody") -> np.ndarray:
+        """
+        Возвращает тон для MIDI ноты из банка сэмплов или кэша тонов
+        
+        Ноты, покрытые банком, берутся срезом из него. Остальные синтезируются
+        через кэш: длительность квантуется с шагом кэша, громкость (velocity)
+        не входит в ключ и применяется вызывающим кодом после получения тона.
+        
+        Args:
+            pitch: MIDI нота
+            duration: Длительность в секундах
+            sample_rate: Частота дискретизации
+            note_type: Тип ноты (melody, chord, bass)
+        
+        Returns:
+            np.ndarray: Аудио сигнал (только для чтения, если взят из кэша)
+        """
+        bank = self.sample_bank
+        if (note_type == "melody" and bank is not None and bank.sample_rate == sample_rate
+                and bank.covers(pitch, duration)):
+            return bank.render(pitch, duration)
+        
+        frequency = self.midi_note_to_frequency(pitch)
+        if not self.tone_cache.enabled:
+            self.seed_tone_noise((pitch, int(duration * sample_rate), note_type))
+            return self.create_tone_audio(frequency, duration, sample_rate, note_type)
+        
+        key, cached_duration = self.tone_cache.make_key(pitch, duration, note_type, sample_rate)
+        tone = self.tone_cache.get(key)
+        if tone is None:
+            self.seed_tone_noise(key)
+            tone = self.create_tone_audio(frequency, cached_duration, sample_rate, note_type)
+            self.tone_cache.put(key, tone)
+        
+        return tone
+    
+    def tone_frames(self, pitch: int, duration: float, sample_rate: int = 44100, note_type: str = "melody") -> int:
+        """
+        Длина тона, который вернет get_note_tone, без его синтеза
+        
+        Длина берется из того же источника, что и тон: срез банка сэмплов
+        или квантованная длительность кэша (она может быть длиннее ноты).
+        
+        Args:
+            pitch: MIDI нота
+            duration: Длительность в секундах
+            sample_rate: Частота дискретизации
+            note_type: Тип ноты (melody, chord, bass)
+        
+        Returns:
+            int: Количество сэмплов тона
+        """
+        bank = self.sample_bank
+        if (note_type == "melody" and bank is not None and bank.sample_rate == sample_rate
+                and bank.covers(pitch, duration)):
+            return min(int(duration * sample_rate), bank.max_samples)
+        
+        if self.tone_cache.enabled:
+            _, duration = self.tone_cache.make_key(pitch, duration, note_type, sample_rate)
+        return max(0, int(duration * sample_rate))
+    
+    def seed_tone_noise(self, tone_key: tuple):
+        """
+        Задает зерно генератора шума перед синтезом тона (если задан synth_seed)
+        
+        Зерно зависит только от параметров тона, а не от порядка нот, поэтому
+        результат одинаков при любом количестве процессов и порядке рендера.
+        
+        Args:
+            tone_key: Параметры тона (высота, длительность, тип)
+        """
+        if self.synth_seed is not None:
+            np.random.seed(zlib.crc32(repr((self.synth_seed,) + tuple(tone_key)).encode('utf-8')))
+    
+    def render_voice_tone(self, pitch: int, duration: float, velocity: int, sample_rate: int = 44100) -> np.ndarray:
+        """
+        Рендерер ноты для параллельного режима (громкость применяется движком)
+        
+        Args:
+            pitch: MIDI нота
+            duration: Длительность в секундах
+            velocity: Сила нажатия (не влияет на тембр в этом синтезаторе)
+            sample_rate: Частота дискретизации
+        
+        Returns:
+            np.ndarray: Аудио сигнал
+        """
+        return self.get_note_tone(pitch, duration, sample_rate, "melody")
     
     def create_karplus_strong_tone(self, frequency: float, duration: float, sample_rate: int = 44100) -> np.ndarray:
         """
         Создает тон с использованием алгоритма Karplus-Strong для более реалистичного звука струн
+        
+        Линия задержки заполняется шумом и выдается как есть, после чего каждый
+        следующий сэмпл считается из двух последних выходных сэмплов:
+        y[n] = feedback * (lowpass * y[n-1] + (1 - lowpass) * y[n-2]).
+        Эта рекурсия - IIR фильтр второго порядка, поэтому весь хвост считается
+        одним вызовом lfilter за O(samples) вместо сдвига линии задержки на каждом сэмпле.
         """
         # Длина линии задержки (минимум 1)
         delay_length = max(1, int(sample_rate / frequency))
@@ -211,28 +459,21 @@ class SimpleMidiToAudioConverter:
         feedback = 0.995  # Обратная связь (затухание)
         lowpass_factor = 0.5  # Фактор низкочастотного фильтра
         
-        # Генерируем звук
-        for i in range(output_length):
-            if i < delay_length:
-                # В начале используем шум
-                output[i] = delay_line[i]
+        # В начале используем шум
+        head_length = min(delay_length, output_length)
+        output[:head_length] = delay_line[:head_length]
+        
+        # Хвост - рекурсивный фильтр с начальными условиями из линии задержки
+        if output_length > delay_length:
+            if delay_length > 1:
+                denominator = [1.0, -feedback * lowpass_factor, -feedback * (1 - lowpass_factor)]
+                history = [delay_line[-1], delay_line[-2]]
             else:
-                # Применяем алгоритм Karplus-Strong
-                # Берем значение из конца линии задержки
-                delayed_sample = delay_line[-1]
-                
-                # Применяем низкочастотный фильтр (усреднение с предыдущим сэмплом)
-                if delay_length > 1:
-                    filtered_sample = lowpass_factor * delayed_sample + (1 - lowpass_factor) * delay_line[-2]
-                else:
-                    filtered_sample = delayed_sample
-                
-                # Добавляем обратную связь
-                output[i] = filtered_sample * feedback
-                
-                # Сдвигаем линию задержки
-                delay_line = np.roll(delay_line, -1)
-                delay_line[-1] = output[i]
+                denominator = [1.0, -feedback]
+                history = [delay_line[-1]]
+            
+            initial_state = lfiltic([1.0], denominator, history)
+            output[delay_length:], _ = lfilter([1.0], denominator, np.zeros(output_length - delay_length), zi=initial_state)
         
         # Применяем огибающую для более реалистичного звука
         if len(output) > 0:
@@ -273,110 +514,215 @@ class SimpleMidiToAudioConverter:
             bool: True если успешно
         """
         try:
-            # Загружаем MIDI
-            midi_data = pretty_midi.PrettyMIDI(str(midi_path))
-            
-            # Получаем общую длительность MIDI
-            midi_duration = midi_data.get_end_time()
-            sample_rate = self.config.sample_rate
-            
-            # Определяем целевую длительность
-            # Используем длительность MIDI как основную, так как она более точная
-            final_duration = midi_duration
-            stretch_factor = 1.0
-            self.logger.info(f"Используем длительность MIDI: {midi_duration:.2f}с")
+            self.render_midi(midi_path, lambda blocks, sample_rate: self.write_normalized_audio(blocks, output_path, sample_rate))
+            self.logger.info(f"Аудио синтезировано: {output_path}")
+            return True
             
-            # Создаем массив для аудио с большим буфером для множественных нот
-            audio_length = int(final_duration * sample_rate) + int(2.0 * sample_rate)  # +2 секунды буфера
-            audio = np.zeros(audio_length, dtype=np.float32)
+        except Exception as e:
+            self.logger.error(f"Ошибка синтеза аудио: {e}")
+            return False
+    
+    def render_midi(self, midi_path: Path, consume: Callable[[Iterable[np.ndarray], int], T]) -> T:
+        """
+        Рендерит ноты MIDI файла и передает поток блоков микса обработчику
+        
+        Блоки живут только во время вызова consume (в параллельном режиме это
+        срезы шины в shared memory), поэтому обработчик не должен хранить их.
+        
+        Args:
+            midi_path: Путь к MIDI файлу
+            consume: Обработчик (блоки float32 моно, частота дискретизации)
+        
+        Returns:
+            T: Результат consume
+        """
+        # Загружаем ноты (из файла-спутника, если он есть) и общую длительность MIDI
+        notes, midi_meta = load_notes(midi_path, logger=self.logger)
+        midi_duration = midi_meta['end_time']
+        sample_rate = self.config.sample_rate
+        
+        # Определяем целевую длительность
+        # Используем длительность MIDI как основную, так как она более точная
+        final_duration = midi_duration
+        stretch_factor = 1.0
+        self.logger.info(f"Используем длительность MIDI: {midi_duration:.2f}с")
+        
+        # Итоговая длительность равна длительности MIDI: тишина до target_duration не добавляется
+        total_frames = int(final_duration * sample_rate)
+        
+        self.tone_cache.reset_stats()
+        self.prepare_sample_bank(sample_rate)
+        
+        # Собираем голоса (ноты) всех инструментов, кроме ударных, в порядке начала
+        voices = self.collect_voices(notes, total_frames, sample_rate, stretch_factor)
+        
+        workers = self.config.workers
+        if workers > 1 and voices:
+            # Рендерим шарды нот в пуле процессов в общую шину микса
+            result = render_voices_parallel(
+                voices, total_frames,
+                partial(self.render_voice_tone, sample_rate=sample_rate),
+                partial(self.tone_frames, sample_rate=sample_rate), workers,
+                consume=lambda mix: consume(self.iter_array_blocks(mix), sample_rate),
+                logger=self.logger
+            )
+        else:
+            # Рендерим блоками без буфера на всю песню
+            result = consume(self.render_voice_blocks(voices, total_frames, sample_rate), sample_rate)
+        
+        if self.tone_cache.enabled:
+            self.logger.info(self.tone_cache.stats_message())
+        
+        self.logger.info(f"Ноты отрендерены (длительность: {final_duration:.2f}с)")
+        return result
+    
+    def synthesize_and_master(self, midi_path: Path, output_path: Path, max_duration: Optional[float] = None) -> bool:
+        """
+        Синтезирует MIDI и передает блоки микса прямо в мастеринг (без piano_raw.wav)
+        
+        Args:
+            midi_path: Путь к MIDI файлу
+            output_path: Путь для сохранения результата
+            max_duration: Обрезать результат до этой длительности (сек)
+        
+        Returns:
+            bool: True если успешно
+        """
+        try:
+            return self.render_midi(midi_path, lambda blocks, sample_rate: self.mastering.master_blocks(
+                blocks, output_path, sample_rate, max_duration=max_duration))
+        except Exception as e:
+            self.logger.error(f"Ошибка синтеза аудио: {e}")
+            return False
+    
+    def collect_voices(self, notes: NoteArray, total_frames: int, sample_rate: int, stretch_factor: float = 1.0) -> list:
+        """
+        Превращает ноты в голоса рендера, отсортированные по началу
+        
+        Args:
+            notes: Ноты
+            total_frames: Длина результата в сэмплах
+            sample_rate: Частота дискретизации
+            stretch_factor: Коэффициент растяжения времени
+        
+        Returns:
+            list: Список (start_sample, pitch, duration, velocity, gain)
+        """
+        # Вычисляем длительность нот и позицию в аудио (с учетом растяжения)
+        durations = notes.duration * stretch_factor
+        start_samples = (notes.start * stretch_factor * sample_rate).astype(np.int64)
+        
+        # Пропускаем очень короткие ноты (меньше 0.01 секунды)
+        audible = durations >= 0.01
+        in_bounds = (start_samples >= 0) & (start_samples < total_frames)
+        out_of_bounds = np.count_nonzero(audible & ~in_bounds)
+        if out_of_bounds:
+            self.logger.warning(f"Нот вне границ аудио: {out_of_bounds} (audio_length={total_frames})")
+        
+        keep = np.flatnonzero(audible & in_bounds)
+        keep = keep[np.argsort(start_samples[keep], kind='stable')]
+        velocities = notes.velocity[keep]
+        
+        # Громкость ноты (нормализация velocity)
+        return list(zip(
+            start_samples[keep].tolist(), notes.pitch[keep].tolist(), durations[keep].tolist(),
+            velocities.tolist(), (velocities / 127.0).tolist()
+        ))
+    
+    def render_voice_blocks(self, voices: list, total_frames: int, sample_rate: int) -> Iterator[np.ndarray]:
+        """
+        Полифонический рендер блоками фиксированного размера
+        
+        Тон ноты синтезируется, когда она попадает в текущий блок, и живет
+        в списке активных голосов до своего окончания, поэтому память зависит
+        только от числа одновременно звучащих нот, а не от длины песни.
+        
+        Args:
+            voices: Список (start_sample, pitch, duration, velocity, gain), отсортированный по start_sample
+            total_frames: Длина результата в сэмплах
+            sample_rate: Частота дискретизации
+        
+        Yields:
+            np.ndarray: Очередной блок микса (float32)
+        """
+        block_size = self.config.synth_block_size
+        # Используем один тип нот для всех (как в оригинальном Piano Hero)
+        note_type = "melody"
+        
+        active_voices = []
+        next_voice = 0
+        
+        for block_start in range(0, total_frames, block_size):
+            block_end = min(block_start + block_size, total_frames)
+            block = np.zeros(block_end - block_start, dtype=np.float32)
             
-            # Обрабатываем каждый инструмент
-            for instrument in midi_data.instruments:
-                if instrument.is_drum:
-                    continue
-                
-                # Обрабатываем каждую ноту
-                for note_idx, note in enumerate(instrument.notes):
-                    # Конвертируем MIDI ноту в частоту
-                    frequency = self.midi_note_to_frequency(note.pitch)
-                    
-                    # Вычисляем длительность ноты (с учетом растяжения)
-                    duration = (note.end - note.start) * stretch_factor
-                    
-                    # Пропускаем очень короткие ноты (меньше 0.01 секунды)
-                    if duration < 0.01:
-                        continue
-                    
-                    # Используем один тип нот для всех (как в оригинальном Piano Hero)
-                    note_type = "melody"
-                    
-                    # Создаем тональный сигнал
-                    tone = self.create_tone_audio(frequency, duration, sample_rate, note_type)
-                    
-                    # Вычисляем позицию в аудио массиве (с учетом растяжения)
-                    start_sample = int(note.start * stretch_factor * sample_rate)
-                    
-                    
-                    # Добавляем тон к аудио (с нормализацией velocity)
-                    velocity_factor = note.velocity / 127.0
-                    
-                    # Проверяем границы и обрезаем тон если необходимо
-                    if start_sample >= len(audio):
-                        # Нота начинается после конца аудио
-                        self.logger.warning(f"Нота начинается после конца аудио: start_sample={start_sample}, audio_length={len(audio)}")
-                        continue
-                    
-                    # Определяем сколько сэмплов можно добавить
-                    available_length = len(audio) - start_sample
-                    tone_length = min(len(tone), available_length)
-                    
-                    if tone_length > 0 and start_sample >= 0:
-                        try:
-                            # Убеждаемся, что индексы корректны
-                            end_sample = start_sample + tone_length
-                            if end_sample <= len(audio):
-                                audio[start_sample:end_sample] += tone[:tone_length] * velocity_factor
-                            else:
-                                self.logger.warning(f"Нота выходит за границы аудио: start={start_sample}, end={end_sample}, audio_len={len(audio)}")
-                        except ValueError as e:
-                            self.logger.error(f"Ошибка добавления тона: {e}")
-                            self.logger.error(f"  start_sample={start_sample}, tone_length={tone_length}")
-                            self.logger.error(f"  len(audio)={len(audio)}, len(tone)={len(tone)}")
-                            self.logger.error(f"  available_length={available_length}")
-                            # Пропускаем эту ноту вместо прерывания всего процесса
-                            continue
+            # Активируем ноты, начинающиеся в этом блоке
+            while next_voice < len(voices) and voices[next_voice][0] < block_end:
+                start_sample, pitch, duration, _, gain = voices[next_voice]
+                tone = self.get_note_tone(pitch, duration, sample_rate, note_type)
+                if len(tone) > 0:
+                    active_voices.append((start_sample, tone, gain))
+                next_voice += 1
             
-            # Если нужно растянуть и есть пустое место в конце, добавляем тишину
-            if target_duration and target_duration > midi_duration:
-                # Добавляем тишину в конце
-                silence_samples = int((target_duration - midi_duration) * sample_rate)
-                if silence_samples > 0:
-                    audio = np.pad(audio, (0, silence_samples), mode='constant')
+            # Микшируем пересечение каждого активного голоса с блоком
+            still_active = []
+            for start_sample, tone, gain in active_voices:
+                tone_end = start_sample + len(tone)
+                mix_start = max(block_start, start_sample)
+                mix_end = min(block_end, tone_end)
+                block[mix_start - block_start:mix_end - block_start] += tone[mix_start - start_sample:mix_end - start_sample] * gain
+                if tone_end > block_end:
+                    still_active.append((start_sample, tone, gain))
+            active_voices = still_active
             
-            # Убеждаемся, что аудио имеет правильную длительность
-            expected_length = int(final_duration * sample_rate)
-            if len(audio) != expected_length:
-                if len(audio) < expected_length:
-                    # Добавляем тишину в конце
-                    audio = np.pad(audio, (0, expected_length - len(audio)), mode='constant')
-                else:
-                    # Обрезаем лишнее
-                    audio = audio[:expected_length]
+            yield block
+    
+    def iter_array_blocks(self, audio: np.ndarray) -> Iterator[np.ndarray]:
+        """Нарезает готовый микс на блоки размера synth_block_size (без копирования)"""
+        block_size = self.config.synth_block_size
+        for block_start in range(0, len(audio), block_size):
+            yield audio[block_start:block_start + block_size]
+    
+    def write_normalized_audio(self, blocks: Iterable[np.ndarray], output_path: Path, sample_rate: int) -> float:
+        """
+        Записывает поток блоков в WAV с нормализацией пика до 0.8
+        
+        Пик известен только в конце, поэтому блоки сначала пишутся во временный
+        float WAV, а затем масштабируются вторым проходом тоже блоками.
+        
+        Args:
+            blocks: Блоки аудио (float32, моно)
+            output_path: Путь для сохранения аудио
+            sample_rate: Частота дискретизации
+        
+        Returns:
+            float: Пиковая амплитуда до нормализации
+        """
+        import soundfile as sf
+        
+        output_path = Path(output_path)
+        block_size = self.config.synth_block_size
+        mix_path = output_path.parent / f"{output_path.stem}.mix.tmp.wav"
+        
+        peak = 0.0
+        try:
+            with sf.SoundFile(str(mix_path), 'w', samplerate=sample_rate, channels=1, subtype='FLOAT') as mix_file:
+                for block in blocks:
+                    if len(block):
+                        peak = max(peak, float(np.max(np.abs(block))))
+                    mix_file.write(block)
             
             # Нормализуем аудио
-            if np.max(np.abs(audio)) > 0:
-                audio = audio / np.max(np.abs(audio)) * 0.8
-            
-            # Сохраняем как WAV файл
-            import soundfile as sf
-            sf.write(str(output_path), audio, sample_rate)
-            
-            self.logger.info(f"Аудио синтезировано: {output_path} (длительность: {final_duration:.2f}с)")
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Ошибка синтеза аудио: {e}")
-            return False
+            scale = np.float32(0.8 / peak) if peak > 0 else np.float32(1.0)
+            with sf.SoundFile(str(output_path), 'w', samplerate=sample_rate, channels=1, subtype='PCM_16') as output_file:
+                for block in sf.blocks(str(mix_path), blocksize=block_size, dtype='float32'):
+                    block *= scale
+                    output_file.write(block)
+        finally:
+            if mix_path.exists():
+                mix_path.unlink()
+        
+        return peak
     
     def enhance_audio(self, input_path: Path, output_path: Path) -> bool:
         """
@@ -389,6 +735,19 @@ class SimpleMidiToAudioConverter:
         Returns:
             bool: True если успешно
         """
+        if self.config.mastering_engine == 'numpy':
+            # Та же цепочка в памяти, без подпроцесса FFmpeg
+            return self.mastering.master_file(input_path, output_path)
+        
+        # Реверберация считается сверткой до FFmpeg (вместо каскада aecho)
+        reverb_path = None
+        if self.config.reverb_room:
+            reverb_path = Path(output_path).parent / f"{Path(output_path).stem}.reverb.tmp.wav"
+            if not apply_reverb_file(input_path, reverb_path, self.config.reverb_room, self.config.reverb_wet,
+                                     cache_dir=self.config.get_path('cache_dir'), logger=self.logger):
+                return False
+            input_path = reverb_path
+        
         # Максимально реалистичная цепочка фильтров для пианино
         audio_filters = [
             # Нормализация громкости
@@ -404,10 +763,6 @@ class SimpleMidiToAudioConverter:
             'equalizer=f=2000:width_type=h:width=600:g=1',   # Присутствие
             'equalizer=f=4000:width_type=h:width=800:g=0.8', # Яркость
             'equalizer=f=8000:width_type=h:width=1200:g=0.5', # Воздух
-            # Многократное эхо для реалистичной реверберации
-            'aecho=0.8:0.9:300:0.3',  # Первое эхо
-            'aecho=0.6:0.7:600:0.2',  # Второе эхо
-            'aecho=0.4:0.5:900:0.1',  # Третье эхо
             # Легкий хорус для богатства звука
             'chorus=0.4:0.6:60:0.4:0.3:1.2',
             # Легкое тремоло для живости
@@ -429,6 +784,8 @@ class SimpleMidiToAudioConverter:
         ]
         
         success, output = run_command(command, logger=self.logger)
+        if reverb_path is not None and reverb_path.exists():
+            reverb_path.unlink()
         
         if success:
             self.logger.info(f"Аудио улучшено с максимально реалистичными эффектами пианино: {output_path}")
@@ -484,6 +841,14 @@ class SimpleMidiToAudioConverter:
         enhanced_wav_path = work_dir / "piano_enhanced.wav"
         final_wav_path = work_dir / "piano.wav"
         
+        # Шаги 1-3: Синтез, мастеринг и обрезка в памяти, на диск пишется только результат
+        if self.config.mastering_engine == 'numpy':
+            if not self.synthesize_and_master(midi_path, final_wav_path, max_duration=target_duration):
+                return None
+            
+            self.logger.info(f"Финальный пианино-кавер создан: {final_wav_path}")
+            return final_wav_path
+        
         # Шаг 1: Синтезируем MIDI в WAV
         if not self.synthesize_midi_to_audio(midi_path, raw_wav_path, target_duration):
             return None
@@ -0,0 +1,442 @@
+"""
+Компактное представление нот для всего пайплайна
+
+Ноты хранятся в одном структурированном массиве NumPy (start, end, pitch,
+velocity, program, flags) вместо списков словарей и объектов pretty_midi.Note:
+сортировка, фильтрация и слияние - операции над массивами, а объекты
+pretty_midi создаются только при записи MIDI.
+
+Рядом с MIDI можно сохранить файлы-спутники <имя>.notes.npy (ноты, читаются
+через mmap без копирования) и <имя>.notes.json (карта темпа, длительность,
+хэши). Следующие стадии берут ноты из них и разбирают MIDI, только если
+спутников нет или MIDI изменился.
+"""
+import hashlib
+import heapq
+import json
+import logging
+from pathlib import Path
+from typing import Iterable, Optional, Tuple, Union
+import numpy as np
+import pretty_midi
+
+
+NOTE_DTYPE = np.dtype([
+    ('start', np.float64),    # Начало (сек)
+    ('end', np.float64),      # Конец (сек)
+    ('pitch', np.uint8),      # MIDI нота
+    ('velocity', np.uint8),   # Сила нажатия
+    ('program', np.uint8),    # MIDI программа инструмента
+    ('flags', np.uint8),      # Битовые флаги FLAG_*
+])
+
+# Флаги нот
+FLAG_ON_BEAT = 1   # Нота на доле
+FLAG_BASS = 2      # Нота басовой линии
+FLAG_DRUM = 4      # Нота ударного инструмента
+
+# Версия формата файлов-спутников
+SIDECAR_VERSION = 1
+
+
+class NoteArray:
+    """Набор нот в структурированном массиве NOTE_DTYPE"""
+    
+    def __init__(self, data: Optional[np.ndarray] = None):
+        """
+        Args:
+            data: Массив NOTE_DTYPE (None - пустой набор)
+        """
+        self.data = np.zeros(0, dtype=NOTE_DTYPE) if data is None else data
+    
+    @classmethod
+    def from_fields(cls, start, end, pitch, velocity, flags=0, program=0) -> "NoteArray":
+        """Создает набор из отдельных массивов полей (скаляры растягиваются на все ноты)"""
+        start = np.asarray(start, dtype=np.float64)
+        data = np.zeros(len(start), dtype=NOTE_DTYPE)
+        data['start'] = start
+        data['end'] = end
+        data['pitch'] = pitch
+        data['velocity'] = velocity
+        data['flags'] = flags
+        data['program'] = program
+        return cls(data)
+    
+    @classmethod
+    def from_notes(cls, notes: list, program: int = 0, flags: int = 0) -> "NoteArray":
+        """Создает набор из списка pretty_midi.Note"""
+        data = np.fromiter(
+            ((note.start, note.end, note.pitch, note.velocity, program, flags) for note in notes),
+            dtype=NOTE_DTYPE, count=len(notes)
+        )
+        return cls(data)
+    
+    @classmethod
+    def from_pretty_midi(cls, midi: pretty_midi.PrettyMIDI, include_drums: bool = False) -> "NoteArray":
+        """
+        Собирает ноты всех инструментов (в порядке инструментов и нот в файле)
+        
+        Args:
+            midi: Загруженный MIDI
+            include_drums: Включать ударные (с флагом FLAG_DRUM)
+        
+        Returns:
+            NoteArray: Ноты
+        """
+        return cls.concatenate([
+            cls.from_notes(instrument.notes, instrument.program, FLAG_DRUM if instrument.is_drum else 0)
+            for instrument in midi.instruments
+            if include_drums or not instrument.is_drum
+        ])
+    
+    @classmethod
+    def load_midi(cls, midi_path: Union[str, Path], include_drums: bool = False) -> "NoteArray":
+        """Читает ноты из MIDI файла"""
+        return cls.from_pretty_midi(pretty_midi.PrettyMIDI(str(midi_path)), include_drums)
+    
+    @classmethod
+    def concatenate(cls, arrays: Iterable["NoteArray"]) -> "NoteArray":
+        """Объединяет наборы нот (без сортировки)"""
+        datas = [array.data for array in arrays]
+        return cls(np.concatenate(datas)) if datas else cls()
+    
+    def __len__(self) -> int:
+        return len(self.data)
+    
+    def __getitem__(self, key):
+        # Целый индекс - одна запись, срез/маска/индексы - новый набор
+        if isinstance(key, (int, np.integer)):
+            return self.data[key]
+        return NoteArray(self.data[key])
+    
+    def __repr__(self) -> str:
+        return f"NoteArray({len(self)} нот)"
+    
+    @property
+    def start(self) -> np.ndarray:
+        return self.data['start']
+    
+    @property
+    def end(self) -> np.ndarray:
+        return self.data['end']
+    
+    @property
+    def pitch(self) -> np.ndarray:
+        return self.data['pitch']
+    
+    @property
+    def velocity(self) -> np.ndarray:
+        return self.data['velocity']
+    
+    @property
+    def program(self) -> np.ndarray:
+        return self.data['program']
+    
+    @property
+    def flags(self) -> np.ndarray:
+        return self.data['flags']
+    
+    @property
+    def duration(self) -> np.ndarray:
+        return self.data['end'] - self.data['start']
+    
+    def end_time(self) -> float:
+        """Время окончания последней ноты (0 для пустого набора)"""
+        return float(self.end.max()) if len(self) else 0.0
+    
+    def has_flag(self, flag: int) -> np.ndarray:
+        """Маска нот с флагом"""
+        return (self.flags & flag) != 0
+    
+    def sort(self) -> "NoteArray":
+        """Сортирует по началу (устойчиво: равные начала сохраняют порядок)"""
+        return NoteArray(self.data[np.argsort(self.start, kind='stable')])
+    
+    def filter(self, mask: np.ndarray) -> "NoteArray":
+        """Оставляет ноты по булевой маске"""
+        return NoteArray(self.data[mask])
+    
+    def slice_time(self, start: float, end: float) -> "NoteArray":
+        """Ноты, звучащие в интервале [start, end)"""
+        return NoteArray(self.data[(self.start < end) & (self.end > start)])
+    
+    def thin(self, min_interval: float) -> "NoteArray":
+        """
+        Удаляет ноты, начинающиеся ближе min_interval к предыдущей оставленной
+        
+        Набор должен быть отсортирован по началу. Каждое решение зависит от
+        предыдущего оставленного начала, поэтому проход - последовательный по
+        списку чисел, без объектов нот.
+        
+        Args:
+            min_interval: Минимальный интервал между началами (сек)
+        
+        Returns:
+            NoteArray: Оставленные ноты
+        """
+        keep = np.zeros(len(self), dtype=bool)
+        last_start = None
+        for i, start in enumerate(self.start.tolist()):
+            if last_start is None or start - last_start > min_interval:
+                keep[i] = True
+                last_start = start
+        return NoteArray(self.data[keep])
+    
+    def merge_consecutive(self, max_gap: float) -> "NoteArray":
+        """
+        Объединяет соседние (по порядку в наборе) ноты одной высоты с паузой не больше max_gap
+        
+        Объединенная нота берет начало и параметры первой ноты цепочки
+        и конец последней.
+        
+        Args:
+            max_gap: Максимальная пауза между нотами (сек)
+        
+        Returns:
+            NoteArray: Ноты после объединения
+        """
+        if len(self) < 2:
+            return NoteArray(self.data.copy())
+        
+        # Нота начинает новую цепочку, если отличается высотой или далеко от предыдущей
+        starts_chain = np.ones(len(self), dtype=bool)
+        starts_chain[1:] = (self.pitch[1:] != self.pitch[:-1]) | (self.start[1:] - self.end[:-1] > max_gap)
+        chain_starts = np.flatnonzero(starts_chain)
+        chain_ends = np.append(chain_starts[1:], len(self)) - 1
+        
+        merged = self.data[chain_starts].copy()
+        merged['end'] = self.end[chain_ends]
+        return NoteArray(merged)
+    
+    def pitch_order(self) -> np.ndarray:
+        """Индексы нот, сгруппированных по высоте и отсортированных по началу внутри высоты"""
+        return np.lexsort((self.start, self.pitch))
+    
+    def merge_gaps(self, max_gap: float) -> "NoteArray":
+        """
+        Объединяет ноты одной высоты, перекрывающиеся или разделенные паузой не больше max_gap
+        
+        В отличие от merge_consecutive порядок нот в наборе не важен: ноты
+        группируются по высоте и сортируются по началу, цепочка продолжается,
+        пока начало следующей ноты не дальше max_gap от самого позднего конца
+        цепочки. Объединенная нота берет начало и параметры первой ноты цепочки
+        и самый поздний конец. O(n log n) на сортировку, остальное - векторно.
+        
+        Args:
+            max_gap: Максимальная пауза между нотами (сек)
+        
+        Returns:
+            NoteArray: Ноты после объединения, отсортированные по началу
+        """
+        if len(self) < 2:
+            return NoteArray(self.data.copy())
+        
+        data = self.data[self.pitch_order()]
+        pitch = data['pitch'].astype(np.int64)
+        start = data['start']
+        end = data['end']
+        
+        # Накопленный максимум концов внутри каждой высоты одним проходом:
+        # высоты разнесены по времени сдвигом больше всего диапазона времен
+        span = end.max() - start.min() + max(max_gap, 0.0) + 1.0
+        offset = pitch * span
+        reach = np.maximum.accumulate(end + offset) - offset
+        
+        starts_chain = np.ones(len(data), dtype=bool)
+        starts_chain[1:] = (pitch[1:] != pitch[:-1]) | (start[1:] - reach[:-1] > max_gap)
+        chain_starts = np.flatnonzero(starts_chain)
+        
+        merged = data[chain_starts]
+        merged['end'] = np.maximum.reduceat(end, chain_starts)
+        return NoteArray(merged).sort()
+    
+    def remove_overlaps(self) -> "NoteArray":
+        """
+        Обрезает ноту по началу следующей ноты той же высоты
+        
+        В MIDI перекрытие нот одной высоты неоднозначно (note off первой
+        глушит вторую). Ноты, от которых после обрезки ничего не остается
+        (то же начало), удаляются.
+        
+        Returns:
+            NoteArray: Ноты без перекрытий, отсортированные по началу
+        """
+        data = self.data[self.pitch_order()]
+        if len(data) > 1:
+            same_pitch = data['pitch'][1:] == data['pitch'][:-1]
+            next_start = data['start'][1:]
+            data['end'][:-1] = np.where(same_pitch, np.minimum(data['end'][:-1], next_start), data['end'][:-1])
+        return NoteArray(data[data['end'] > data['start']]).sort()
+    
+    def limit_polyphony(self, max_voices: int) -> "NoteArray":
+        """
+        Оставляет не больше max_voices одновременно звучащих нот
+        
+        Ноты обходятся по началу (при равном начале - от громкой к тихой);
+        нота удаляется, если в момент ее начала уже звучат max_voices
+        оставленных нот. Решение зависит от предыдущих, поэтому проход
+        последовательный - по спискам чисел с кучей концов, O(n log max_voices).
+        
+        Args:
+            max_voices: Максимум одновременно звучащих нот
+        
+        Returns:
+            NoteArray: Оставленные ноты, отсортированные по началу
+        """
+        order = np.lexsort((-self.velocity.astype(np.int16), self.start))
+        keep = np.zeros(len(self), dtype=bool)
+        sounding: list = []
+        for i, start, end in zip(order.tolist(), self.start[order].tolist(), self.end[order].tolist()):
+            while sounding and sounding[0] <= start:
+                heapq.heappop(sounding)
+            if len(sounding) < max_voices:
+                heapq.heappush(sounding, end)
+                keep[i] = True
+        return NoteArray(self.data[keep]).sort()
+    
+    def clean(self, min_duration: float = 0.0, max_gap: Optional[float] = None,
+              max_polyphony: int = 0) -> "NoteArray":
+        """
+        Чистка транскрипции: слияние пауз, удаление коротких нот и перекрытий, лимит полифонии
+        
+        Args:
+            min_duration: Минимальная длительность ноты после слияния (сек)
+            max_gap: Пауза, через которую сливаются ноты одной высоты (None - не сливать,
+                только обрезать перекрытия)
+            max_polyphony: Максимум одновременно звучащих нот (0 - без ограничения)
+        
+        Returns:
+            NoteArray: Ноты, отсортированные по началу
+        """
+        # Слияние само убирает перекрытия нот одной высоты
+        notes = self.merge_gaps(max_gap) if max_gap is not None else self.remove_overlaps()
+        notes = notes.filter(notes.duration >= min_duration)
+        if max_polyphony > 0:
+            notes = notes.limit_polyphony(max_polyphony)
+        return notes
+    
+    def to_notes(self) -> list:
+        """Список pretty_midi.Note"""
+        return [
+            pretty_midi.Note(velocity=velocity, pitch=pitch, start=start, end=end)
+            for start, end, pitch, velocity in zip(
+                self.start.tolist(), self.end.tolist(), self.pitch.tolist(), self.velocity.tolist()
+            )
+        ]
+    
+    def to_pretty_midi(self) -> pretty_midi.PrettyMIDI:
+        """MIDI с отдельным инструментом на каждую пару (программа, ударные)"""
+        midi = pretty_midi.PrettyMIDI()
+        is_drum = self.has_flag(FLAG_DRUM)
+        for program, drum in sorted(set(zip(self.program.tolist(), is_drum.tolist()))):
+            notes = self[(self.program == program) & (is_drum == drum)]
+            instrument = pretty_midi.Instrument(program=program, is_drum=drum)
+            instrument.notes = notes.to_notes()
+            midi.instruments.append(instrument)
+        return midi
+    
+    def write_midi(self, output_path: Union[str, Path]):
+        """Записывает ноты в MIDI файл"""
+        self.to_pretty_midi().write(str(output_path))
+
+
+def note_sidecar_paths(midi_path: Union[str, Path]) -> Tuple[Path, Path]:
+    """Пути файлов-спутников MIDI: (ноты .notes.npy, метаданные .notes.json)"""
+    midi_path = Path(midi_path)
+    return midi_path.with_suffix('.notes.npy'), midi_path.with_suffix('.notes.json')
+
+
+def file_sha1(path: Union[str, Path]) -> str:
+    """SHA-1 содержимого файла"""
+    return hashlib.sha1(Path(path).read_bytes()).hexdigest()
+
+
+def write_note_sidecar(midi_path: Union[str, Path], logger: Optional[logging.Logger] = None) -> Optional[str]:
+    """
+    Сохраняет ноты записанного MIDI в файлы-спутники
+    
+    Ноты берутся из разбора самого файла (с квантованием тиками), поэтому
+    стадии получают из спутника в точности то же, что и из MIDI.
+    
+    Args:
+        midi_path: Путь к MIDI файлу
+        logger: Логгер для вывода информации
+    
+    Returns:
+        Optional[str]: Хэш содержимого (ноты + карта темпа) или None при ошибке
+    """
+    logger = logger or logging.getLogger(__name__)
+    notes_path, meta_path = note_sidecar_paths(midi_path)
+    try:
+        midi = pretty_midi.PrettyMIDI(str(midi_path))
+        notes = NoteArray.from_pretty_midi(midi, include_drums=True)
+        tempo_times, tempi = midi.get_tempo_changes()
+        
+        content = hashlib.sha1(notes.data.tobytes())
+        content.update(np.ascontiguousarray(tempo_times, dtype=np.float64).tobytes())
+        content.update(np.ascontiguousarray(tempi, dtype=np.float64).tobytes())
+        meta = {
+            'version': SIDECAR_VERSION,
+            'midi_sha1': file_sha1(midi_path),
+            'content_hash': content.hexdigest(),
+            'num_notes': len(notes),
+            'end_time': midi.get_end_time(),
+            'tempo_times': np.asarray(tempo_times).tolist(),
+            'tempi': np.asarray(tempi).tolist(),
+        }
+        
+        # Метаданные пишутся последними: без них спутник считается отсутствующим
+        tmp_path = notes_path.with_suffix('.tmp.npy')
+        np.save(tmp_path, notes.data)
+        tmp_path.replace(notes_path)
+        tmp_path = meta_path.with_suffix('.tmp.json')
+        tmp_path.write_text(json.dumps(meta, indent=2), encoding='utf-8')
+        tmp_path.replace(meta_path)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить ноты рядом с {midi_path}: {e}")
+        return None
+    
+    logger.info(f"Ноты сохранены: {notes_path} ({len(notes)} нот)")
+    return meta['content_hash']
+
+
+def load_notes(midi_path: Union[str, Path], include_drums: bool = False,
+               logger: Optional[logging.Logger] = None) -> Tuple[NoteArray, dict]:
+    """
+    Загружает ноты MIDI: из файлов-спутников, если они актуальны, иначе разбором MIDI
+    
+    Args:
+        midi_path: Путь к MIDI файлу
+        include_drums: Включать ударные (с флагом FLAG_DRUM)
+        logger: Логгер для вывода информации
+    
+    Returns:
+        Tuple[NoteArray, dict]: Ноты (в порядке инструментов и нот в файле) и метаданные:
+            end_time, tempo_times, tempi, content_hash (None без спутника), source ('sidecar' или 'midi')
+    """
+    logger = logger or logging.getLogger(__name__)
+    notes_path, meta_path = note_sidecar_paths(midi_path)
+    
+    if meta_path.exists() and notes_path.exists():
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            if meta.get('version') == SIDECAR_VERSION and meta.get('midi_sha1') == file_sha1(midi_path):
+                notes = NoteArray(np.load(notes_path, mmap_mode='r'))
+                if not include_drums and notes.has_flag(FLAG_DRUM).any():
+                    notes = notes.filter(~notes.has_flag(FLAG_DRUM))
+                meta['source'] = 'sidecar'
+                return notes, meta
+            logger.info(f"Ноты рядом с {midi_path} устарели, разбираем MIDI")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать ноты рядом с {midi_path}: {e}")
+    
+    midi = pretty_midi.PrettyMIDI(str(midi_path))
+    tempo_times, tempi = midi.get_tempo_changes()
+    meta = {
+        'end_time': midi.get_end_time(),
+        'tempo_times': np.asarray(tempo_times).tolist(),
+        'tempi': np.asarray(tempi).tolist(),
+        'content_hash': None,
+        'source': 'midi',
+    }
+    return NoteArray.from_pretty_midi(midi, include_drums), meta
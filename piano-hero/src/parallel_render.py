@@ -0,0 +1,163 @@
+"""
+Параллельный рендер нот по процессам с общей шиной микса в shared memory
+
+Ноты делятся на шарды по времени начала. Тон ноты шарда не длиннее шарда,
+поэтому звук шарда i занимает не больше двух соседних интервалов и никогда
+не пересекается с шардом i + 2. Четные шарды пишут в одну шину, нечетные -
+в другую, так что параллельные процессы не пересекаются по записи, а итоговый
+микс - это сложение двух шин на месте, без копирования. Ноты длиннее шарда
+рендерятся вторым этапом с шардами по самой длинной из них, чтобы одна
+долгая нота не укрупняла шарды всего трека.
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, List, Optional, Tuple, TypeVar
+import numpy as np
+
+T = TypeVar('T')
+
+# Сколько шардов приходится на один процесс (для балансировки нагрузки)
+SHARDS_PER_WORKER = 4
+
+# Рендерер ноты текущего процесса-воркера (задается инициализатором пула)
+_note_renderer = None
+
+
+def _init_worker(note_renderer: Callable[[int, float, int], np.ndarray]):
+    """Инициализатор процесса пула: сохраняет рендерер один раз на процесс"""
+    global _note_renderer
+    _note_renderer = note_renderer
+
+
+def _render_shard(bus_name: str, total_frames: int, write_limit: int, voices: list) -> int:
+    """
+    Рендерит шард нот в шину микса в shared memory
+    
+    Args:
+        bus_name: Имя блока shared memory с шиной
+        total_frames: Длина шины в сэмплах
+        write_limit: Конец следующего шарда (дальше пишет шард i + 2 той же шины)
+        voices: Список (start_sample, pitch, duration, velocity, gain)
+    
+    Returns:
+        int: Количество отрендеренных нот
+    """
+    bus_memory = shared_memory.SharedMemory(name=bus_name)
+    try:
+        bus = np.ndarray((total_frames,), dtype=np.float32, buffer=bus_memory.buf)
+        for start_sample, pitch, duration, velocity, gain in voices:
+            tone = _note_renderer(pitch, duration, velocity)
+            end_sample = min(start_sample + len(tone), total_frames)
+            if end_sample > write_limit:
+                raise RuntimeError(f"Нота {pitch} ({duration:.3f}с) выходит за шард: "
+                                   f"{end_sample} > {write_limit} сэмплов")
+            bus[start_sample:end_sample] += tone[:end_sample - start_sample] * gain
+        del bus
+    finally:
+        bus_memory.close()
+    
+    return len(voices)
+
+
+def partition_voices(voices: list, total_frames: int, workers: int,
+                     voice_frames: Callable[[int, float], int],
+                     shard_frames: Optional[int] = None) -> Tuple[List[Tuple[int, int, list]], list]:
+    """
+    Делит ноты на шарды по времени начала
+    
+    Args:
+        voices: Список (start_sample, pitch, duration, velocity, gain)
+        total_frames: Длина результата в сэмплах
+        workers: Количество процессов
+        voice_frames: Длина тона (pitch, duration) -> сэмплов, как его вернет рендерер
+        shard_frames: Длина шарда (None - SHARDS_PER_WORKER шардов на процесс)
+    
+    Returns:
+        Tuple[List[Tuple[int, int, list]], list]: Непустые шарды (номер шины, граница записи, ноты)
+            и ноты длиннее шарда, не попавшие в шарды
+    """
+    if shard_frames is None:
+        shard_frames = -(-total_frames // (workers * SHARDS_PER_WORKER))
+    shard_frames = max(shard_frames, 1)
+    num_shards = -(-total_frames // shard_frames)
+    
+    shards = [[] for _ in range(num_shards)]
+    long_voices = []
+    for voice in voices:
+        if voice_frames(voice[1], voice[2]) > shard_frames:
+            long_voices.append(voice)
+        else:
+            shards[min(voice[0] // shard_frames, num_shards - 1)].append(voice)
+    
+    shards = [(shard_idx % 2, min((shard_idx + 2) * shard_frames, total_frames), shard)
+              for shard_idx, shard in enumerate(shards) if shard]
+    return shards, long_voices
+
+
+def render_voices_parallel(voices: list, total_frames: int,
+                           note_renderer: Callable[[int, float, int], np.ndarray],
+                           voice_frames: Callable[[int, float], int],
+                           workers: int, consume: Callable[[np.ndarray], T],
+                           logger: Optional[logging.Logger] = None) -> T:
+    """
+    Рендерит ноты в пуле процессов и передает готовый микс обработчику
+    
+    Микс живет в shared memory только во время вызова consume, поэтому
+    обработчик не должен сохранять ссылки на массив или его срезы.
+    
+    Args:
+        voices: Список (start_sample, pitch, duration, velocity, gain)
+        total_frames: Длина результата в сэмплах
+        note_renderer: Picklable функция (pitch, duration, velocity) -> np.ndarray
+        voice_frames: Длина тона (pitch, duration) -> сэмплов, как его вернет note_renderer
+        workers: Количество процессов
+        consume: Обработчик готового микса (float32, длина total_frames)
+        logger: Логгер для вывода информации
+    
+    Returns:
+        T: Результат consume
+    """
+    logger = logger or logging.getLogger(__name__)
+    bus_bytes = max(1, total_frames) * np.dtype(np.float32).itemsize
+    buses = [shared_memory.SharedMemory(create=True, size=bus_bytes) for _ in range(2)]
+    
+    try:
+        mix = np.ndarray((total_frames,), dtype=np.float32, buffer=buses[0].buf)
+        odd_bus = np.ndarray((total_frames,), dtype=np.float32, buffer=buses[1].buf)
+        mix[:] = 0.0
+        odd_bus[:] = 0.0
+        
+        if voices:
+            logger.info(f"Параллельный рендер: {len(voices)} нот, {workers} процессов")
+            
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(note_renderer,)) as pool:
+                pending, shard_frames = voices, None
+                while pending:
+                    shards, pending = partition_voices(pending, total_frames, workers, voice_frames, shard_frames)
+                    futures = [pool.submit(_render_shard, buses[bus_idx].name, total_frames, write_limit, shard)
+                               for bus_idx, write_limit, shard in shards]
+                    for future in futures:
+                        future.result()
+                    
+                    # Ноты длиннее шарда - следующим этапом (после этого, чтобы не пересечься по записи)
+                    if pending:
+                        shard_frames = max(voice_frames(voice[1], voice[2]) for voice in pending)
+                        logger.info(f"Длинных нот: {len(pending)} (до {shard_frames} сэмплов)")
+            
+        # Сводим шины на месте
+        mix += odd_bus
+        del odd_bus
+        
+        result = consume(mix)
+        del mix
+        return result
+    finally:
+        for bus_memory in buses:
+            try:
+                bus_memory.close()
+            except BufferError:
+                # На шину еще ссылаются массивы из трейсбека исключения
+                pass
+            bus_memory.unlink()
@@ -0,0 +1,270 @@
+"""
+Сверточная реверберация через FFT с разбиением импульсной характеристики
+
+Импульсные характеристики (IR) комнат генерируются детерминированно
+(ранние отражения + затухающий шум с более быстрым затуханием высоких частот).
+Спектры частей IR кэшируются на диске, поэтому следующие задачи пропускают
+генерацию и FFT. Свертка - равномерно разбитый overlap-save с частотной
+линией задержки: все кадры блока считаются одним батчем FFT.
+"""
+import logging
+import zlib
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import numpy as np
+import scipy.fft
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import butter, sosfilt
+
+
+# Библиотека комнат: время реверберации RT60 (с), предзадержка (с),
+# доля RT60 для высоких частот, ранние отражения (задержка в мс, уровень)
+ROOMS: Dict[str, dict] = {
+    'room': {
+        'rt60': 0.6, 'predelay': 0.008, 'high_decay': 0.5,
+        'early': [(7, 0.6), (13, 0.45), (19, 0.35), (27, 0.25), (38, 0.18)],
+    },
+    'chamber': {
+        'rt60': 1.3, 'predelay': 0.015, 'high_decay': 0.45,
+        'early': [(11, 0.55), (19, 0.42), (29, 0.33), (43, 0.24), (61, 0.17), (83, 0.12)],
+    },
+    'hall': {
+        'rt60': 2.2, 'predelay': 0.025, 'high_decay': 0.4,
+        'early': [(17, 0.5), (31, 0.4), (47, 0.3), (67, 0.22), (89, 0.16), (113, 0.11)],
+    },
+}
+
+# Версия алгоритма генерации (входит в ключ кэша)
+IR_VERSION = 1
+CROSSOVER_FREQUENCY = 4000.0
+
+
+def generate_room_ir(room: str, sample_rate: int, channel: int = 0) -> np.ndarray:
+    """
+    Генерирует импульсную характеристику комнаты
+    
+    Args:
+        room: Название комнаты из ROOMS
+        sample_rate: Частота дискретизации
+        channel: Номер канала (у каналов разный шум - декорреляция стерео)
+    
+    Returns:
+        np.ndarray: IR (float32) с единичной энергией
+    """
+    params = ROOMS[room]
+    rt60 = params['rt60']
+    length = int((params['predelay'] + rt60) * sample_rate)
+    rng = np.random.default_rng(zlib.crc32(f"{room}:{channel}".encode('utf-8')))
+    
+    # Диффузный хвост: шум с затуханием -60 дБ за RT60, высокие затухают быстрее
+    tail_start = int(params['predelay'] * sample_rate)
+    t = np.arange(length - tail_start) / sample_rate
+    noise = rng.standard_normal(len(t))
+    low_sos = butter(2, CROSSOVER_FREQUENCY, 'low', fs=sample_rate, output='sos')
+    high_sos = butter(2, CROSSOVER_FREQUENCY, 'high', fs=sample_rate, output='sos')
+    low = sosfilt(low_sos, noise) * np.exp(-6.91 * t / rt60)
+    high = sosfilt(high_sos, noise) * np.exp(-6.91 * t / (rt60 * params['high_decay']))
+    
+    # Плавное нарастание хвоста (5 мс), чтобы он не начинался щелчком
+    fade = np.minimum(1.0, t / 0.005)
+    ir = np.zeros(length)
+    ir[tail_start:] = (low + high) * fade * 0.35
+    
+    # Ранние отражения
+    for delay_ms, level in params['early']:
+        position = tail_start + int(delay_ms / 1000 * sample_rate)
+        if position < length:
+            ir[position] += level * (1 if rng.random() < 0.5 else -1)
+    
+    ir /= np.sqrt(np.sum(ir ** 2))
+    return ir.astype(np.float32)
+
+
+def ir_partitions(ir: np.ndarray, partition_size: int) -> np.ndarray:
+    """
+    Спектры частей IR для overlap-save
+    
+    Args:
+        ir: Импульсная характеристика
+        partition_size: Размер части (сэмплы)
+    
+    Returns:
+        np.ndarray: (число частей, partition_size + 1) complex64
+    """
+    num_partitions = -(-len(ir) // partition_size)
+    padded = np.zeros((num_partitions, 2 * partition_size), dtype=np.float32)
+    padded[:, :partition_size] = np.pad(ir, (0, num_partitions * partition_size - len(ir))) \
+        .reshape(num_partitions, partition_size)
+    return scipy.fft.rfft(padded, axis=1)
+
+
+def load_room_partitions(room: str, sample_rate: int, channels: int, partition_size: int,
+                         cache_dir: Optional[Path] = None,
+                         logger: Optional[logging.Logger] = None) -> np.ndarray:
+    """
+    Возвращает спектры частей IR комнаты, генерируя и кэшируя их при первом вызове
+    
+    Args:
+        room: Название комнаты из ROOMS
+        sample_rate: Частота дискретизации
+        channels: Количество каналов
+        partition_size: Размер части (сэмплы)
+        cache_dir: Директория кэша (None - без кэша на диске)
+        logger: Логгер для вывода информации
+    
+    Returns:
+        np.ndarray: (channels, число частей, partition_size + 1) complex64
+    """
+    logger = logger or logging.getLogger(__name__)
+    if room not in ROOMS:
+        raise ValueError(f"Неизвестная комната реверберации: {room} (доступны: {', '.join(ROOMS)})")
+    
+    cache_path = None
+    if cache_dir is not None:
+        params_hash = zlib.crc32(repr((IR_VERSION, CROSSOVER_FREQUENCY, ROOMS[room])).encode('utf-8'))
+        cache_path = Path(cache_dir) / f"reverb_{room}_{sample_rate}hz_{channels}ch_p{partition_size}_{params_hash:08x}.npy"
+        if cache_path.exists():
+            try:
+                return np.load(cache_path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Не удалось прочитать кэш IR {cache_path}: {e}")
+    
+    partitions = np.stack([ir_partitions(generate_room_ir(room, sample_rate, channel), partition_size)
+                           for channel in range(channels)])
+    
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix('.tmp.npy')
+        np.save(tmp_path, partitions)
+        tmp_path.replace(cache_path)
+        logger.info(f"IR комнаты '{room}' сохранена в кэш: {cache_path}")
+    
+    return partitions
+
+
+class ConvolutionReverb:
+    """
+    Поблочная сверточная реверберация (равномерный overlap-save с частотной линией задержки)
+    
+    Блоки могут быть любого размера: полные кадры считаются батчем, а для
+    неполного кадра в конце блока выход считается с нулями вместо будущих
+    сэмплов и кадр пересчитывается со следующим блоком. Задержки нет.
+    """
+    
+    # Для офлайн-обработки задержка не важна: крупные части - меньше умножений спектров
+    PARTITION_SIZE = 16384
+    
+    def __init__(self, partitions: np.ndarray, wet: float = 0.3, dry: float = 1.0):
+        """
+        Args:
+            partitions: Спектры частей IR (channels, число частей, partition_size + 1)
+            wet: Уровень реверберации
+            dry: Уровень прямого сигнала
+        """
+        self.partitions = partitions
+        self.channels, self.num_partitions, num_bins = partitions.shape
+        self.partition_size = num_bins - 1
+        self.wet = wet
+        self.dry = dry
+        
+        # Спектры последних входных кадров (частотная линия задержки) и последний полный кадр
+        self._spectra = np.zeros((self.channels, self.num_partitions - 1, num_bins), dtype=np.complex64)
+        self._previous = np.zeros((self.channels, self.partition_size), dtype=np.float32)
+        self._pending = np.zeros((self.channels, 0), dtype=np.float32)
+    
+    @classmethod
+    def for_room(cls, room: str, sample_rate: int, channels: int = 1, wet: float = 0.3, dry: float = 1.0,
+                 cache_dir: Optional[Path] = None, logger: Optional[logging.Logger] = None) -> "ConvolutionReverb":
+        """Создает реверберацию для комнаты из библиотеки ROOMS"""
+        partitions = load_room_partitions(room, sample_rate, channels, cls.PARTITION_SIZE, cache_dir, logger)
+        return cls(partitions, wet, dry)
+    
+    def _convolve(self, padded: np.ndarray, num_windows: int) -> Tuple[np.ndarray, np.ndarray]:
+        # padded: (C, (F + 1) * P) - предыдущий кадр и F новых; окна overlap-save по 2P сэмплов
+        size = self.partition_size
+        windows = sliding_window_view(padded, 2 * size, axis=1)[:, ::size]
+        all_spectra = np.concatenate([self._spectra, scipy.fft.rfft(windows, axis=-1)], axis=1)
+        
+        # Y_f = sum_k X_{f-k} * H_k
+        history = self.num_partitions - 1
+        output = all_spectra[:, history:] * self.partitions[:, :1]
+        for k in range(1, self.num_partitions):
+            output += all_spectra[:, history - k:history - k + num_windows] * self.partitions[:, k:k + 1]
+        
+        return scipy.fft.irfft(output, axis=-1)[..., size:].reshape(self.channels, -1), all_spectra
+    
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Обрабатывает очередной блок
+        
+        Args:
+            block: Аудио (frames, channels)
+        
+        Returns:
+            np.ndarray: Сухой + реверберированный сигнал той же длины
+        """
+        num_frames = len(block)
+        if not num_frames:
+            return block
+        
+        size = self.partition_size
+        block = np.asarray(block, dtype=np.float32)
+        num_pending = self._pending.shape[1]
+        num_samples = num_pending + num_frames
+        num_full = num_samples // size
+        
+        # Неполный кадр дополняем нулями (на выход прошлых сэмплов они не влияют)
+        num_windows = -(-num_samples // size)
+        padded = np.zeros((self.channels, (num_windows + 1) * size), dtype=np.float32)
+        padded[:, :size] = self._previous
+        padded[:, size:size + num_pending] = self._pending
+        padded[:, size + num_pending:size + num_samples] = block.T
+        
+        wet, all_spectra = self._convolve(padded, num_windows)
+        
+        # Фиксируем состояние только по полным кадрам
+        if num_full:
+            self._previous = padded[:, num_full * size:(num_full + 1) * size].copy()
+            self._spectra = all_spectra[:, num_full:num_full + self.num_partitions - 1].copy()
+        self._pending = padded[:, (num_full + 1) * size:size + num_samples].copy()
+        
+        # Выход соответствует последним num_frames сэмплам
+        wet = wet[:, num_pending:num_samples].T
+        return block * np.float32(self.dry) + wet * np.float32(self.wet)
+
+
+def apply_reverb_file(input_path: Path, output_path: Path, room: str = 'chamber', wet: float = 0.3,
+                      dry: float = 1.0, cache_dir: Optional[Path] = None,
+                      logger: Optional[logging.Logger] = None) -> bool:
+    """
+    Добавляет реверберацию к WAV файлу поблочно
+    
+    Args:
+        input_path: Путь к исходному аудио
+        output_path: Путь для сохранения результата (float WAV)
+        room: Название комнаты из ROOMS
+        wet: Уровень реверберации
+        dry: Уровень прямого сигнала
+        cache_dir: Директория кэша IR
+        logger: Логгер для вывода информации
+    
+    Returns:
+        bool: True если успешно
+    """
+    import soundfile as sf
+    
+    logger = logger or logging.getLogger(__name__)
+    try:
+        info = sf.info(str(input_path))
+        reverb = ConvolutionReverb.for_room(room, info.samplerate, info.channels, wet, dry, cache_dir, logger)
+        with sf.SoundFile(str(output_path), 'w', samplerate=info.samplerate,
+                          channels=info.channels, subtype='FLOAT') as output_file:
+            for block in sf.blocks(str(input_path), blocksize=ConvolutionReverb.PARTITION_SIZE * 4,
+                                   dtype='float32', always_2d=True):
+                output_file.write(reverb.process(block))
+    except Exception as e:
+        logger.error(f"Ошибка реверберации {input_path}: {e}")
+        return False
+    
+    logger.info(f"Реверберация '{room}' добавлена: {output_path}")
+    return True
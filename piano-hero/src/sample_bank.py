@@ -0,0 +1,185 @@
+"""
+Банк заранее синтезированных сэмплов для всех 88 клавиш пианино
+
+Каждая клавиша один раз рендерится аддитивной моделью синтезатора
+на максимальную длительность и сохраняется в один .npy файл рядом с SoundFont.
+При синтезе банк открывается через memory-map, поэтому несколько процессов
+разделяют его через страничный кэш ОС вместо повторного расчета тонов.
+"""
+import argparse
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Optional
+import numpy as np
+
+
+class SampleBank:
+    """Memory-mapped банк тонов для клавиш A0-C8"""
+    
+    LOWEST_KEY = 21   # A0
+    KEY_COUNT = 88
+    
+    # Нижняя граница длительности: у более коротких нот другая огибающая
+    MIN_DURATION = 0.1
+    
+    def __init__(self, path: Path, sample_rate: int, max_duration: float,
+                 release_time: float = 0.01, logger: Optional[logging.Logger] = None):
+        self.path = Path(path)
+        self.sample_rate = sample_rate
+        self.max_duration = max_duration
+        self.max_samples = int(max_duration * sample_rate)
+        self.release_samples = max(1, int(release_time * sample_rate))
+        self.logger = logger or logging.getLogger(__name__)
+        self._samples = None
+        self._release_curve = np.linspace(1.0, 0.0, self.release_samples, dtype=np.float32)
+    
+    @classmethod
+    def from_config(cls, config, logger: Optional[logging.Logger] = None) -> "SampleBank":
+        """Создает банк по настройкам (файл лежит рядом с soundfont_path)"""
+        sample_rate = config.sample_rate
+        max_duration = config.sample_bank_max_duration
+        bank_dir = Path(config.soundfont_path).parent
+        path = bank_dir / f"piano_bank_{sample_rate}hz_{max_duration:g}s.npy"
+        return cls(path, sample_rate, max_duration, logger=logger)
+    
+    @property
+    def is_loaded(self) -> bool:
+        return self._samples is not None
+    
+    def __getstate__(self) -> dict:
+        # Memory-map не копируется в другой процесс: там банк открывается заново
+        # и разделяется с родителем через страничный кэш
+        state = self.__dict__.copy()
+        state['_samples'] = None
+        state['_reopen'] = self.is_loaded
+        return state
+    
+    def __setstate__(self, state: dict):
+        reopen = state.pop('_reopen', False)
+        self.__dict__.update(state)
+        if reopen:
+            self.load()
+    
+    def build(self, render_tone: Callable[..., np.ndarray]) -> bool:
+        """
+        Рендерит все клавиши и записывает банк на диск
+        
+        Args:
+            render_tone: Функция (frequency, duration, sample_rate, out=буфер) -> np.ndarray
+        
+        Returns:
+            bool: True если успешно
+        """
+        self.logger.info(f"Сборка банка сэмплов: {self.KEY_COUNT} клавиш по {self.max_duration:g}с -> {self.path}")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp.npy')
+        
+        # Шум в тонах берется из глобального генератора - делаем банк воспроизводимым
+        rng_state = np.random.get_state()
+        try:
+            bank = np.lib.format.open_memmap(
+                tmp_path, mode='w+', dtype=np.float32,
+                shape=(self.KEY_COUNT, self.max_samples)
+            )
+            # Все клавиши рендерятся в один буфер, а не в новый массив на каждую
+            key_tone = np.empty(self.max_samples, dtype=np.float32)
+            for key_idx in range(self.KEY_COUNT):
+                pitch = self.LOWEST_KEY + key_idx
+                np.random.seed(pitch)
+                frequency = 440.0 * (2 ** ((pitch - 69) / 12.0))
+                tone = render_tone(frequency, self.max_duration, self.sample_rate, out=key_tone)
+                length = min(len(tone), self.max_samples)
+                bank[key_idx, :length] = tone[:length]
+                bank[key_idx, length:] = 0.0
+            
+            bank.flush()
+            del bank
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.logger.error(f"Ошибка сборки банка сэмплов: {e}")
+            if tmp_path.exists():
+                tmp_path.unlink()
+            return False
+        finally:
+            np.random.set_state(rng_state)
+        
+        self.logger.info(f"Банк сэмплов собран: {self.path}")
+        return True
+    
+    def load(self) -> bool:
+        """Открывает банк через memory-map"""
+        if not self.path.exists():
+            return False
+        
+        try:
+            samples = np.load(self.path, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Не удалось открыть банк сэмплов {self.path}: {e}")
+            return False
+        
+        if samples.shape != (self.KEY_COUNT, self.max_samples) or samples.dtype != np.float32:
+            self.logger.warning(f"Банк сэмплов имеет неожиданный формат {samples.shape}, требуется пересборка")
+            return False
+        
+        self._samples = samples
+        self.logger.info(f"Банк сэмплов загружен: {self.path}")
+        return True
+    
+    def ensure(self, render_tone: Callable[..., np.ndarray]) -> bool:
+        """Загружает банк, при необходимости собирая его"""
+        if self.is_loaded or self.load():
+            return True
+        return self.build(render_tone) and self.load()
+    
+    def covers(self, pitch: int, duration: float) -> bool:
+        """Можно ли взять ноту из банка"""
+        return (self.is_loaded
+                and self.LOWEST_KEY <= pitch < self.LOWEST_KEY + self.KEY_COUNT
+                and self.MIN_DURATION <= duration <= self.max_duration)
+    
+    def render(self, pitch: int, duration: float) -> np.ndarray:
+        """
+        Возвращает тон ноты: срез банка с огибающей отпускания клавиши
+        
+        Args:
+            pitch: MIDI нота (должна покрываться банком)
+            duration: Длительность в секундах
+        
+        Returns:
+            np.ndarray: Аудио сигнал
+        """
+        num_samples = min(int(duration * self.sample_rate), self.max_samples)
+        tone = np.array(self._samples[pitch - self.LOWEST_KEY, :num_samples])
+        
+        release = min(self.release_samples, num_samples)
+        tone[num_samples - release:] *= self._release_curve[self.release_samples - release:]
+        return tone
+
+
+def main():
+    """Собирает банк сэмплов по настройкам проекта"""
+    from .config import Config
+    from .utils import setup_logging
+    from .midi_to_audio_simple import SimpleMidiToAudioConverter
+    
+    parser = argparse.ArgumentParser(description="Сборка банка сэмплов пианино")
+    parser.add_argument('--config', '-c', default='configs/settings.yaml', help='Путь к конфигурационному файлу')
+    parser.add_argument('--force', action='store_true', help='Пересобрать банк, даже если он уже существует')
+    args = parser.parse_args()
+    
+    config = Config(args.config)
+    logger = setup_logging(config.get('log_level', 'INFO'))
+    converter = SimpleMidiToAudioConverter(config, logger)
+    bank = SampleBank.from_config(config, logger)
+    
+    if bank.path.exists() and not args.force:
+        logger.info(f"Банк сэмплов уже существует: {bank.path} (используйте --force для пересборки)")
+        return
+    
+    if not bank.build(converter.create_tone_audio):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
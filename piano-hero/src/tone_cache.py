@@ -0,0 +1,100 @@
+"""
+LRU кэш синтезированных тонов для синтезатора нот
+"""
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+import numpy as np
+
+
+class ToneCache:
+    """Ограниченный по памяти кэш тонов с вытеснением давно неиспользуемых (LRU)"""
+    
+    def __init__(self, max_bytes: int, duration_step: float = 0.01):
+        """
+        Args:
+            max_bytes: Максимальный суммарный размер тонов в байтах (0 - кэш выключен)
+            duration_step: Шаг квантования длительности в секундах
+        """
+        self.max_bytes = max(0, int(max_bytes))
+        self.duration_step = duration_step
+        self._tones = OrderedDict()
+        self.size_bytes = 0
+        self.reset_stats()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+    
+    def reset_stats(self):
+        """Сбрасывает счетчики попаданий и промахов"""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def make_key(self, pitch: int, duration: float, note_type: str, sample_rate: int) -> Tuple[Hashable, float]:
+        """
+        Строит ключ кэша и квантованную длительность ноты
+        
+        Args:
+            pitch: MIDI нота
+            duration: Длительность в секундах
+            note_type: Тип ноты (melody, chord, bass)
+            sample_rate: Частота дискретизации
+        
+        Returns:
+            Tuple[Hashable, float]: (ключ, квантованная длительность в секундах)
+        """
+        duration_bucket = max(1, int(round(duration / self.duration_step)))
+        key = (int(pitch), duration_bucket, note_type, int(sample_rate))
+        return key, duration_bucket * self.duration_step
+    
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """Возвращает тон из кэша или None"""
+        tone = self._tones.get(key)
+        if tone is None:
+            self.misses += 1
+            return None
+        
+        self._tones.move_to_end(key)
+        self.hits += 1
+        return tone
+    
+    def put(self, key: Hashable, tone: np.ndarray):
+        """Кладет тон в кэш, вытесняя самые старые тоны при превышении лимита"""
+        if not self.enabled or tone.nbytes > self.max_bytes:
+            return
+        
+        if key in self._tones:
+            self.size_bytes -= self._tones.pop(key).nbytes
+        
+        # Тоны разделяются между нотами, поэтому защищаем их от изменения
+        tone.flags.writeable = False
+        self._tones[key] = tone
+        self.size_bytes += tone.nbytes
+        
+        while self.size_bytes > self.max_bytes:
+            _, evicted = self._tones.popitem(last=False)
+            self.size_bytes -= evicted.nbytes
+            self.evictions += 1
+    
+    def clear(self):
+        """Очищает кэш"""
+        self._tones.clear()
+        self.size_bytes = 0
+    
+    def __getstate__(self) -> dict:
+        # В другой процесс (например, воркер пула) передаются только настройки, без тонов
+        state = self.__dict__.copy()
+        state['_tones'] = OrderedDict()
+        state['size_bytes'] = 0
+        return state
+    
+    def __len__(self) -> int:
+        return len(self._tones)
+    
+    def stats_message(self) -> str:
+        """Строка со статистикой для лога"""
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        return (f"Кэш тонов: попаданий {self.hits}, промахов {self.misses} ({hit_rate:.1f}% попаданий), "
+                f"вытеснено {self.evictions}, тонов в кэше {len(self)} ({self.size_bytes / 1024 / 1024:.1f} MB)")
@@ -0,0 +1,58 @@
+"""
+Переиспользуемые float32 буферы для синтеза тона
+
+Синтезатор считает все промежуточные сигналы ноты (временную ось, рабочие
+сигналы, огибающую, сумму парциалов) операциями с out= в этих буферах.
+Буферы растут геометрически под самую длинную ноту, поэтому в установившемся
+режиме синтез ноты не выделяет память, кроме самого результата.
+"""
+import numpy as np
+
+
+class ToneScratch:
+    """Набор рабочих буферов для одной ноты (не потокобезопасен)"""
+    
+    def __init__(self, block_size: int, num_partials: int):
+        """
+        Args:
+            block_size: Длина блока при суммировании парциалов
+            num_partials: Количество парциалов в таблице (0 - без буферов суммы парциалов)
+        """
+        self.block_size = block_size
+        self.num_partials = num_partials
+        self.capacity = 0
+        
+        # Буферы, не зависящие от длины ноты. Фазы считаются в float64 и только
+        # синусы/косинусы копируются в float32: смешанные типы в ufunc выделяют
+        # внутренние буферы приведения
+        self.omegas = np.empty(num_partials, dtype=np.float64)
+        self.block_offsets = np.arange(block_size, dtype=np.float64)
+        self.block_phase = np.empty((block_size, num_partials), dtype=np.float64)
+        self.block_trig = np.empty((block_size, num_partials), dtype=np.float64)
+        self.basis = np.empty((block_size, 2 * num_partials), dtype=np.float32)
+        self._allocate(0)
+    
+    def _allocate(self, capacity: int):
+        num_blocks = -(-capacity // self.block_size) if self.num_partials else 0
+        self.capacity = capacity
+        self.ramp = np.arange(capacity, dtype=np.float32)
+        self.t = np.empty(capacity, dtype=np.float32)
+        self.work = np.empty(capacity, dtype=np.float32)
+        self.envelope = np.empty(capacity, dtype=np.float32)
+        self.partials = np.empty(num_blocks * self.block_size, dtype=np.float32)
+        self.block_starts = np.arange(num_blocks, dtype=np.float64)
+        self.start_phase = np.empty((num_blocks, self.num_partials), dtype=np.float64)
+        self.start_trig = np.empty((num_blocks, self.num_partials), dtype=np.float64)
+        self.weights = np.empty((num_blocks, 2 * self.num_partials), dtype=np.float32)
+    
+    def reserve(self, num_samples: int):
+        """Гарантирует буферы длиной не меньше num_samples (рост в 1.5 раза)"""
+        if num_samples > self.capacity:
+            self._allocate(max(num_samples, int(self.capacity * 1.5)))
+    
+    def __getstate__(self) -> dict:
+        # В другой процесс передаются только размеры, буферы создаются заново
+        return {'block_size': self.block_size, 'num_partials': self.num_partials}
+    
+    def __setstate__(self, state: dict):
+        self.__init__(state['block_size'], state['num_partials'])
@@ -0,0 +1,76 @@
+"""
+Предрасчитанные таблицы шума и экспоненциальных огибающих для синтеза тонов
+
+Вместо np.random.normal и np.exp на каждую ноту синтезаторы берут срезы
+(views) общих таблиц: нормального шума с фиксированным зерном и кривых
+exp(-rate * t). Кривая затухания хранится только до уровня DECAY_FLOOR -
+дальше ее вклад ниже точности float32, и ноте достаточно обработать
+начальный участок сигнала.
+"""
+from functools import lru_cache
+from typing import Dict
+import numpy as np
+
+
+class ToneTables:
+    """Таблицы шума и кривых затухания для одной частоты дискретизации"""
+    
+    # Уровень, ниже которого кривая exp(-rate * t) считается нулем
+    DECAY_FLOOR = 1e-7
+    
+    def __init__(self, sample_rate: int, noise_duration: float = 8.0, seed: int = 0):
+        """
+        Args:
+            sample_rate: Частота дискретизации
+            noise_duration: Длина таблицы шума в секундах (ноты длиннее получают свежий шум)
+            seed: Зерно таблицы шума
+        """
+        self.sample_rate = sample_rate
+        # Таблица вдвое длиннее максимальной ноты, чтобы случайные смещения давали разный шум
+        noise = np.random.default_rng(seed).standard_normal(int(2 * noise_duration * sample_rate), dtype=np.float32)
+        noise.flags.writeable = False
+        self._noise = noise
+        self._decays: Dict[float, np.ndarray] = {}
+    
+    def decay(self, rate: float) -> np.ndarray:
+        """
+        Кривая exp(-rate * t) с шагом 1/sample_rate до уровня DECAY_FLOOR
+        
+        Args:
+            rate: Скорость затухания (1/с)
+        
+        Returns:
+            np.ndarray: Кривая (float32, только чтение)
+        """
+        curve = self._decays.get(rate)
+        if curve is None:
+            length = int(np.ceil(-np.log(self.DECAY_FLOOR) / rate * self.sample_rate)) + 1
+            curve = np.exp(-rate / self.sample_rate * np.arange(length)).astype(np.float32)
+            curve.flags.writeable = False
+            self._decays[rate] = curve
+        return curve
+    
+    def noise(self, num_samples: int) -> np.ndarray:
+        """
+        Нормальный шум (среднее 0, СКО 1) длины num_samples
+        
+        Смещение в таблице берется из глобального генератора np.random, поэтому
+        шум воспроизводим при заданном зерне (synth_seed, банк сэмплов).
+        
+        Args:
+            num_samples: Количество сэмплов
+        
+        Returns:
+            np.ndarray: Срез таблицы (float32, только чтение)
+        """
+        if num_samples > len(self._noise) // 2:
+            return np.random.standard_normal(num_samples).astype(np.float32)
+        
+        offset = np.random.randint(0, len(self._noise) - num_samples + 1)
+        return self._noise[offset:offset + num_samples]
+
+
+@lru_cache(maxsize=None)
+def get_tone_tables(sample_rate: int) -> ToneTables:
+    """Общие таблицы процесса для частоты дискретизации (создаются при первом вызове)"""
+    return ToneTables(sample_rate)
@@ -5,7 +5,8 @@ import os
 import subprocess
 import logging
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
+import numpy as np
 
 
 def setup_logging(log_level: str = "INFO") -> logging.Logger:
@@ -69,6 +70,174 @@ def run_command(command: List[str], cwd: Optional[str] = None, logger: Optional[
         return False, error_msg
 
 
+def ffmpeg_decode_command(input_path: Path, sample_rate: int, ffmpeg_bin: str = './ffmpeg') -> List[str]:
+    """Команда ffmpeg, выводящая звук файла в stdout как моно float32 заданной частоты"""
+    return [
+        ffmpeg_bin, '-v', 'error', '-nostdin',
+        '-i', str(input_path),
+        '-vn',  # без видео
+        '-ac', '1',  # моно
+        '-ar', str(sample_rate),
+        '-f', 'f32le', '-acodec', 'pcm_f32le',
+        'pipe:1'
+    ]
+
+
+def decode_audio(input_path: Path, sample_rate: int, ffmpeg_bin: str = './ffmpeg',
+                 logger: Optional[logging.Logger] = None) -> Optional[np.ndarray]:
+    """
+    Декодирует аудио дорожку (в том числе из видео) в моно float32 через pipe ffmpeg
+    
+    ffmpeg сразу отдает PCM нужной частоты в stdout, поэтому не нужны
+    промежуточный файл, повторное сжатие и ресемплинг в librosa.
+    
+    Args:
+        input_path: Путь к видео или аудио файлу
+        sample_rate: Частота дискретизации результата
+        ffmpeg_bin: Путь к ffmpeg
+        logger: Логгер для вывода информации
+    
+    Returns:
+        Optional[np.ndarray]: Сигнал (float32, моно) или None при ошибке
+    """
+    command = ffmpeg_decode_command(input_path, sample_rate, ffmpeg_bin)
+    
+    if logger:
+        logger.info(f"Выполняется команда: {' '.join(command)}")
+    
+    try:
+        result = subprocess.run(command, capture_output=True, check=True)
+    except subprocess.CalledProcessError as e:
+        if logger:
+            logger.error(f"Ошибка декодирования аудио {input_path}: {e.stderr.decode('utf-8', 'replace')}")
+        return None
+    except FileNotFoundError:
+        if logger:
+            logger.error(f"Команда не найдена: {ffmpeg_bin}")
+        return None
+    
+    audio = np.frombuffer(result.stdout, dtype='<f4')
+    if logger:
+        logger.info(f"Аудио декодировано: {input_path} ({len(audio) / sample_rate:.1f}с, {sample_rate} Hz)")
+    return audio
+
+
+def stream_audio(input_path: Path, sample_rate: int, block_samples: int, ffmpeg_bin: str = './ffmpeg',
+                 logger: Optional[logging.Logger] = None) -> Iterator[np.ndarray]:
+    """
+    Декодирует аудио через pipe ffmpeg и отдает его блоками, не держа весь сигнал в памяти
+    
+    Args:
+        input_path: Путь к видео или аудио файлу
+        sample_rate: Частота дискретизации результата
+        block_samples: Размер блока в отсчетах (последний блок может быть короче)
+        ffmpeg_bin: Путь к ffmpeg
+        logger: Логгер для вывода информации
+    
+    Yields:
+        np.ndarray: Очередной блок сигнала (float32, моно)
+    
+    Raises:
+        RuntimeError: Если ffmpeg завершился с ошибкой
+    """
+    command = ffmpeg_decode_command(input_path, sample_rate, ffmpeg_bin)
+    
+    if logger:
+        logger.info(f"Выполняется команда: {' '.join(command)}")
+    
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        total_samples = 0
+        while True:
+            data = process.stdout.read(block_samples * 4)
+            # Неполный последний отсчет (обрыв потока) отбрасывается
+            data = data[:len(data) - len(data) % 4]
+            if not data:
+                break
+            total_samples += len(data) // 4
+            yield np.frombuffer(data, dtype='<f4')
+        
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"Ошибка декодирования аудио {input_path}: {stderr.decode('utf-8', 'replace')}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    
+    if logger:
+        logger.info(f"Аудио декодировано: {input_path} ({total_samples / sample_rate:.1f}с, {sample_rate} Hz)")
+
+
+def overlapping_windows(blocks: Iterable[np.ndarray], chunk_samples: int,
+                        overlap_samples: int) -> Iterator[Tuple[np.ndarray, int, int, int]]:
+    """
+    Нарезает поток блоков на перекрывающиеся окна
+    
+    Сигнал делится на собственные участки по chunk_samples отсчетов; окно
+    каждого участка расширено на overlap_samples в обе стороны (в пределах
+    сигнала). В памяти одновременно находится не больше одного окна и
+    одного входного блока; окна собираются в буфере постоянного размера.
+    
+    Args:
+        blocks: Блоки сигнала подряд (любого размера)
+        chunk_samples: Длина собственного участка окна
+        overlap_samples: Перекрытие с каждой стороны
+    
+    Yields:
+        Tuple[np.ndarray, int, int, int]: (окно, начало окна, начало и конец собственного участка),
+            позиции в отсчетах от начала сигнала
+    """
+    blocks = iter(blocks)
+    # Окно целиком помещается в буфер постоянного размера; блоки копируются
+    # в него по частям, поэтому мелкие блоки не пересобирают буфер
+    buffer = np.empty(chunk_samples + 2 * overlap_samples, dtype=np.float32)
+    buffer_start = 0
+    buffer_len = 0
+    block = np.zeros(0, dtype=np.float32)
+    block_pos = 0
+    own_start = 0
+    finished = False
+    
+    while True:
+        # Дочитываем сигнал до конца окна
+        window_limit = own_start + chunk_samples + overlap_samples
+        while not finished and buffer_start + buffer_len < window_limit:
+            if block_pos == len(block):
+                block = next(blocks, None)
+                block_pos = 0
+                if block is None:
+                    finished = True
+                continue
+            count = min(len(block) - block_pos, window_limit - buffer_start - buffer_len)
+            buffer[buffer_len:buffer_len + count] = block[block_pos:block_pos + count]
+            buffer_len += count
+            block_pos += count
+        
+        signal_end = buffer_start + buffer_len
+        if signal_end <= own_start:
+            break
+        
+        # Последнее окно забирает весь остаток сигнала
+        is_last = finished and signal_end <= window_limit
+        own_end = signal_end if is_last else own_start + chunk_samples
+        window_start = max(own_start - overlap_samples, 0)
+        window_end = min(own_end + overlap_samples, signal_end)
+        # Копия: буфер перезаписывается следующим окном, а окно может уйти в другой процесс
+        yield (buffer[window_start - buffer_start:window_end - buffer_start].copy(),
+               window_start, own_start, own_end)
+        
+        if is_last:
+            break
+        
+        # Сдвигаем в начало буфера отсчеты, которые войдут в следующее окно
+        own_start = own_end
+        drop = max(own_start - overlap_samples, 0) - buffer_start
+        buffer_len -= drop
+        buffer[:buffer_len] = buffer[drop:drop + buffer_len]
+        buffer_start += drop
+
+
 def check_dependencies(config, logger: Optional[logging.Logger] = None) -> bool:
     """
     Проверяет наличие необходимых зависимостей
@@ -0,0 +1,16 @@
+"""Общие фикстуры тестов"""
+import pytest
+import yaml
+
+from src.config import Config
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """Фабрика конфигурации: YAML во временной директории с кэшем там же"""
+    def factory(**settings):
+        settings.setdefault('cache_dir', str(tmp_path / 'cache'))
+        config_path = tmp_path / 'settings.yaml'
+        config_path.write_text(yaml.safe_dump(settings), encoding='utf-8')
+        return Config(str(config_path))
+    return factory
@@ -0,0 +1,47 @@
+"""Тесты общего STFT-фронтенда признаков"""
+import librosa
+import numpy as np
+import pytest
+
+from src.audio_features import AudioFeatures
+
+
+SAMPLE_RATE = 22050
+
+
+def detuned_chord(cents: float, seconds: float = 3.0) -> np.ndarray:
+    """Аккорд C-E-G с обертонами, сдвинутый от A440 на cents"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    y = np.zeros_like(t)
+    for pitch in (60, 64, 67):
+        frequency = librosa.midi_to_hz(pitch + cents / 100)
+        for harmonic in range(1, 5):
+            y += np.sin(2 * np.pi * frequency * harmonic * t) / harmonic
+    return (0.1 * y).astype(np.float32)
+
+
+@pytest.mark.parametrize('cents', [-20, 30])
+def test_tuning_matches_estimate_tuning(cents):
+    y = detuned_chord(cents)
+    features = AudioFeatures(y, SAMPLE_RATE)
+    
+    power = np.abs(librosa.stft(y, n_fft=2048, hop_length=512)) ** 2
+    assert features.tuning() == librosa.estimate_tuning(S=power, sr=SAMPLE_RATE)
+    assert features.tuning() == pytest.approx(cents / 100, abs=0.05)
+
+
+def test_chroma_matches_chroma_stft():
+    y = detuned_chord(30)
+    features = AudioFeatures(y, SAMPLE_RATE)
+    
+    expected = librosa.feature.chroma_stft(y=y, sr=SAMPLE_RATE, n_fft=2048, hop_length=512)
+    np.testing.assert_allclose(features.chroma(), expected, rtol=1e-4, atol=1e-6)
+
+
+def test_fixed_tuning_skips_estimation():
+    y = detuned_chord(30)
+    features = AudioFeatures(y, SAMPLE_RATE, tuning=0.0)
+    
+    expected = librosa.feature.chroma_stft(y=y, sr=SAMPLE_RATE, n_fft=2048, hop_length=512, tuning=0.0)
+    np.testing.assert_allclose(features.chroma(), expected, rtol=1e-4, atol=1e-6)
+    assert 'tuning' not in features.timings
@@ -0,0 +1,62 @@
+"""Тесты мастеринга на NumPy"""
+import numpy as np
+import pretty_midi
+import pytest
+import soundfile as sf
+
+from src.mastering import LoudnessMeter, PianoMastering
+from src.midi_to_audio_simple import SimpleMidiToAudioConverter
+
+
+SAMPLE_RATE = 44100
+
+
+def test_meter_accumulates_blocks_shorter_than_step():
+    signal = np.random.default_rng(0).uniform(-0.5, 0.5, (SAMPLE_RATE, 1)).astype(np.float32)
+    
+    whole = LoudnessMeter(SAMPLE_RATE, 1)
+    whole.update(signal)
+    
+    # Блоки короче 100-мс шага и хвост в 10 сэмплов
+    pieces = LoudnessMeter(SAMPLE_RATE, 1)
+    for start in range(0, len(signal), 1000):
+        pieces.update(signal[start:start + 1000])
+    
+    assert pieces.integrated() == pytest.approx(whole.integrated(), abs=1e-6)
+    assert pieces.peak == whole.peak
+
+
+@pytest.mark.parametrize('frames', [2000, PianoMastering.BLOCK_SIZE + 10])
+def test_master_file_short_and_odd_length(tmp_path, make_config, frames):
+    t = np.arange(frames) / SAMPLE_RATE
+    input_path = tmp_path / 'input.wav'
+    output_path = tmp_path / 'output.wav'
+    sf.write(str(input_path), 0.3 * np.sin(2 * np.pi * 440 * t), SAMPLE_RATE, subtype='PCM_16')
+    
+    mastering = PianoMastering(make_config(reverb_room=None))
+    assert mastering.master_file(input_path, output_path)
+    
+    audio, sample_rate = sf.read(str(output_path))
+    assert sample_rate == SAMPLE_RATE
+    assert audio.shape == (frames, 2)
+
+
+def test_numpy_pipeline_writes_only_final_audio(tmp_path, make_config):
+    midi = pretty_midi.PrettyMIDI()
+    piano = pretty_midi.Instrument(program=0)
+    for i, pitch in enumerate([60, 64, 67, 72]):
+        piano.notes.append(pretty_midi.Note(velocity=100, pitch=pitch, start=0.25 * i, end=0.25 * i + 0.5))
+    midi.instruments.append(piano)
+    midi_path = tmp_path / 'song.mid'
+    midi.write(str(midi_path))
+    
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    converter = SimpleMidiToAudioConverter(make_config(mastering_engine='numpy', reverb_room=None,
+                                                       sample_rate=SAMPLE_RATE))
+    final_path = converter.process_midi_to_final_audio(midi_path, work_dir, target_duration=1.0)
+    
+    assert final_path == work_dir / 'piano.wav'
+    assert [path.name for path in work_dir.iterdir()] == ['piano.wav']
+    audio, sample_rate = sf.read(str(final_path))
+    assert audio.shape == (SAMPLE_RATE, 2)
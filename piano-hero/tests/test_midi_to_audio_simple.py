@@ -0,0 +1,40 @@
+"""Тесты синтеза пианино из MIDI"""
+import tracemalloc
+
+import pretty_midi
+
+from src.midi_to_audio_simple import SimpleMidiToAudioConverter
+
+
+def write_midi(path, seconds: int):
+    """Повторяющийся арпеджио-паттерн: одни и те же тоны при любой длительности"""
+    midi = pretty_midi.PrettyMIDI()
+    piano = pretty_midi.Instrument(program=0)
+    for beat in range(seconds * 2):
+        pitch = (60, 64, 67, 72)[beat % 4]
+        piano.notes.append(pretty_midi.Note(velocity=90, pitch=pitch, start=beat * 0.5, end=beat * 0.5 + 0.75))
+    midi.instruments.append(piano)
+    midi.write(str(path))
+
+
+def test_pipeline_peak_memory_does_not_grow_with_duration(tmp_path, make_config):
+    converter = SimpleMidiToAudioConverter(make_config())
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    
+    peaks = {}
+    for seconds in (20, 20, 80):
+        midi_path = tmp_path / f'song_{seconds}.mid'
+        write_midi(midi_path, seconds)
+        
+        # Первый прогон прогревает кэш тонов и импульсную характеристику реверберации
+        tracemalloc.start()
+        try:
+            assert converter.process_midi_to_final_audio(midi_path, work_dir) is not None
+            peaks[seconds] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    
+    # Микс 80 с длиннее микса 20 с на 60 * sample_rate * 4 байт, пик не должен вырасти на их долю
+    grown_bytes = 60 * converter.config.sample_rate * 4
+    assert peaks[80] - peaks[20] < grown_bytes / 10
@@ -0,0 +1,83 @@
+"""Тесты параллельного рендера в общую шину микса"""
+import numpy as np
+import pytest
+
+from src.midi_to_audio_simple import SimpleMidiToAudioConverter
+from src.parallel_render import SHARDS_PER_WORKER, partition_voices, render_voices_parallel
+
+
+SAMPLE_RATE = 1000
+# Тон длиннее ноты на шаг квантования, как у кэша тонов с крупным шагом
+TONE_PADDING = 0.05
+
+
+def padded_tone(pitch: int, duration: float, velocity: int) -> np.ndarray:
+    """Рендерер для пула (уровень модуля - picklable)"""
+    return np.full(int((duration + TONE_PADDING) * SAMPLE_RATE), pitch, dtype=np.float32)
+
+
+def padded_frames(pitch: int, duration: float) -> int:
+    return int((duration + TONE_PADDING) * SAMPLE_RATE)
+
+
+def make_voices(total_frames: int, count: int):
+    rng = np.random.default_rng(0)
+    starts = np.sort(rng.integers(0, total_frames, count))
+    return [(int(start), int(pitch), 0.2, 100, 0.5)
+            for start, pitch in zip(starts, rng.integers(1, 5, count))]
+
+
+def render_serial(voices: list, total_frames: int) -> np.ndarray:
+    serial = np.zeros(total_frames, dtype=np.float32)
+    for start_sample, pitch, duration, velocity, gain in voices:
+        tone = padded_tone(pitch, duration, velocity)[:total_frames - start_sample]
+        serial[start_sample:start_sample + len(tone)] += tone * gain
+    return serial
+
+
+def test_shards_stay_within_next_shard():
+    total_frames = 8000
+    voices = make_voices(total_frames, 400)
+    
+    shards, long_voices = partition_voices(voices, total_frames, 4, padded_frames)
+    assert not long_voices
+    for _, write_limit, shard in shards:
+        for start_sample, pitch, duration, _, _ in shard:
+            assert min(start_sample + padded_frames(pitch, duration), total_frames) <= write_limit
+
+
+def test_parallel_mix_matches_serial():
+    total_frames = 8000
+    voices = make_voices(total_frames, 400)
+    
+    mix = render_voices_parallel(voices, total_frames, padded_tone, padded_frames, 4, consume=np.copy)
+    np.testing.assert_allclose(mix, render_serial(voices, total_frames), rtol=1e-6)
+
+
+def test_long_voice_does_not_enlarge_shards():
+    total_frames = 8000
+    voices = make_voices(total_frames, 400)
+    long_voice = (100, 3, 5.0, 100, 0.5)
+    voices.insert(1, long_voice)
+    
+    shards, long_voices = partition_voices(voices, total_frames, 4, padded_frames)
+    assert len(shards) == 4 * SHARDS_PER_WORKER
+    assert long_voices == [long_voice]
+
+
+def test_parallel_mix_with_long_voice_matches_serial():
+    total_frames = 8000
+    voices = make_voices(total_frames, 400) + [(6500, 3, 5.0, 100, 0.5), (100, 2, 5.0, 100, 0.5)]
+    voices.sort(key=lambda voice: voice[0])
+    
+    mix = render_voices_parallel(voices, total_frames, padded_tone, padded_frames, 4, consume=np.copy)
+    np.testing.assert_allclose(mix, render_serial(voices, total_frames), rtol=1e-6)
+
+
+@pytest.mark.parametrize('cache_mb', [0, 16])
+def test_tone_frames_matches_rendered_tone(make_config, cache_mb):
+    converter = SimpleMidiToAudioConverter(make_config(tone_cache_mb=cache_mb, tone_cache_duration_step=0.05))
+    
+    for duration in (0.01, 0.124, 0.126, 0.5):
+        tone = converter.get_note_tone(60, duration, 8000)
+        assert converter.tone_frames(60, duration, 8000) == len(tone)
@@ -0,0 +1,36 @@
+"""Тесты выделения памяти при синтезе тонов в буферы tone_scratch"""
+import tracemalloc
+
+import numpy as np
+
+from src.midi_to_audio_simple import SimpleMidiToAudioConverter
+
+
+SAMPLE_RATE = 22050
+DURATION = 0.5
+
+
+def traced_peak(converter: SimpleMidiToAudioConverter, out: np.ndarray, notes: int) -> int:
+    """Пик выделенной памяти при рендере notes нот в один буфер"""
+    tracemalloc.start()
+    try:
+        for pitch in range(notes):
+            converter.create_tone_audio(converter.midi_note_to_frequency(40 + pitch % 40), DURATION,
+                                        SAMPLE_RATE, out=out)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_tone_allocations_do_not_grow_with_notes(make_config):
+    converter = SimpleMidiToAudioConverter(make_config(tone_cache_mb=0))
+    out = np.empty(int(DURATION * SAMPLE_RATE), dtype=np.float32)
+    
+    # Прогрев: буферы tone_scratch и таблицы затуханий выделяются один раз
+    traced_peak(converter, out, 40)
+    
+    notes = 20
+    peak = traced_peak(converter, out, notes)
+    # Ни одного буфера размером с тон на ноту: пик меньше одного тона на 4N нот
+    assert traced_peak(converter, out, 4 * notes) < peak + out.nbytes
+    assert peak < out.nbytes
@@ -0,0 +1,36 @@
+"""Тесты нарезки потока блоков на перекрывающиеся окна"""
+import numpy as np
+
+from src.utils import overlapping_windows
+
+
+CHUNK = 1000
+OVERLAP = 300
+
+
+def split_blocks(y: np.ndarray, size: int):
+    return [y[start:start + size] for start in range(0, len(y), size)]
+
+
+def test_windows_do_not_depend_on_block_size():
+    y = np.arange(5321, dtype=np.float32)
+    expected = [(window_start, own_start, own_end)
+                for _, window_start, own_start, own_end in overlapping_windows([y], CHUNK, OVERLAP)]
+    
+    for size in (1, 7, 256, 1300, 10000):
+        windows = list(overlapping_windows(split_blocks(y, size), CHUNK, OVERLAP))
+        assert [window[1:] for window in windows] == expected
+        for window, window_start, own_start, own_end in windows:
+            np.testing.assert_array_equal(window, y[window_start:min(own_end + OVERLAP, len(y))])
+
+
+def test_windows_cover_signal_and_survive_next_window():
+    y = np.arange(4500, dtype=np.float32)
+    windows = list(overlapping_windows(split_blocks(y, 64), CHUNK, OVERLAP))
+    
+    # Собственные участки идут подряд и покрывают весь сигнал
+    assert windows[0][2] == 0 and windows[-1][3] == len(y)
+    assert all(prev[3] == nxt[2] for prev, nxt in zip(windows, windows[1:]))
+    # Окна, сохраненные до конца итерации, не перезаписаны буфером
+    for window, window_start, _, _ in windows:
+        np.testing.assert_array_equal(window, y[window_start:window_start + len(window)])
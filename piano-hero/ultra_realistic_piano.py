@@ -4,10 +4,17 @@
 """
 import subprocess
 import sys
+import zlib
+from functools import partial
 from pathlib import Path
 import numpy as np
-import pretty_midi
 import soundfile as sf
+from src.config import Config
+from src.notes import load_notes
+from src.parallel_render import render_voices_parallel
+from src.reverb import apply_reverb_file
+from src.tone_scratch import ToneScratch
+from src.tone_tables import get_tone_tables
 
 def run_command(cmd, cwd=None):
     """Выполняет команду"""
@@ -18,18 +25,24 @@ def run_command(cmd, cwd=None):
         return False
     return True
 
-def create_ultra_realistic_piano_tone(frequency, duration, velocity, sample_rate=44100):
+# Рабочие буферы синтеза (свои в каждом процессе пула)
+TONE_SCRATCH = ToneScratch(block_size=1, num_partials=0)
+
+def create_ultra_realistic_piano_tone(frequency, duration, velocity, sample_rate=44100, out=None):
     """
     Создает максимально реалистичный тон пианино - точно как при нажатии настоящей клавиши
     
+    Промежуточные сигналы считаются в float32 на месте в буферах TONE_SCRATCH.
+    
     Args:
         frequency: Частота ноты в Hz
         duration: Длительность нажатия клавиши в секундах
         velocity: Сила нажатия (0-127)
         sample_rate: Частота дискретизации
+        out: Буфер float32 для результата (не короче ноты); None - создать новый
     
     Returns:
-        np.ndarray: Аудио сигнал
+        np.ndarray: Аудио сигнал (срез out, если он передан)
     """
     
     if duration <= 0:
@@ -40,22 +53,32 @@ def create_ultra_realistic_piano_tone(frequency, duration, velocity, sample_rate
     if num_samples <= 0:
         return np.array([])
     
+    scratch = TONE_SCRATCH
+    scratch.reserve(num_samples)
+    tone = np.empty(num_samples, dtype=np.float32) if out is None else out[:num_samples]
+    work = scratch.work[:num_samples]
+    
     # Временная ось
-    t = np.linspace(0, duration, num_samples, dtype=np.float32)
+    time_step = duration / (num_samples - 1) if num_samples > 1 else 0.0
+    t = np.multiply(scratch.ramp[:num_samples], np.float32(time_step), out=scratch.t[:num_samples])
     
     # Нормализуем velocity (0-1)
     vel_norm = velocity / 127.0
     
-    # 1. МОДЕЛИРОВАНИЕ УДАРА МОЛОТКА (Hammer Strike)
-    # Реалистичный удар молоточка по струне
-    hammer_impact = np.exp(-t * 150) * np.sin(2 * np.pi * frequency * t * 4) * 0.6 * vel_norm
-    hammer_click = np.exp(-t * 200) * np.sin(2 * np.pi * frequency * t * 8) * 0.3 * vel_norm
+    # Кривые затухания и шум берутся срезами из общих таблиц
+    tables = get_tone_tables(sample_rate)
     
     # 2. ОСНОВНОЙ ТОН С РЕАЛИСТИЧНЫМИ ГАРМОНИКАМИ
     # Основной тон с легким вибрато (как у настоящего пианино)
     vibrato_freq = 0.3 + vel_norm * 0.2  # Вибрато зависит от силы нажатия
     vibrato_depth = 0.0005 + vel_norm * 0.0005
-    fundamental = np.sin(2 * np.pi * frequency * t * (1 + vibrato_depth * np.sin(2 * np.pi * vibrato_freq * t)))
+    np.multiply(t, np.float32(2 * np.pi * vibrato_freq), out=tone)
+    np.sin(tone, out=tone)
+    tone *= np.float32(vibrato_depth)
+    tone += np.float32(1.0)
+    tone *= t
+    tone *= np.float32(2 * np.pi * frequency)
+    np.sin(tone, out=tone)
     
     # Реалистичные гармоники пианино (на основе анализа настоящих пианино)
     # Амплитуды зависят от силы нажатия
@@ -72,23 +95,16 @@ def create_ultra_realistic_piano_tone(frequency, duration, velocity, sample_rate
         (11, 0.03, 0.0020),  # Одиннадцатая гармоника
         (12, 0.02, 0.0022),  # Двенадцатая гармоника
     ]
-    
-    main_tone = fundamental
+    partials = []
     for harmonic_freq, base_amplitude, detune in harmonics:
         # Амплитуда зависит от силы нажатия
-        amplitude = base_amplitude * (0.5 + vel_norm * 0.5)
-        detuned_freq = frequency * harmonic_freq * (1 + detune)
-        harmonic = np.sin(2 * np.pi * detuned_freq * t) * amplitude
-        main_tone += harmonic
+        partials.append((frequency * harmonic_freq * (1 + detune), base_amplitude * (0.5 + vel_norm * 0.5)))
     
     # 3. НЕГАРМОНИЧЕСКИЕ ОБЕРТОНЫ (Inharmonicity)
     # Пианино имеет характерные расстроенные обертоны
     inharmonic_factors = [1.0001, 1.0003, 1.0005, 1.0007, 1.0009]
-    inharmonic_tone = np.zeros_like(t)
     for i, factor in enumerate(inharmonic_factors):
-        amplitude = (0.1 - i * 0.02) * vel_norm
-        inharmonic = np.sin(2 * np.pi * frequency * factor * t) * amplitude
-        inharmonic_tone += inharmonic
+        partials.append((frequency * factor, (0.1 - i * 0.02) * vel_norm))
     
     # 4. РЕЗОНАНС СТРУН И ДЕКИ
     # Дополнительные частоты от резонанса соседних струн и деки
@@ -99,23 +115,32 @@ def create_ultra_realistic_piano_tone(frequency, duration, velocity, sample_rate
         frequency * 3.5,   # Три с половиной тона
         frequency * 4.5,   # Четыре с половиной тона
     ]
-    resonance_tone = np.zeros_like(t)
     for i, res_freq in enumerate(resonance_freqs):
-        amplitude = (0.08 - i * 0.015) * vel_norm
-        resonance = np.sin(2 * np.pi * res_freq * t) * amplitude
-        resonance_tone += resonance
+        partials.append((res_freq, (0.08 - i * 0.015) * vel_norm))
     
     # 5. МОДЕЛИРОВАНИЕ ДЕКИ (Soundboard)
     # Дека пианино добавляет свои резонансы
     soundboard_freqs = [frequency * 0.25, frequency * 0.75, frequency * 1.25, frequency * 1.75]
-    soundboard_tone = np.zeros_like(t)
     for i, sbf in enumerate(soundboard_freqs):
-        amplitude = (0.06 - i * 0.01) * vel_norm
-        soundboard = np.sin(2 * np.pi * sbf * t) * amplitude
-        soundboard_tone += soundboard
+        partials.append((sbf, (0.06 - i * 0.01) * vel_norm))
     
     # 6. КОМБИНИРУЕМ ВСЕ КОМПОНЕНТЫ
-    tone = hammer_impact + hammer_click + main_tone + inharmonic_tone + resonance_tone + soundboard_tone
+    for partial_freq, amplitude in partials:
+        np.multiply(t, np.float32(2 * np.pi * partial_freq), out=work)
+        np.sin(work, out=work)
+        work *= np.float32(amplitude)
+        tone += work
+    
+    # 1. МОДЕЛИРОВАНИЕ УДАРА МОЛОТКА (Hammer Strike)
+    # Реалистичный удар молоточка по струне (считается только на участке, где он слышен)
+    for rate, multiple, level in ((150, 4, 0.6), (200, 8, 0.3)):
+        hammer_decay = tables.decay(rate)
+        hammer_samples = min(num_samples, len(hammer_decay))
+        hammer = np.multiply(t[:hammer_samples], np.float32(2 * np.pi * frequency * multiple), out=work[:hammer_samples])
+        np.sin(hammer, out=hammer)
+        hammer *= hammer_decay[:hammer_samples]
+        hammer *= np.float32(level * vel_norm)
+        tone[:hammer_samples] += hammer
     
     # 7. РЕАЛИСТИЧНАЯ ADSR ОГИБАЮЩАЯ (зависит от силы нажатия)
     if duration < 0.05:
@@ -134,15 +159,17 @@ def create_ultra_realistic_piano_tone(frequency, duration, velocity, sample_rate
         release_time = max(0.05, release_time)
     
     # Создаем огибающую
-    envelope = np.zeros_like(tone)
+    envelope = scratch.envelope[:num_samples]
+    envelope.fill(0.0)
     
     # Attack фаза (очень быстрая, как у молоточка)
-    attack_samples = int(attack_time * sample_rate)
+    attack_samples = min(int(attack_time * sample_rate), len(envelope))
     if attack_samples > 0:
         # Экспоненциальная атака с небольшим overshoot
-        attack_curve = 1 - np.exp(-t[:attack_samples] * 400)
-        overshoot = 0.15 * vel_norm * np.exp(-t[:attack_samples] * 600)
-        envelope[:attack_samples] = attack_curve + overshoot
+        attack = envelope[:attack_samples]
+        np.subtract(np.float32(1.0), tables.decay(400)[:attack_samples], out=attack)
+        overshoot = np.multiply(tables.decay(600)[:attack_samples], np.float32(0.15 * vel_norm), out=work[:attack_samples])
+        attack += overshoot
     
     # Decay фаза (быстрый спад после удара)
     decay_samples = int(decay_time * sample_rate)
@@ -150,9 +177,11 @@ def create_ultra_realistic_piano_tone(frequency, duration, velocity, sample_rate
         decay_start = attack_samples
         decay_end = decay_start + decay_samples
         if decay_end <= len(envelope):
-            decay_t = t[decay_start:decay_end] - t[decay_start]
             # Экспоненциальный спад
-            envelope[decay_start:decay_end] = sustain_level + (1.15 * vel_norm - sustain_level) * np.exp(-decay_t * 20)
+            decay_curve = tables.decay(20)[:decay_samples]
+            envelope[decay_start:decay_end] = sustain_level
+            np.multiply(decay_curve, np.float32(1.15 * vel_norm - sustain_level), out=work[:len(decay_curve)])
+            envelope[decay_start:decay_start + len(decay_curve)] += work[:len(decay_curve)]
     
     # Sustain фаза (низкий уровень, струны затухают)
     sustain_start = attack_samples + decay_samples
@@ -165,28 +194,27 @@ def create_ultra_realistic_piano_tone(frequency, duration, velocity, sample_rate
     if release_samples > 0:
         release_start = len(envelope) - release_samples
         if release_start >= 0:
-            release_t = t[release_start:] - t[release_start]
-            # Быстрое затухание при отпускании клавиши
-            envelope[release_start:] = sustain_level * np.exp(-release_t * 25)
+            # Быстрое затухание при отпускании клавиши (дальше конца кривой огибающая нулевая)
+            release_curve = tables.decay(25)[:release_samples]
+            envelope[release_start:] = 0.0
+            np.multiply(release_curve, np.float32(sustain_level),
+                        out=envelope[release_start:release_start + len(release_curve)])
     
     # Применяем огибающую
-    tone = tone * envelope
-    
-    # 8. РЕАЛИСТИЧНЫЕ ШУМЫ
-    # Шум молоточка (более выражен при сильных нажатиях)
-    hammer_noise = np.random.normal(0, 0.03 * vel_norm, len(tone))
-    noise_envelope = np.exp(-t * 120)  # Шум быстро затухает
-    tone += hammer_noise * noise_envelope
+    tone *= envelope
     
-    # Шум струн (легкая вибрация)
-    string_noise = np.random.normal(0, 0.008 * vel_norm, len(tone))
-    string_noise_envelope = np.exp(-t * 15)  # Шум струн затухает медленнее
-    tone += string_noise * string_noise_envelope
-    
-    # Шум деки (резонанс дерева)
-    soundboard_noise = np.random.normal(0, 0.005 * vel_norm, len(tone))
-    soundboard_noise_envelope = np.exp(-t * 8)  # Шум деки затухает очень медленно
-    tone += soundboard_noise * soundboard_noise_envelope
+    # 8. РЕАЛИСТИЧНЫЕ ШУМЫ (уровень зависит от силы нажатия)
+    noises = [
+        (120, 0.03),   # Шум молоточка - быстро затухает
+        (15, 0.008),   # Шум струн (легкая вибрация) - затухает медленнее
+        (8, 0.005),    # Шум деки (резонанс дерева) - затухает очень медленно
+    ]
+    for rate, level in noises:
+        noise_envelope = tables.decay(rate)
+        noise_samples = min(num_samples, len(noise_envelope))
+        noise = np.multiply(tables.noise(noise_samples), np.float32(level * vel_norm), out=work[:noise_samples])
+        noise *= noise_envelope[:noise_samples]
+        tone[:noise_samples] += noise
     
     # 9. РЕАЛИСТИЧНАЯ РЕВЕРБЕРАЦИЯ
     # Несколько задержанных копий для пространственности
@@ -194,65 +222,82 @@ def create_ultra_realistic_piano_tone(frequency, duration, velocity, sample_rate
     for i, delay in enumerate(delays):
         delay_samples = int(delay * sample_rate)
         if delay_samples < len(tone):
-            delayed = np.zeros_like(tone)
+            # Задержанная копия читается из tone до его изменения
             amplitude = (0.4 / len(delays)) * (1 - i * 0.1) * vel_norm
-            delayed[delay_samples:] = tone[:-delay_samples] * amplitude
-            tone += delayed
+            delayed = np.multiply(tone[:-delay_samples], np.float32(amplitude), out=work[delay_samples:])
+            tone[delay_samples:] += delayed
     
     # 10. ФИНАЛЬНАЯ ОБРАБОТКА
     # Легкое сжатие для реализма (зависит от силы нажатия)
     compression_factor = 1.0 + vel_norm * 0.3
-    tone = np.tanh(tone * compression_factor) * (0.7 + vel_norm * 0.2)
+    tone *= np.float32(compression_factor)
+    np.tanh(tone, out=tone)
+    tone *= np.float32(0.7 + vel_norm * 0.2)
     
     # Нормализуем
-    if np.max(np.abs(tone)) > 0:
-        tone = tone / np.max(np.abs(tone)) * (0.8 + vel_norm * 0.1)
+    peak = np.abs(tone, out=work).max()
+    if peak > 0:
+        tone *= np.float32((0.8 + vel_norm * 0.1) / peak)
     
-    return tone.astype(np.float32)
+    return tone
 
-def create_ultra_realistic_piano_audio(midi_path, output_path, sample_rate=44100):
+def render_ultra_voice(pitch, duration, velocity, sample_rate=44100, seed=None):
+    """Рендерит тон одной ноты (используется и в потоковом, и в параллельном режиме)"""
+    if seed is not None:
+        # Зерно зависит только от параметров ноты - результат не зависит от числа процессов
+        note_key = (seed, pitch, int(duration * sample_rate), velocity)
+        np.random.seed(zlib.crc32(repr(note_key).encode('utf-8')))
+    
+    frequency = 440.0 * (2 ** ((pitch - 69) / 12.0))
+    return create_ultra_realistic_piano_tone(frequency, duration, velocity, sample_rate)
+
+def create_ultra_realistic_piano_audio(midi_path, output_path, sample_rate=44100, workers=1, seed=None):
     """Создает максимально реалистичное аудио пианино из MIDI"""
     
     print("🎹 Создание максимально реалистичного звука пианино...")
     
-    # Загружаем MIDI файл
-    midi = pretty_midi.PrettyMIDI(str(midi_path))
-    
-    # Получаем длительность
-    duration = midi.get_end_time()
+    # Загружаем ноты всех инструментов (из файла-спутника, если он есть) и длительность
+    notes, midi_meta = load_notes(midi_path, include_drums=True)
+    duration = midi_meta['end_time']
     total_samples = int(duration * sample_rate)
     
-    # Создаем аудио массив
-    audio = np.zeros(total_samples, dtype=np.float32)
-    
-    # Обрабатываем каждую ноту
-    for instrument in midi.instruments:
-        for note in instrument.notes:
-            # Конвертируем MIDI ноту в частоту
-            frequency = 440.0 * (2 ** ((note.pitch - 69) / 12.0))
-            
-            # Вычисляем длительность нажатия клавиши
-            note_duration = note.end - note.start
-            
-            # Создаем максимально реалистичный тон пианино
-            tone = create_ultra_realistic_piano_tone(frequency, note_duration, note.velocity, sample_rate)
-            
-            # Вычисляем позицию в аудио массиве
-            start_sample = int(note.start * sample_rate)
-            end_sample = start_sample + len(tone)
-            
-            # Добавляем тон к аудио (звук только при нажатии клавиши)
-            if end_sample <= len(audio):
-                # Нормализуем velocity для громкости
-                volume = (note.velocity / 127.0) ** 0.7  # Нелинейная зависимость
-                audio[start_sample:end_sample] += tone * volume
-    
-    # Нормализуем финальное аудио
-    if np.max(np.abs(audio)) > 0:
-        audio = audio / np.max(np.abs(audio)) * 0.9
-    
-    # Сохраняем аудио
-    sf.write(str(output_path), audio, sample_rate)
+    # Собираем ноты, которые целиком помещаются в аудио (звук только при нажатии клавиши)
+    # Вычисляем длительность нажатия клавиши и позицию в аудио массиве
+    note_durations = notes.duration
+    start_samples = (notes.start * sample_rate).astype(np.int64)
+    fits = start_samples + (note_durations * sample_rate).astype(np.int64) <= total_samples
+    
+    # Нормализуем velocity для громкости
+    volumes = (notes.velocity / 127.0) ** 0.7  # Нелинейная зависимость
+    voices = list(zip(start_samples[fits].tolist(), notes.pitch[fits].tolist(), note_durations[fits].tolist(),
+                      notes.velocity[fits].tolist(), volumes[fits].tolist()))
+    
+    def save_audio(audio):
+        # Нормализуем финальное аудио
+        peak = np.max(np.abs(audio)) if len(audio) else 0.0
+        if peak > 0:
+            audio = audio / peak * 0.9
+        
+        # Сохраняем аудио
+        sf.write(str(output_path), audio, sample_rate)
+    
+    note_renderer = partial(render_ultra_voice, sample_rate=sample_rate, seed=seed)
+    if workers > 1 and voices:
+        print(f"⚙️ Параллельный рендер: {len(voices)} нот, {workers} процессов")
+        # Длина тона ноты - int(duration * sample_rate) сэмплов
+        voice_frames = lambda pitch, note_duration: int(note_duration * sample_rate)
+        render_voices_parallel(voices, total_samples, note_renderer, voice_frames, workers, consume=save_audio)
+    else:
+        # Создаем аудио массив
+        audio = np.zeros(total_samples, dtype=np.float32)
+        
+        # Обрабатываем каждую ноту
+        for start_sample, pitch, note_duration, velocity, volume in voices:
+            tone = note_renderer(pitch, note_duration, velocity)
+            audio[start_sample:start_sample + len(tone)] += tone * volume
+        
+        save_audio(audio)
+    
     print(f"✅ Максимально реалистичное аудио создано: {output_path}")
     
     return True
@@ -269,20 +314,29 @@ def process_ultra_realistic_piano():
     
     # Шаг 1: Создание максимально реалистичного аудио
     piano_raw_path = "work/006_Dad_Donut/piano_ultra_realistic_raw.wav"
-    if not create_ultra_realistic_piano_audio(midi_path, piano_raw_path):
+    config = Config("configs/settings.yaml")
+    if not create_ultra_realistic_piano_audio(midi_path, piano_raw_path,
+                                              workers=config.workers, seed=config.synth_seed):
         print("❌ Ошибка создания максимально реалистичного аудио")
         return False
     
     # Шаг 2: Улучшение аудио с максимально реалистичными фильтрами
     print("🎵 Улучшение аудио...")
+    piano_reverb_path = "work/006_Dad_Donut/piano_ultra_realistic_reverb.wav"
     piano_enhanced_path = "work/006_Dad_Donut/piano_enhanced.wav"
     piano_final_path = "work/006_Dad_Donut/piano.wav"
     
+    # Сверточная реверберация концертного зала (вместо каскада aecho)
+    if not apply_reverb_file(piano_raw_path, piano_reverb_path, room="hall", wet=0.35,
+                             cache_dir=config.get_path('cache_dir')):
+        print("❌ Ошибка реверберации")
+        return False
+    
     # Максимально реалистичная цепочка фильтров
     cmd = [
         "./ffmpeg", "-y",
-        "-i", piano_raw_path,
-        "-af", "loudnorm=I=-20:LRA=14:TP=-3,acompressor=threshold=0.1:ratio=1.5:attack=3:release=40:makeup=3,equalizer=f=50:width_type=h:width=30:g=5,equalizer=f=100:width_type=h:width=60:g=4,equalizer=f=200:width_type=h:width=100:g=3.5,equalizer=f=400:width_type=h:width=150:g=3,equalizer=f=800:width_type=h:width=200:g=2.5,equalizer=f=1600:width_type=h:width=300:g=2,equalizer=f=3200:width_type=h:width=400:g=1.5,equalizer=f=6400:width_type=h:width=600:g=1,equalizer=f=12800:width_type=h:width=800:g=0.5,aecho=0.9:0.9:200:0.4,aecho=0.7:0.8:400:0.3,aecho=0.5:0.6:800:0.2,aecho=0.3:0.4:1200:0.1,chorus=0.5:0.7:80:0.5:0.4:1.5,tremolo=f=4.5:d=0.06,loudnorm=I=-18:LRA=10:TP=-2",
+        "-i", piano_reverb_path,
+        "-af", "loudnorm=I=-20:LRA=14:TP=-3,acompressor=threshold=0.1:ratio=1.5:attack=3:release=40:makeup=3,equalizer=f=50:width_type=h:width=30:g=5,equalizer=f=100:width_type=h:width=60:g=4,equalizer=f=200:width_type=h:width=100:g=3.5,equalizer=f=400:width_type=h:width=150:g=3,equalizer=f=800:width_type=h:width=200:g=2.5,equalizer=f=1600:width_type=h:width=300:g=2,equalizer=f=3200:width_type=h:width=400:g=1.5,equalizer=f=6400:width_type=h:width=600:g=1,equalizer=f=12800:width_type=h:width=800:g=0.5,chorus=0.5:0.7:80:0.5:0.4:1.5,tremolo=f=4.5:d=0.06,loudnorm=I=-18:LRA=10:TP=-2",
         "-ar", "44100",
         "-ac", "2",
         "-b:a", "768k",  # Максимальный битрейт